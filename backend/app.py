@@ -1,28 +1,201 @@
+import abc
 import os
+import re
+import math
+import bisect
+import collections
 import datetime
-from flask import Flask, jsonify, request
+import hashlib
+import heapq
+import itertools
+import threading
+import time
+import weakref
+from functools import wraps
+from concurrent.futures import ThreadPoolExecutor
+import click
+from flask import Blueprint, Flask, current_app, jsonify, request, stream_with_context
+from flask.cli import with_appcontext
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import and_, delete, event, func, insert, inspect, literal, or_, select, text, tuple_, union_all, update
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session, object_session
+from sqlalchemy.exc import IntegrityError
 from flask_bcrypt import Bcrypt
 from flask_jwt_extended import (
     create_access_token, 
     JWTManager, 
-    jwt_required, 
+    verify_jwt_in_request,
+    get_jwt,
     get_jwt_identity
 )
+from metriche import Metriche
+from eventi import (
+    BusEventi, TroppiIscritti, formato_sse, RIALLINEA, SLOT_AGGIUNTI, SLOT_LIBERATO, SLOT_PRENOTATO, SLOT_RISERVATO
+)
+from limiti import LimitatoreRichieste, LimiteSuperato
+from serializzazione import (
+    Compressione, ProviderJSON, codifica_json, csv_in_streaming, decodifica_json, ics_in_streaming, in_dizionari,
+    json_in_streaming
+)
 
 basedir = os.path.abspath(os.path.dirname(__file__))
-app = Flask(__name__)
-CORS(app, resources={r"/api/*": {"origins": "*"}})
-
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'salute_facile.db')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-app.config["JWT_SECRET_KEY"] = "la-tua-chiave-segreta-molto-difficile-e-casuale"
 
-db = SQLAlchemy(app)
-bcrypt = Bcrypt(app)
-jwt = JWTManager(app)
+db = SQLAlchemy()
+bcrypt = Bcrypt()
+jwt = JWTManager()
+metriche = Metriche()
+compressione = Compressione()
+limitatore = LimitatoreRichieste()
+api = Blueprint('api', __name__)
+
+# --- Configurazione ---
+
+def _env_bool(nome, predefinito):
+    valore = os.environ.get(nome)
+    if valore is None:
+        return predefinito
+    return valore.strip().lower() in ('1', 'true', 'yes', 'on')
+
+def configurazione_da_ambiente():
+    """Configurazione dell'app letta dalle variabili d'ambiente, con valori predefiniti per lo sviluppo."""
+    return {
+        'SQLALCHEMY_DATABASE_URI': os.environ.get(
+            'DATABASE_URL', 'sqlite:///' + os.path.join(basedir, 'salute_facile.db')
+        ),
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'JWT_SECRET_KEY': os.environ.get('JWT_SECRET_KEY', "la-tua-chiave-segreta-molto-difficile-e-casuale"),
+
+        # Secondi per cui browser e reverse proxy possono riusare il catalogo medici senza rivalidarlo
+        'CATALOGO_MAX_AGE': int(os.environ.get('CATALOGO_MAX_AGE', 60)),
+        # Oltre questo numero di medici il catalogo non viene tenuto in memoria ma inviato a blocchi
+        'CATALOGO_MAX_RIGHE_IN_MEMORIA': int(os.environ.get('CATALOGO_MAX_RIGHE_IN_MEMORIA', 20000)),
+        # Ogni quanti secondi la cache del catalogo confronta la sua versione con quella nel
+        # database, per accorgersi delle modifiche fatte da altri processi (0 = a ogni richiesta)
+        'CATALOGO_CONTROLLO_VERSIONE_S': float(os.environ.get('CATALOGO_CONTROLLO_VERSIONE_S', 2)),
+
+        # Compressione gzip/brotli delle risposte testuali più grandi della soglia
+        'COMPRESSIONE_ABILITATA': _env_bool('COMPRESSIONE_ABILITATA', True),
+        'COMPRESSIONE_SOGLIA_BYTE': int(os.environ.get('COMPRESSIONE_SOGLIA_BYTE', 1024)),
+        'COMPRESSIONE_LIVELLO_GZIP': int(os.environ.get('COMPRESSIONE_LIVELLO_GZIP', 5)),
+        'COMPRESSIONE_QUALITA_BROTLI': int(os.environ.get('COMPRESSIONE_QUALITA_BROTLI', 4)),
+
+        # Strumentazione delle richieste (Server-Timing, log delle richieste lente, /api/metrics).
+        # METRICHE_ABILITATE=false la disattiva del tutto.
+        'METRICHE_ABILITATE': _env_bool('METRICHE_ABILITATE', True),
+        'METRICHE_SOGLIA_LENTE_MS': int(os.environ.get('METRICHE_SOGLIA_LENTE_MS', 500)),
+
+        # Costo di bcrypt e pool dedicato agli hash delle password (0 worker = nel thread della richiesta)
+        'BCRYPT_LOG_ROUNDS': int(os.environ.get('BCRYPT_LOG_ROUNDS', 12)),
+        'BCRYPT_WORKERS': int(os.environ.get('BCRYPT_WORKERS', max(1, (os.cpu_count() or 2) // 2))),
+        'BCRYPT_MAX_CODA': int(os.environ.get('BCRYPT_MAX_CODA', 16)),
+        'BCRYPT_RETRY_AFTER': int(os.environ.get('BCRYPT_RETRY_AFTER', 1)),
+
+        # Cache (per processo) dei profili degli utenti autenticati: numero massimo di voci
+        # e secondi di validità di ciascuna. CACHE_UTENTI_TTL_S=0 la disattiva.
+        'CACHE_UTENTI_MAX_VOCI': int(os.environ.get('CACHE_UTENTI_MAX_VOCI', 10000)),
+        'CACHE_UTENTI_TTL_S': int(os.environ.get('CACHE_UTENTI_TTL_S', 60)),
+
+        # Pragma applicati a ogni connessione SQLite. Con WAL i lettori non si bloccano
+        # durante le scritture delle prenotazioni; NORMAL è sicuro in modalità WAL.
+        'SQLITE_JOURNAL_MODE': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        'SQLITE_SYNCHRONOUS': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'SQLITE_BUSY_TIMEOUT_MS': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+        'SQLITE_CACHE_SIZE_KIB': int(os.environ.get('SQLITE_CACHE_SIZE_KIB', 65536)),
+        'SQLITE_MMAP_SIZE': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+
+        # Pool di connessioni per i database server (PostgreSQL, MySQL, ...)
+        'DB_POOL_SIZE': int(os.environ.get('DB_POOL_SIZE', 10)),
+        'DB_MAX_OVERFLOW': int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+        'DB_POOL_RECYCLE': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'DB_POOL_TIMEOUT': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        'DB_POOL_PRE_PING': _env_bool('DB_POOL_PRE_PING', True),
+
+        # Stream Server-Sent Events delle variazioni degli slot: client contemporanei per processo
+        # (oltre si risponde 503 con Retry-After), eventi in attesa per client e intervallo dei
+        # messaggi keep-alive. Gli stream vanno serviti da worker gevent, vedi wsgi.py
+        'SSE_MAX_ISCRITTI': int(os.environ.get('SSE_MAX_ISCRITTI', 1000)),
+        'SSE_MAX_CODA': int(os.environ.get('SSE_MAX_CODA', 256)),
+        'SSE_HEARTBEAT_S': int(os.environ.get('SSE_HEARTBEAT_S', 15)),
+        # Registro degli eventi condiviso tra i processi: ogni quanto un processo legge gli
+        # eventi nuovi per i suoi iscritti e per quanto vengono conservati
+        'SSE_INTERVALLO_EVENTI_S': float(os.environ.get('SSE_INTERVALLO_EVENTI_S', 0.2)),
+        'SSE_EVENTI_CONSERVATI_S': int(os.environ.get('SSE_EVENTI_CONSERVATI_S', 300)),
+
+        # Riserve temporanee degli slot: minuti per cui uno slot resta riservato a chi sta
+        # prenotando e intervallo con cui il thread in background rilascia quelle scadute
+        'RISERVA_DURATA_MINUTI': int(os.environ.get('RISERVA_DURATA_MINUTI', 5)),
+        'RISERVA_INTERVALLO_RILASCIO_S': int(os.environ.get('RISERVA_INTERVALLO_RILASCIO_S', 30)),
+
+        # Header Idempotency-Key: ore per cui una risposta resta disponibile per i ritentativi,
+        # secondi per cui un duplicato attende la prima richiesta ancora in corso e secondi dopo
+        # i quali una richiesta in corso mai completata (processo terminato) viene considerata persa
+        'IDEMPOTENZA_TTL_ORE': int(os.environ.get('IDEMPOTENZA_TTL_ORE', 24)),
+        'IDEMPOTENZA_ATTESA_S': float(os.environ.get('IDEMPOTENZA_ATTESA_S', 10)),
+        'IDEMPOTENZA_DURATA_IN_CORSO_S': int(os.environ.get('IDEMPOTENZA_DURATA_IN_CORSO_S', 60)),
+        'IDEMPOTENZA_INTERVALLO_PULIZIA_S': int(os.environ.get('IDEMPOTENZA_INTERVALLO_PULIZIA_S', 300)),
+
+        # Archiviazione del passato: gli slot iniziati da più di ARCHIVIAZIONE_MARGINE_ORE vengono
+        # eliminati (liberi) o spostati nell'archivio (prenotati), a batch di ARCHIVIAZIONE_BATCH
+        # slot per transazione con una pausa tra un batch e l'altro per non bloccare le scritture.
+        # ARCHIVIAZIONE_INTERVALLO_MINUTI > 0 la esegue periodicamente anche dentro l'app.
+        'ARCHIVIAZIONE_MARGINE_ORE': int(os.environ.get('ARCHIVIAZIONE_MARGINE_ORE', 24)),
+        'ARCHIVIAZIONE_BATCH': int(os.environ.get('ARCHIVIAZIONE_BATCH', 500)),
+        'ARCHIVIAZIONE_PAUSA_MS': int(os.environ.get('ARCHIVIAZIONE_PAUSA_MS', 10)),
+        'ARCHIVIAZIONE_INTERVALLO_MINUTI': int(os.environ.get('ARCHIVIAZIONE_INTERVALLO_MINUTI', 0)),
+
+        # Limiti di frequenza (token bucket) per IP e per utente sugli endpoint costosi, nel formato
+        # "richieste/secondi": fino a N richieste di fila, poi una ogni secondi/N. Vuoto o 0 = nessun
+        # limite. I secchi restano in memoria nel processo (al massimo LIMITI_MAX_CHIAVI); con
+        # LIMITI_DATABASE, percorso di un file SQLite, sono condivisi tra i processi worker.
+        # Dietro un reverse proxy l'IP del client va ricavato con ProxyFix di Werkzeug.
+        'LIMITI_ABILITATI': _env_bool('LIMITI_ABILITATI', True),
+        'LIMITI_MAX_CHIAVI': int(os.environ.get('LIMITI_MAX_CHIAVI', 100000)),
+        'LIMITI_DATABASE': os.environ.get('LIMITI_DATABASE', ''),
+        'LIMITE_LOGIN_IP': os.environ.get('LIMITE_LOGIN_IP', '30/60'),
+        'LIMITE_LOGIN_UTENTE': os.environ.get('LIMITE_LOGIN_UTENTE', '10/300'),
+        'LIMITE_REGISTRAZIONE_IP': os.environ.get('LIMITE_REGISTRAZIONE_IP', '10/600'),
+        'LIMITE_PRENOTAZIONE_IP': os.environ.get('LIMITE_PRENOTAZIONE_IP', '120/60'),
+        'LIMITE_PRENOTAZIONE_UTENTE': os.environ.get('LIMITE_PRENOTAZIONE_UTENTE', '20/60'),
+        # Le riserve seguono i clic su orari diversi e ogni utente ne tiene una sola alla volta:
+        # secchio proprio e più capiente, così chi sceglie con calma non esaurisce le prenotazioni
+        'LIMITE_RISERVA_IP': os.environ.get('LIMITE_RISERVA_IP', '240/60'),
+        'LIMITE_RISERVA_UTENTE': os.environ.get('LIMITE_RISERVA_UTENTE', '60/60'),
+    }
+
+def _usa_sqlite(config):
+    return make_url(config['SQLALCHEMY_DATABASE_URI']).get_backend_name() == 'sqlite'
+
+def opzioni_engine(config):
+    """Opzioni dell'engine SQLAlchemy: dimensionamento del pool solo per i database server."""
+    if _usa_sqlite(config):
+        return {}
+    return {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+
+def registra_pragma_sqlite(engine, config):
+    """Applica i pragma SQLite configurati a ogni nuova connessione dell'engine."""
+    pragma = [
+        f"PRAGMA journal_mode={config['SQLITE_JOURNAL_MODE']}",
+        f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA busy_timeout={config['SQLITE_BUSY_TIMEOUT_MS']}",
+        # Valore negativo: dimensione della cache in KiB invece che in pagine
+        f"PRAGMA cache_size=-{config['SQLITE_CACHE_SIZE_KIB']}",
+        f"PRAGMA mmap_size={config['SQLITE_MMAP_SIZE']}",
+    ]
+
+    @event.listens_for(engine, 'connect')
+    def imposta_pragma(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for istruzione in pragma:
+            cursor.execute(istruzione)
+        cursor.close()
 
 class Utente(db.Model):
     __tablename__ = 'utenti'
@@ -41,42 +214,1469 @@ class Medico(db.Model):
     __tablename__ = 'medici'
     id = db.Column(db.Integer, primary_key=True)
     nome_completo = db.Column(db.String(160), nullable=False)
-    specializzazione = db.Column(db.String(100), nullable=False)
+    specializzazione = db.Column(db.String(100), nullable=False, index=True)
     descrizione = db.Column(db.Text, nullable=True)
     foto_url = db.Column(db.String(255), nullable=True)
     linkedin_url = db.Column(db.String(255), nullable=True)
     sito_web_url = db.Column(db.String(255), nullable=True)
+    # Account (ruolo 'medico') che gestisce orari, slot e agenda di questo medico
+    utente_id = db.Column(db.Integer, db.ForeignKey('utenti.id'), nullable=True, unique=True, index=True)
     
     disponibilita = db.relationship('Disponibilita', back_populates='medico')
+    modelli_orario = db.relationship('ModelloOrario', back_populates='medico')
 
 class Disponibilita(db.Model):
     __tablename__ = 'disponibilita'
     id = db.Column(db.Integer, primary_key=True)
-    data_inizio = db.Column(db.DateTime, nullable=False)
+    # Indice per scorrere gli slot di tutti i medici in ordine cronologico
+    data_inizio = db.Column(db.DateTime, nullable=False, index=True)
     data_fine = db.Column(db.DateTime, nullable=False)
+    # Vero anche durante una riserva temporanea: lo slot sparisce dalle liste degli slot liberi
     è_prenotato = db.Column(db.Boolean, default=False, nullable=False)
+    # Riserva temporanea: utente che sta completando la prenotazione e scadenza della riserva
+    riservato_da = db.Column(db.Integer, db.ForeignKey('utenti.id'), nullable=True)
+    riservato_fino = db.Column(db.DateTime, nullable=True, index=True)
     
     medico_id = db.Column(db.Integer, db.ForeignKey('medici.id'), nullable=False)
     medico = db.relationship('Medico', back_populates='disponibilita')
     appuntamento = db.relationship('Appuntamento', back_populates='slot_disponibile', uselist=False)
 
+    __table_args__ = (
+        # Copre la ricerca degli slot liberi di un medico in ordine cronologico
+        db.Index('ix_disponibilita_medico_libero_inizio', 'medico_id', 'è_prenotato', 'data_inizio'),
+    )
+
 class Appuntamento(db.Model):
     __tablename__ = 'appuntamenti'
     id = db.Column(db.Integer, primary_key=True)
     data_prenotazione = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
     stato = db.Column(db.String(50), default='Confermato')
     
-    paziente_id = db.Column(db.Integer, db.ForeignKey('utenti.id'), nullable=False)
+    paziente_id = db.Column(db.Integer, db.ForeignKey('utenti.id'), nullable=False, index=True)
     disponibilita_id = db.Column(db.Integer, db.ForeignKey('disponibilita.id'), unique=True, nullable=False)
     
     paziente = db.relationship('Utente', back_populates='appuntamenti_paziente')
     slot_disponibile = db.relationship('Disponibilita', back_populates='appuntamento')
 
-@app.route("/")
+    # Gli appuntamenti cancellati o archiviati lasciano la tabella: con AUTOINCREMENT SQLite
+    # non riassegna il loro id a quelli nuovi (vale per i database creati da questa versione)
+    __table_args__ = {'sqlite_autoincrement': True}
+
+class ModelloOrario(db.Model):
+    """Orario ricorrente di un medico: in un giorno della settimana, dalle ora_inizio alle ora_fine, slot da durata_minuti."""
+    __tablename__ = 'modelli_orario'
+    id = db.Column(db.Integer, primary_key=True)
+    giorno_settimana = db.Column(db.Integer, nullable=False)  # 0 = lunedì ... 6 = domenica
+    ora_inizio = db.Column(db.Time, nullable=False)
+    ora_fine = db.Column(db.Time, nullable=False)
+    durata_minuti = db.Column(db.Integer, nullable=False)
+    valido_dal = db.Column(db.Date, nullable=False)
+    valido_al = db.Column(db.Date, nullable=False)
+
+    medico_id = db.Column(db.Integer, db.ForeignKey('medici.id'), nullable=False, index=True)
+    medico = db.relationship('Medico', back_populates='modelli_orario')
+
+class CalendarioGiorno(db.Model):
+    """
+    Occupazione degli slot di un medico in un giorno, mantenuta dai trigger su disponibilita.
+    posizioni ha un carattere per ogni intervallo di MINUTI_PER_POSIZIONE minuti dalla
+    mezzanotte: '.' nessuno slot, 'L' slot libero, 'O' slot prenotato o riservato.
+    """
+    __tablename__ = 'calendario_giorni'
+    medico_id = db.Column(db.Integer, primary_key=True)
+    giorno = db.Column(db.Date, primary_key=True)
+    posizioni = db.Column(db.String(288), nullable=False)
+    liberi = db.Column(db.Integer, nullable=False)
+    occupati = db.Column(db.Integer, nullable=False)
+
+    # Senza rowid le righe sono ordinate per (medico_id, giorno): un mese è una lettura contigua
+    __table_args__ = {'sqlite_with_rowid': False}
+
+class AppuntamentoArchiviato(db.Model):
+    """
+    Appuntamento passato o cancellato, spostato fuori dalle tabelle operative insieme
+    ai dati del suo slot. appuntamento_id è l'id che aveva in appuntamenti.
+    """
+    __tablename__ = 'appuntamenti_archiviati'
+    id = db.Column(db.Integer, primary_key=True)
+    appuntamento_id = db.Column(db.Integer, nullable=False)
+    data_prenotazione = db.Column(db.DateTime, nullable=False)
+    stato = db.Column(db.String(50))
+    data_inizio = db.Column(db.DateTime, nullable=False)
+    data_fine = db.Column(db.DateTime, nullable=False)
+    disponibilita_id = db.Column(db.Integer, nullable=False)  # slot originale, non più presente
+    archiviato_il = db.Column(db.DateTime, nullable=False)
+
+    paziente_id = db.Column(db.Integer, db.ForeignKey('utenti.id'), nullable=False)
+    medico_id = db.Column(db.Integer, db.ForeignKey('medici.id'), nullable=False)
+
+    __table_args__ = (
+        # Storico di un paziente in ordine cronologico (vista "past" degli appuntamenti)
+        db.Index('ix_appuntamenti_archiviati_paziente_inizio', 'paziente_id', 'data_inizio', 'appuntamento_id'),
+        # Agenda di un medico in ordine cronologico (esportazione)
+        db.Index('ix_appuntamenti_archiviati_medico_inizio', 'medico_id', 'data_inizio', 'appuntamento_id'),
+    )
+
+class VersioneDati(db.Model):
+    """Contatore condiviso tra i processi che aumenta a ogni modifica di un insieme di dati (es. 'catalogo')."""
+    __tablename__ = 'versioni_dati'
+    nome = db.Column(db.String(50), primary_key=True)
+    versione = db.Column(db.Integer, nullable=False, default=0)
+
+class EventoSlot(db.Model):
+    """
+    Registro degli eventi sugli slot, scritto nella transazione della modifica. Ogni processo
+    lo legge in ordine di id per inoltrare gli eventi ai propri iscritti (InoltroEventi).
+    """
+    __tablename__ = 'eventi_slot'
+    # AUTOINCREMENT: dopo la pulizia degli eventi vecchi gli id non ripartono da capo
+    __table_args__ = {'sqlite_autoincrement': True}
+    id = db.Column(db.Integer, primary_key=True)
+    medico_id = db.Column(db.Integer, nullable=False)
+    tipo = db.Column(db.String(20), nullable=False)
+    dati = db.Column(db.Text, nullable=False)  # JSON
+    creato_il = db.Column(db.DateTime, nullable=False, index=True)
+
+class ChiaveIdempotenza(db.Model):
+    """Prima risposta a una richiesta con header Idempotency-Key, riusata per i ritentativi."""
+    __tablename__ = 'chiavi_idempotenza'
+    id = db.Column(db.Integer, primary_key=True)
+    ambito = db.Column(db.String(80), nullable=False)  # endpoint e utente (o IP) che hanno usato la chiave
+    chiave = db.Column(db.String(255), nullable=False)
+    impronta = db.Column(db.String(64), nullable=False)  # hash del corpo della richiesta
+    codice_stato = db.Column(db.Integer, nullable=True)  # NULL finché la prima richiesta è in corso
+    tipo_contenuto = db.Column(db.String(100), nullable=True)
+    corpo = db.Column(db.LargeBinary, nullable=True)
+    # Per le richieste in corso è la scadenza dell'attesa, per quelle completate la fine del TTL
+    scade_il = db.Column(db.DateTime, nullable=False, index=True)
+
+    __table_args__ = (
+        db.UniqueConstraint('ambito', 'chiave', name='uq_chiavi_idempotenza_ambito_chiave'),
+    )
+
+# --- Indice di ricerca full-text sui medici (SQLite FTS5) ---
+
+# Tabella FTS5 a contenuto esterno: i testi restano in 'medici', l'indice viene
+# aggiornato dai trigger anche per gli insert di massa fatti con Core o SQL diretto.
+DDL_RICERCA = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS medici_fts USING fts5(
+        nome_completo, specializzazione, descrizione,
+        content='medici', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS medici_fts_ai AFTER INSERT ON medici BEGIN
+        INSERT INTO medici_fts(rowid, nome_completo, specializzazione, descrizione)
+        VALUES (new.id, new.nome_completo, new.specializzazione, new.descrizione);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS medici_fts_ad AFTER DELETE ON medici BEGIN
+        INSERT INTO medici_fts(medici_fts, rowid, nome_completo, specializzazione, descrizione)
+        VALUES ('delete', old.id, old.nome_completo, old.specializzazione, old.descrizione);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS medici_fts_au AFTER UPDATE ON medici BEGIN
+        INSERT INTO medici_fts(medici_fts, rowid, nome_completo, specializzazione, descrizione)
+        VALUES ('delete', old.id, old.nome_completo, old.specializzazione, old.descrizione);
+        INSERT INTO medici_fts(rowid, nome_completo, specializzazione, descrizione)
+        VALUES (new.id, new.nome_completo, new.specializzazione, new.descrizione);
+    END""",
+]
+
+def crea_indice_ricerca(connessione):
+    """Crea tabella FTS5 e trigger se mancano; su un database esistente indicizza i medici già presenti."""
+    if connessione.dialect.name != 'sqlite':
+        return
+    esiste = connessione.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'medici_fts'"
+    ).first()
+    for istruzione in DDL_RICERCA:
+        connessione.exec_driver_sql(istruzione)
+    if not esiste:
+        connessione.exec_driver_sql("INSERT INTO medici_fts(medici_fts) VALUES ('rebuild')")
+
+@event.listens_for(Medico.__table__, 'after_create')
+def crea_indice_ricerca_con_tabella(target, connection, **kw):
+    crea_indice_ricerca(connection)
+
+@event.listens_for(Medico.__table__, 'before_drop')
+def elimina_indice_ricerca(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        connection.exec_driver_sql("DROP TABLE IF EXISTS medici_fts")
+
+# --- Calendario di occupazione per giorno (trigger SQLite) ---
+
+MINUTI_PER_POSIZIONE = 5
+POSIZIONI_PER_GIORNO = 24 * 60 // MINUTI_PER_POSIZIONE
+GIORNO_VUOTO = '.' * POSIZIONI_PER_GIORNO
+
+def _ddl_calendario():
+    """
+    Trigger che aggiornano calendario_giorni a ogni insert, delete o cambio di stato di uno
+    slot, anche per gli insert di massa fatti con Core. Ogni slot occupa la posizione del
+    suo orario di inizio (due slot nella stessa posizione restano contati entrambi).
+    """
+    def posizione(riga):
+        return (f"((CAST(strftime('%H', {riga}.data_inizio) AS INTEGER) * 60"
+                f" + CAST(strftime('%M', {riga}.data_inizio) AS INTEGER)) / {MINUTI_PER_POSIZIONE})")
+
+    def aggiungi(riga):
+        return f"""
+        INSERT OR IGNORE INTO calendario_giorni (medico_id, giorno, posizioni, liberi, occupati)
+        VALUES ({riga}.medico_id, date({riga}.data_inizio), '{GIORNO_VUOTO}', 0, 0);
+        UPDATE calendario_giorni SET
+            posizioni = substr(posizioni, 1, {posizione(riga)})
+                || CASE WHEN {riga}."è_prenotato" THEN 'O' ELSE 'L' END
+                || substr(posizioni, {posizione(riga)} + 2),
+            liberi = liberi + ({riga}."è_prenotato" = 0),
+            occupati = occupati + ({riga}."è_prenotato" != 0)
+        WHERE medico_id = {riga}.medico_id AND giorno = date({riga}.data_inizio);"""
+
+    def togli(riga):
+        return f"""
+        UPDATE calendario_giorni SET
+            posizioni = substr(posizioni, 1, {posizione(riga)}) || '.' || substr(posizioni, {posizione(riga)} + 2),
+            liberi = liberi - ({riga}."è_prenotato" = 0),
+            occupati = occupati - ({riga}."è_prenotato" != 0)
+        WHERE medico_id = {riga}.medico_id AND giorno = date({riga}.data_inizio);
+        DELETE FROM calendario_giorni
+        WHERE medico_id = {riga}.medico_id AND giorno = date({riga}.data_inizio) AND liberi = 0 AND occupati = 0;"""
+
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS calendario_ai AFTER INSERT ON disponibilita BEGIN{aggiungi('new')}
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS calendario_ad AFTER DELETE ON disponibilita BEGIN{togli('old')}
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS calendario_au AFTER UPDATE OF "è_prenotato", data_inizio, medico_id
+        ON disponibilita
+        WHEN old."è_prenotato" IS NOT new."è_prenotato" OR old.data_inizio IS NOT new.data_inizio
+            OR old.medico_id IS NOT new.medico_id
+        BEGIN{togli('old')}{aggiungi('new')}
+        END""",
+    ]
+
+DDL_CALENDARIO = _ddl_calendario()
+
+def calcola_giorni_calendario(slot):
+    """Righe (medico_id, giorno, posizioni, liberi, occupati) calcolate da coppie di slot (medico_id, data_inizio, è_prenotato)."""
+    giorni = {}
+    for medico_id, data_inizio, prenotato in slot:
+        voce = giorni.setdefault((medico_id, data_inizio.date()), [list(GIORNO_VUOTO), 0, 0])
+        voce[0][(data_inizio.hour * 60 + data_inizio.minute) // MINUTI_PER_POSIZIONE] = 'O' if prenotato else 'L'
+        voce[2 if prenotato else 1] += 1
+    return [
+        (medico_id, giorno, ''.join(posizioni), liberi, occupati)
+        for (medico_id, giorno), (posizioni, liberi, occupati) in sorted(giorni.items())
+    ]
+
+def crea_calendario(connessione):
+    """Crea i trigger del calendario se mancano; su un database esistente calcola le righe dagli slot già presenti."""
+    if connessione.dialect.name != 'sqlite':
+        return
+    esiste = connessione.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'calendario_ai'"
+    ).first()
+    for istruzione in DDL_CALENDARIO:
+        connessione.exec_driver_sql(istruzione)
+    if not esiste:
+        connessione.execute(delete(CalendarioGiorno))
+        righe = calcola_giorni_calendario(connessione.execute(
+            select(Disponibilita.medico_id, Disponibilita.data_inizio, Disponibilita.è_prenotato)
+        ))
+        if righe:
+            connessione.execute(insert(CalendarioGiorno), [
+                dict(zip(('medico_id', 'giorno', 'posizioni', 'liberi', 'occupati'), riga)) for riga in righe
+            ])
+
+# Dopo create_all: i trigger stanno su disponibilita ma scrivono su calendario_giorni
+@event.listens_for(db.metadata, 'after_create')
+def crea_calendario_con_tabelle(target, connection, **kw):
+    crea_calendario(connection)
+
+# --- Versione del catalogo medici, condivisa tra i processi ---
+
+# Su SQLite la versione aumenta con un trigger, quindi anche per gli insert di massa
+# fatti con Core o da un altro processo (es. seed.py); altrove dagli eventi del mapper.
+DDL_VERSIONE_CATALOGO = [
+    f"""CREATE TRIGGER IF NOT EXISTS medici_versione_{nome} AFTER {operazione} ON medici BEGIN
+        UPDATE versioni_dati SET versione = versione + 1 WHERE nome = 'catalogo';
+    END"""
+    for nome, operazione in (('ai', 'INSERT'), ('ad', 'DELETE'), ('au', 'UPDATE'))
+]
+
+def crea_versione_catalogo(connessione):
+    """Crea la riga della versione del catalogo e, su SQLite, i trigger che la aggiornano."""
+    esiste = connessione.execute(select(VersioneDati.nome).where(VersioneDati.nome == 'catalogo')).first()
+    if not esiste:
+        connessione.execute(insert(VersioneDati).values(nome='catalogo', versione=0))
+    if connessione.dialect.name == 'sqlite':
+        for istruzione in DDL_VERSIONE_CATALOGO:
+            connessione.exec_driver_sql(istruzione)
+
+@event.listens_for(db.metadata, 'after_create')
+def crea_versione_catalogo_con_tabelle(target, connection, **kw):
+    crea_versione_catalogo(connection)
+
+# Pesi bm25 delle colonne: il nome conta più della specializzazione, che conta più della descrizione
+PESI_RICERCA = (10.0, 5.0, 1.0)
+
+def _termini_ricerca(testo):
+    """Parole della ricerca (al massimo 8), minuscole e senza punteggiatura."""
+    return re.findall(r'\w+', testo.lower())[:8]
+
+def cerca_medici_fts(testo, specializzazione, limite, offset):
+    """
+    Ricerca full-text con FTS5. Una sola query restituisce sia la pagina di risultati,
+    ordinata per rilevanza, sia il numero di medici trovati per ogni specializzazione
+    (le faccette ignorano il filtro sulla specializzazione, così restano tutte visibili).
+    """
+    termini = _termini_ricerca(testo)
+    if not termini:
+        return cerca_medici_per_specializzazione(specializzazione, limite, offset)
+    # Ogni parola è cercata anche come prefisso: "cardio" trova "cardiologia"
+    espressione = ' '.join(f'"{termine}"*' for termine in termini)
+    righe = db.session.execute(text(f"""
+        WITH trovati AS (
+            SELECT m.id, m.nome_completo, m.specializzazione, m.descrizione,
+                   bm25(medici_fts, {', '.join(str(p) for p in PESI_RICERCA)}) AS punteggio
+            FROM medici_fts JOIN medici m ON m.id = medici_fts.rowid
+            WHERE medici_fts MATCH :espressione
+        ),
+        pagina AS (
+            SELECT * FROM trovati
+            WHERE :specializzazione IS NULL OR specializzazione = :specializzazione
+            ORDER BY punteggio, id
+            LIMIT :limite OFFSET :offset
+        )
+        SELECT 0 AS tipo, specializzazione, COUNT(*) AS conteggio,
+               NULL AS id, NULL AS nome_completo, NULL AS descrizione, NULL AS punteggio
+        FROM trovati GROUP BY specializzazione
+        UNION ALL
+        SELECT 1, specializzazione, NULL, id, nome_completo, descrizione, punteggio FROM pagina
+    """), {
+        'espressione': espressione,
+        'specializzazione': specializzazione,
+        'limite': limite,
+        'offset': offset,
+    }).all()
+    return _risultato_ricerca(righe, specializzazione)
+
+def cerca_medici_per_specializzazione(specializzazione, limite, offset):
+    """Elenco filtrato solo per specializzazione (nessun testo da cercare), in ordine alfabetico."""
+    righe = db.session.execute(text("""
+        WITH pagina AS (
+            SELECT id, nome_completo, specializzazione, descrizione FROM medici
+            WHERE :specializzazione IS NULL OR specializzazione = :specializzazione
+            ORDER BY nome_completo, id
+            LIMIT :limite OFFSET :offset
+        )
+        SELECT 0 AS tipo, specializzazione, COUNT(*) AS conteggio,
+               NULL AS id, NULL AS nome_completo, NULL AS descrizione, NULL AS punteggio
+        FROM medici GROUP BY specializzazione
+        UNION ALL
+        SELECT 1, specializzazione, NULL, id, nome_completo, descrizione, NULL FROM pagina
+    """), {'specializzazione': specializzazione, 'limite': limite, 'offset': offset}).all()
+    return _risultato_ricerca(righe, specializzazione)
+
+def cerca_medici_like(testo, specializzazione, limite, offset):
+    """Ricerca senza indice full-text (database diversi da SQLite): LIKE su tutte le colonne, due query."""
+    condizioni = [
+        or_(
+            Medico.nome_completo.ilike(f'%{termine}%'),
+            Medico.specializzazione.ilike(f'%{termine}%'),
+            Medico.descrizione.ilike(f'%{termine}%')
+        )
+        for termine in _termini_ricerca(testo)
+    ]
+    faccette = db.session.execute(
+        select(Medico.specializzazione, func.count()).where(*condizioni).group_by(Medico.specializzazione)
+    ).all()
+    query = select(Medico.id, Medico.nome_completo, Medico.specializzazione, Medico.descrizione).where(*condizioni)
+    if specializzazione is not None:
+        query = query.where(Medico.specializzazione == specializzazione)
+    pagina = db.session.execute(query.order_by(Medico.nome_completo, Medico.id).limit(limite).offset(offset)).all()
+    righe = [(0, spec, conteggio, None, None, None, None) for spec, conteggio in faccette]
+    righe += [(1, m.specializzazione, None, m.id, m.nome_completo, m.descrizione, None) for m in pagina]
+    return _risultato_ricerca(righe, specializzazione)
+
+def _risultato_ricerca(righe, specializzazione):
+    faccette = {}
+    risultati = []
+    for tipo, spec, conteggio, id_medico, nome_completo, descrizione, _ in righe:
+        if tipo == 0:
+            faccette[spec] = conteggio
+        else:
+            risultati.append({
+                "id": id_medico,
+                "nome_completo": nome_completo,
+                "specializzazione": spec,
+                "descrizione": descrizione
+            })
+    totale = faccette.get(specializzazione, 0) if specializzazione is not None else sum(faccette.values())
+    return {"risultati": risultati, "totale": totale, "facet": faccette}
+
+# --- Cache del catalogo medici ---
+
+class CacheCatalogo:
+    """
+    Cache in memoria (per processo) dei payload JSON del catalogo medici.
+    Ogni voce è valida solo per la versione con cui è stata creata: quando un
+    Medico viene inserito, modificato o eliminato la versione aumenta e tutte
+    le voci precedenti vengono scartate. Le modifiche fatte da altri processi si
+    vedono confrontando periodicamente la versione salvata nel database.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._voci = {}
+        self.versione = 0
+        self.versione_database = None
+        self._ultimo_controllo = None
+
+    def invalida(self):
+        with self._lock:
+            self.versione += 1
+            self._voci.clear()
+
+    def controlla_versione(self, leggi_versione, intervallo):
+        """
+        Al più ogni intervallo secondi legge con leggi_versione() la versione del catalogo
+        nel database: se è cambiata dall'ultimo controllo scarta le voci in cache.
+        """
+        adesso = time.monotonic()
+        if self._ultimo_controllo is not None and adesso - self._ultimo_controllo < intervallo:
+            return
+        self._ultimo_controllo = adesso
+        versione = leggi_versione()
+        if versione != self.versione_database:
+            self.versione_database = versione
+            self.invalida()
+
+    def leggi(self, chiave):
+        """Restituisce (corpo, etag) se la voce è presente e aggiornata, altrimenti None."""
+        voce = self._voci.get(chiave)
+        if voce is None or voce[0] != self.versione:
+            return None
+        return voce[1], voce[2]
+
+    def salva(self, chiave, versione, corpo):
+        """Salva il corpo calcolato a partire dalla versione letta prima della query."""
+        etag = hashlib.sha256(corpo).hexdigest()[:32]
+        with self._lock:
+            # Se nel frattempo il catalogo è cambiato il corpo potrebbe essere vecchio
+            if versione == self.versione:
+                self._voci[chiave] = (versione, corpo, etag)
+        return corpo, etag
+
+cache_catalogo = CacheCatalogo()
+
+@event.listens_for(Medico, 'after_insert')
+@event.listens_for(Medico, 'after_update')
+@event.listens_for(Medico, 'after_delete')
+def segna_catalogo_modificato(mapper, connection, target):
+    # L'invalidazione avviene al commit: prima la modifica non è visibile agli altri lettori
+    sessione = object_session(target)
+    if sessione is not None:
+        sessione.info['catalogo_modificato'] = True
+    if connection.dialect.name != 'sqlite':
+        # Su SQLite ci pensa il trigger; qui l'aumento fa parte della stessa transazione
+        connection.execute(update(VersioneDati).where(VersioneDati.nome == 'catalogo')
+                           .values(versione=VersioneDati.versione + 1))
+
+@event.listens_for(Session, 'after_commit')
+def invalida_catalogo_dopo_commit(sessione):
+    if sessione.info.pop('catalogo_modificato', False):
+        cache_catalogo.invalida()
+
+@event.listens_for(Session, 'after_rollback')
+def annulla_modifica_catalogo(sessione):
+    sessione.info.pop('catalogo_modificato', None)
+
+def controlla_versione_catalogo():
+    """Scarta la cache del catalogo se un altro processo ha modificato i medici."""
+    cache_catalogo.controlla_versione(
+        lambda: db.session.execute(select(VersioneDati.versione).where(VersioneDati.nome == 'catalogo')).scalar(),
+        current_app.config['CATALOGO_CONTROLLO_VERSIONE_S'],
+    )
+
+def risposta_catalogo(chiave, carica):
+    """
+    Risposta JSON per una voce del catalogo, con ETag forte e Cache-Control.
+    Se la voce è in cache la richiesta legge dal database al più la versione del
+    catalogo (ogni CATALOGO_CONTROLLO_VERSIONE_S secondi); se il client ha già
+    la stessa versione (If-None-Match) risponde 304 senza corpo.
+    carica() restituisce i dati da serializzare, oppure None se la voce non esiste.
+    """
+    controlla_versione_catalogo()
+    voce = cache_catalogo.leggi(chiave)
+    if voce is None:
+        versione = cache_catalogo.versione
+        dati = carica()
+        if dati is None:
+            return None
+        with metriche.fase('json'):
+            corpo = codifica_json(dati)
+        voce = cache_catalogo.salva(chiave, versione, corpo)
+    corpo, etag = voce
+
+    # Confronto debole (RFC 9110): dopo la compressione il client rimanda l'ETag come W/"..."
+    if request.if_none_match.contains_weak(etag):
+        risposta = current_app.response_class(status=304)
+    else:
+        risposta = current_app.response_class(corpo, mimetype='application/json')
+    risposta.set_etag(etag)
+    risposta.headers['Cache-Control'] = f"public, max-age={current_app.config['CATALOGO_MAX_AGE']}"
+    return risposta
+
+# --- Eventi sugli slot (Server-Sent Events) ---
+
+bus_eventi = BusEventi()
+
+def registra_evento_slot(medico_id, tipo, dati):
+    """
+    Accoda un evento sugli slot di un medico: viene scritto in eventi_slot subito prima del
+    commit della transazione, quindi solo se la modifica va a buon fine.
+    """
+    db.session.info.setdefault('eventi_slot', []).append({
+        "medico_id": medico_id, "tipo": tipo, "dati": codifica_json(dati).decode(),
+        "creato_il": datetime.datetime.now()
+    })
+
+def dati_slot_liberato(medico_id, slot_id, data_inizio, data_fine):
+    """
+    Dati dell'evento SLOT_LIBERATO: lo slot completo, così il client lo reinserisce nella lista
+    senza ricaricarla.
+    """
+    return {"medico_id": medico_id, "slot_id": slot_id, "data_inizio": data_inizio, "data_fine": data_fine}
+
+@event.listens_for(Session, 'before_commit')
+def scrivi_eventi_slot(sessione):
+    # Un solo INSERT per tutti gli eventi della transazione
+    righe = sessione.info.pop('eventi_slot', None)
+    if righe:
+        sessione.execute(insert(EventoSlot), righe)
+
+@event.listens_for(Session, 'after_rollback')
+def scarta_eventi_slot(sessione):
+    sessione.info.pop('eventi_slot', None)
+
+def risposta_json_in_streaming(query, campi):
+    """Array JSON prodotto a blocchi dal cursore della query, senza caricare tutte le righe in memoria."""
+    risultato = db.session.execute(query.execution_options(yield_per=1000))
+    return current_app.response_class(
+        stream_with_context(json_in_streaming(risultato, campi)), mimetype='application/json'
+    )
+
+# --- Attività periodiche in background ---
+
+class AttivitaPeriodica(abc.ABC):
+    """
+    Estensione Flask che esegue esegui() in un thread daemon ogni intervallo secondi,
+    dentro un app context. Il thread non parte all'import del modulo ma alla prima
+    chiamata di avvia() in ciascun processo (anche dopo un fork); intervallo 0 la disattiva.
+    """
+
+    nome = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self.app = None
+        self.intervallo = 0
+
+    def init_app(self, app, intervallo):
+        self.app = app
+        self.intervallo = intervallo
+        app.extensions[self.nome] = self
+
+    def avvia(self):
+        if self._pid == os.getpid() or self.intervallo <= 0:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            threading.Thread(target=self._ciclo, name=self.nome, daemon=True).start()
+            self._pid = os.getpid()
+
+    @abc.abstractmethod
+    def esegui(self):
+        """Lavoro da eseguire a ogni intervallo, dentro un app context."""
+
+    def _ciclo(self):
+        while True:
+            time.sleep(self.intervallo)
+            try:
+                with self.app.app_context():
+                    self.esegui()
+            except Exception:
+                self.app.logger.exception("Attività periodica %s non riuscita", self.nome)
+
+# --- Riserve temporanee degli slot ---
+
+def slot_prenotabile(adesso):
+    """Condizione sugli slot liberi oppure con una riserva scaduta non ancora rilasciata."""
+    # Gli slot prenotati hanno riservato_fino NULL, quindi il confronto è falso
+    return or_(Disponibilita.è_prenotato.is_(False), Disponibilita.riservato_fino <= adesso)
+
+def rilascia_riserve_scadute(adesso=None):
+    """Rende di nuovo liberi gli slot con la riserva scaduta e avvisa gli iscritti. Restituisce quanti sono."""
+    adesso = adesso or datetime.datetime.now()
+    rilasciati = db.session.execute(
+        update(Disponibilita)
+        .where(Disponibilita.riservato_fino <= adesso)
+        .values(è_prenotato=False, riservato_da=None, riservato_fino=None)
+        .returning(Disponibilita.id, Disponibilita.medico_id, Disponibilita.data_inizio, Disponibilita.data_fine)
+    ).all()
+    for slot_id, medico_id, data_inizio, data_fine in rilasciati:
+        registra_evento_slot(medico_id, SLOT_LIBERATO, dati_slot_liberato(medico_id, slot_id, data_inizio, data_fine))
+    db.session.commit()
+    return len(rilasciati)
+
+class RilascioRiserve(AttivitaPeriodica):
+    """
+    Thread che rilascia periodicamente le riserve scadute, così le richieste non
+    devono fare pulizia. Parte alla prima richiesta servita dal processo: le liste
+    degli slot liberi contano su di lui anche per le riserve create da altri processi.
+    Configurazione: RISERVA_INTERVALLO_RILASCIO_S.
+    """
+
+    nome = 'rilascio_riserve'
+
+    def init_app(self, app):
+        super().init_app(app, app.config.get('RISERVA_INTERVALLO_RILASCIO_S', 30))
+        if self.intervallo > 0:
+            app.before_request(self.avvia)
+
+    def esegui(self):
+        rilascia_riserve_scadute()
+
+rilascio_riserve = RilascioRiserve()
+
+# --- Inoltro degli eventi sugli slot tra i processi ---
+
+# Eventi letti dal registro per ogni query
+EVENTI_PER_LETTURA = 1000
+
+class InoltroEventi(AttivitaPeriodica):
+    """
+    Un solo thread per processo legge da eventi_slot gli eventi scritti da qualunque processo
+    e li pubblica sul bus_eventi locale: gli iscritti ricevono le prenotazioni fatte anche
+    negli altri worker. Su SQLite le scritture sono serializzate, quindi gli id seguono
+    l'ordine dei commit. Senza iscritti non interroga il registro. Ogni SSE_EVENTI_CONSERVATI_S
+    secondi elimina gli eventi più vecchi.
+    Configurazione: SSE_INTERVALLO_EVENTI_S, SSE_EVENTI_CONSERVATI_S.
+    """
+
+    nome = 'inoltro_eventi'
+
+    def init_app(self, app):
+        super().init_app(app, app.config.get('SSE_INTERVALLO_EVENTI_S', 0.2))
+        self.conservazione = app.config.get('SSE_EVENTI_CONSERVATI_S', 300)
+        self._ultimo = None
+        self._ultima_pulizia = time.monotonic()
+        if self.intervallo > 0:
+            app.before_request(self.avvia)
+
+    def prepara(self):
+        """Fissa il punto di partenza al primo iscritto del processo: gli eventi precedenti non vengono inoltrati."""
+        with self._lock:
+            if self._ultimo is None:
+                self._ultimo = db.session.scalar(select(func.coalesce(func.max(EventoSlot.id), 0)))
+
+    def esegui(self):
+        with self._lock:
+            if self._ultimo is None or not bus_eventi.numero_iscritti:
+                self._ultimo = None
+            else:
+                while True:
+                    righe = db.session.execute(
+                        select(EventoSlot.id, EventoSlot.medico_id, EventoSlot.tipo, EventoSlot.dati)
+                        .where(EventoSlot.id > self._ultimo)
+                        .order_by(EventoSlot.id)
+                        .limit(EVENTI_PER_LETTURA)
+                    ).all()
+                    for riga in righe:
+                        bus_eventi.pubblica(riga.medico_id, riga.tipo, decodifica_json(riga.dati))
+                    if righe:
+                        self._ultimo = righe[-1].id
+                    if len(righe) < EVENTI_PER_LETTURA:
+                        break
+            if time.monotonic() - self._ultima_pulizia >= self.conservazione:
+                self._ultima_pulizia = time.monotonic()
+                soglia = datetime.datetime.now() - datetime.timedelta(seconds=self.conservazione)
+                db.session.execute(delete(EventoSlot).where(EventoSlot.creato_il < soglia))
+                db.session.commit()
+
+inoltro_eventi = InoltroEventi()
+
+# --- Archiviazione di slot e appuntamenti passati ---
+
+STATO_CANCELLATO = 'Cancellato'
+
+def archivia_appuntamenti(condizione, adesso, stato=None):
+    """
+    INSERT ... SELECT che copia nell'archivio gli appuntamenti (con i dati del loro slot)
+    che soddisfano condizione, eventualmente con un nuovo stato. Non li elimina.
+    """
+    return insert(AppuntamentoArchiviato).from_select(
+        ['appuntamento_id', 'data_prenotazione', 'stato', 'data_inizio', 'data_fine', 'disponibilita_id',
+         'archiviato_il', 'paziente_id', 'medico_id'],
+        select(Appuntamento.id, Appuntamento.data_prenotazione,
+               literal(stato) if stato is not None else Appuntamento.stato,
+               Disponibilita.data_inizio, Disponibilita.data_fine, Disponibilita.id,
+               literal(adesso), Appuntamento.paziente_id, Disponibilita.medico_id)
+        .join(Disponibilita, Appuntamento.disponibilita_id == Disponibilita.id)
+        .where(condizione)
+    )
+
+def archivia_passato(soglia=None, dimensione_batch=500, pausa=0.01):
+    """
+    Svuota le tabelle operative degli slot iniziati prima di soglia: quelli senza
+    appuntamento vengono eliminati, quelli prenotati passano con il loro appuntamento
+    in appuntamenti_archiviati. Ogni batch è una transazione breve (il lock di scrittura
+    di SQLite dura quanto un batch) seguita da una pausa per lasciare spazio alle
+    prenotazioni. Restituisce le statistiche dell'esecuzione.
+    """
+    soglia = soglia or datetime.datetime.now()
+    statistiche = {"slot_eliminati": 0, "appuntamenti_archiviati": 0, "batch": 0, "batch_max_ms": 0.0}
+    inizio = time.perf_counter()
+    # Stesso sottoinsieme di slot nelle tre istruzioni: dalla prima in poi la transazione
+    # tiene il lock di scrittura, quindi nessuno può modificarlo nel frattempo
+    lotto = (
+        select(Disponibilita.id)
+        .where(Disponibilita.data_inizio < soglia)
+        .order_by(Disponibilita.data_inizio, Disponibilita.id)
+        .limit(dimensione_batch)
+        .scalar_subquery()
+    )
+    while True:
+        inizio_batch = time.perf_counter()
+        adesso = datetime.datetime.now()
+        try:
+            archiviati = db.session.execute(archivia_appuntamenti(Disponibilita.id.in_(lotto), adesso)).rowcount
+            db.session.execute(delete(Appuntamento).where(Appuntamento.disponibilita_id.in_(lotto)))
+            eliminati = db.session.execute(delete(Disponibilita).where(Disponibilita.id.in_(lotto))).rowcount
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        if not eliminati:
+            break
+        statistiche["slot_eliminati"] += eliminati - archiviati
+        statistiche["appuntamenti_archiviati"] += archiviati
+        statistiche["batch"] += 1
+        statistiche["batch_max_ms"] = max(statistiche["batch_max_ms"], (time.perf_counter() - inizio_batch) * 1000)
+        time.sleep(pausa)
+
+    durata = time.perf_counter() - inizio
+    righe = statistiche["slot_eliminati"] + statistiche["appuntamenti_archiviati"]
+    statistiche["durata_s"] = round(durata, 3)
+    statistiche["righe_al_secondo"] = round(righe / durata) if durata else 0
+    statistiche["batch_max_ms"] = round(statistiche["batch_max_ms"], 1)
+    return statistiche
+
+def soglia_archiviazione(config):
+    return datetime.datetime.now() - datetime.timedelta(hours=config['ARCHIVIAZIONE_MARGINE_ORE'])
+
+class ArchiviazionePeriodica(AttivitaPeriodica):
+    """
+    Esecuzione periodica di archivia_passato dentro l'app, attiva con
+    ARCHIVIAZIONE_INTERVALLO_MINUTI > 0. Parte alla prima richiesta servita dal processo;
+    con più processi ognuno esegue il job, che è idempotente.
+    """
+
+    nome = 'archiviazione'
+
+    def init_app(self, app):
+        super().init_app(app, app.config.get('ARCHIVIAZIONE_INTERVALLO_MINUTI', 0) * 60)
+        if self.intervallo > 0:
+            app.before_request(self.avvia)
+
+    def esegui(self):
+        config = self.app.config
+        statistiche = archivia_passato(
+            soglia_archiviazione(config), config['ARCHIVIAZIONE_BATCH'], config['ARCHIVIAZIONE_PAUSA_MS'] / 1000
+        )
+        if statistiche["batch"]:
+            self.app.logger.info("Archiviazione: %s", statistiche)
+
+archiviazione = ArchiviazionePeriodica()
+
+# --- Hashing delle password ---
+
+class ServizioSovraccarico(Exception):
+    """Il pool di bcrypt ha raggiunto il limite di richieste in coda."""
+
+class PoolHash:
+    """
+    Esegue bcrypt in un pool di thread di dimensione fissa, separato dai worker delle richieste.
+    Oltre 'max_coda' richieste in attesa le nuove vengono rifiutate subito con
+    ServizioSovraccarico, invece di accumularsi e rallentare anche gli endpoint leggeri.
+    Con workers=0 l'hash viene calcolato direttamente nel thread della richiesta.
+    """
+
+    def __init__(self, workers, max_coda):
+        self.workers = workers
+        self._posti = threading.BoundedSemaphore(workers + max_coda) if workers else None
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # Creato al primo uso, così i processi figli dopo un fork non ereditano thread morti
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bcrypt')
+        return self._executor
+
+    def esegui(self, funzione, *args):
+        if not self.workers:
+            with metriche.fase('bcrypt'):
+                return funzione(*args)
+        if not self._posti.acquire(blocking=False):
+            raise ServizioSovraccarico()
+        try:
+            with metriche.fase('bcrypt'):
+                return self._get_executor().submit(funzione, *args).result()
+        finally:
+            self._posti.release()
+
+def genera_hash_password(password):
+    pool = current_app.extensions['pool_hash']
+    rounds = current_app.config['BCRYPT_LOG_ROUNDS']
+    return pool.esegui(bcrypt.generate_password_hash, password, rounds).decode('utf-8')
+
+def verifica_password(password_hash, password):
+    pool = current_app.extensions['pool_hash']
+    return pool.esegui(bcrypt.check_password_hash, password_hash, password)
+
+def costo_hash(password_hash):
+    """Costo (log2 dei round) codificato in un hash bcrypt, es. $2b$12$... -> 12."""
+    try:
+        return int(password_hash.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+def aggiorna_costo_hash(utente, password):
+    """
+    Dopo un login riuscito ricalcola l'hash se è stato creato con un costo diverso da quello
+    configurato. È un'ottimizzazione: se il pool è saturo o il salvataggio fallisce si riprova
+    al login successivo.
+    """
+    if costo_hash(utente.password_hash) == current_app.config['BCRYPT_LOG_ROUNDS']:
+        return
+    try:
+        nuovo_hash = genera_hash_password(password)
+        db.session.execute(
+            update(Utente)
+            .where(Utente.id == utente.id, Utente.password_hash == utente.password_hash)
+            .values(password_hash=nuovo_hash)
+        )
+        db.session.commit()
+    except ServizioSovraccarico:
+        pass
+    except Exception:
+        db.session.rollback()
+
+@api.errorhandler(ServizioSovraccarico)
+def gestisci_sovraccarico(errore):
+    risposta = jsonify({"errore": "Servizio temporaneamente sovraccarico, riprova tra poco"})
+    risposta.status_code = 503
+    risposta.headers['Retry-After'] = str(current_app.config['BCRYPT_RETRY_AFTER'])
+    return risposta
+
+@api.errorhandler(LimiteSuperato)
+def gestisci_limite_superato(errore):
+    risposta = jsonify({"errore": "Troppe richieste, riprova tra poco"})
+    risposta.status_code = 429
+    risposta.headers['Retry-After'] = str(math.ceil(errore.attesa))
+    return risposta
+
+# --- Cache dei profili utente ---
+
+# Campi del profilo copiati nei claim del token di accesso (l'id è già l'identity)
+CLAIMS_PROFILO = ('email', 'nome', 'cognome', 'ruolo')
+
+class CacheUtenti:
+    """
+    Cache LRU in memoria (per processo) dei profili degli utenti autenticati, con
+    scadenza dopo CACHE_UTENTI_TTL_S secondi e al massimo CACHE_UTENTI_MAX_VOCI voci.
+    Le voci di un Utente modificato o eliminato tramite la sessione vengono scartate
+    al commit; gli UPDATE in blocco non passano dagli eventi ORM e restano coperti
+    solo dalla scadenza (oggi toccano solo password_hash, che non è in cache).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._voci = collections.OrderedDict()
+        self._generazione = 0
+        self.max_voci = 10000
+        self.ttl = 60
+
+    def init_app(self, app):
+        self.max_voci = app.config.get('CACHE_UTENTI_MAX_VOCI', self.max_voci)
+        self.ttl = app.config.get('CACHE_UTENTI_TTL_S', self.ttl)
+        app.extensions['cache_utenti'] = self
+
+    def leggi(self, utente_id, carica):
+        """Profilo dell'utente dalla cache, oppure da carica(utente_id) se assente o scaduto."""
+        if self.ttl <= 0:
+            return carica(utente_id)
+        adesso = time.monotonic()
+        with self._lock:
+            voce = self._voci.get(utente_id)
+            if voce is not None and voce[0] > adesso:
+                self._voci.move_to_end(utente_id)
+                return voce[1]
+            generazione = self._generazione
+        profilo = carica(utente_id)
+        if profilo is not None:
+            with self._lock:
+                # Un'invalidazione arrivata durante la query potrebbe riguardare proprio questo profilo
+                if generazione == self._generazione:
+                    self._voci[utente_id] = (adesso + self.ttl, profilo)
+                    self._voci.move_to_end(utente_id)
+                    while len(self._voci) > self.max_voci:
+                        self._voci.popitem(last=False)
+        return profilo
+
+    def invalida(self, utente_ids=None):
+        """Scarta i profili indicati, oppure tutti se utente_ids è None."""
+        with self._lock:
+            self._generazione += 1
+            if utente_ids is None:
+                self._voci.clear()
+            else:
+                for utente_id in utente_ids:
+                    self._voci.pop(utente_id, None)
+
+cache_utenti = CacheUtenti()
+
+def _carica_profilo(utente_id):
+    riga = db.session.execute(
+        select(Utente.id, Utente.email, Utente.nome, Utente.cognome, Utente.ruolo).where(Utente.id == utente_id)
+    ).first()
+    return dict(riga._mapping) if riga is not None else None
+
+def profilo_utente(utente_id):
+    """Profilo (id, email, nome, cognome, ruolo) dell'utente come dizionario, None se non esiste."""
+    return cache_utenti.leggi(utente_id, _carica_profilo)
+
+def claims_profilo(utente):
+    """Claim aggiuntivi del token di accesso: il profilo viaggia nel JWT e /api/profilo non interroga il database."""
+    return {campo: getattr(utente, campo) for campo in CLAIMS_PROFILO}
+
+@event.listens_for(Utente, 'after_update')
+@event.listens_for(Utente, 'after_delete')
+def segna_utente_modificato(mapper, connection, target):
+    sessione = object_session(target)
+    if sessione is not None:
+        sessione.info.setdefault('utenti_modificati', set()).add(target.id)
+
+@event.listens_for(Session, 'after_commit')
+def invalida_utenti_dopo_commit(sessione):
+    utenti = sessione.info.pop('utenti_modificati', None)
+    if utenti:
+        cache_utenti.invalida(utenti)
+
+@event.listens_for(Session, 'after_rollback')
+def annulla_modifica_utenti(sessione):
+    sessione.info.pop('utenti_modificati', None)
+
+# --- Autorizzazione ---
+
+RUOLI_STAFF = ('medico', 'admin')
+
+def richiede_jwt():
+    """Equivalente a jwt_required() di flask_jwt_extended, con la verifica del token misurata nella fase 'jwt'."""
+    def decoratore(funzione):
+        @wraps(funzione)
+        def wrapper(*args, **kwargs):
+            with metriche.fase('jwt'):
+                verify_jwt_in_request()
+            return current_app.ensure_sync(funzione)(*args, **kwargs)
+        return wrapper
+    return decoratore
+
+def ruolo_richiesto(*ruoli):
+    """Come richiede_jwt, ma accetta solo utenti con uno dei ruoli indicati."""
+    def decoratore(funzione):
+        @wraps(funzione)
+        @richiede_jwt()
+        def wrapper(*args, **kwargs):
+            # Il ruolo viene dalla cache e non dai claim: una revoca ha effetto senza attendere la scadenza del token
+            profilo = profilo_utente(int(get_jwt_identity()))
+            if profilo is None or profilo['ruolo'] not in ruoli:
+                return jsonify({"errore": "Operazione non consentita per questo utente"}), 403
+            return funzione(*args, **kwargs)
+        return wrapper
+    return decoratore
+
+def staff_del_medico():
+    """
+    Per le route /api/medici/<medico_id>/...: accetta gli 'admin' per qualunque medico
+    e gli utenti 'medico' solo per il medico collegato al loro account (Medico.utente_id).
+    """
+    def decoratore(funzione):
+        @wraps(funzione)
+        @ruolo_richiesto(*RUOLI_STAFF)
+        def wrapper(*args, **kwargs):
+            utente_id = int(get_jwt_identity())
+            if profilo_utente(utente_id)['ruolo'] != 'admin':
+                collegato = db.session.execute(
+                    select(Medico.id).where(Medico.id == kwargs['medico_id'], Medico.utente_id == utente_id)
+                ).first()
+                if collegato is None:
+                    return jsonify({"errore": "Operazione non consentita per questo utente"}), 403
+            return funzione(*args, **kwargs)
+        return wrapper
+    return decoratore
+
+def utente_autenticato():
+    """Chiave del secchio per utente delle viste protette da richiede_jwt."""
+    return get_jwt_identity()
+
+def email_della_richiesta():
+    """Chiave del secchio per utente del login: l'account preso di mira, anche da IP diversi."""
+    email = (request.get_json(silent=True) or {}).get('email')
+    return email.strip().lower() if isinstance(email, str) else None
+
+# --- Chiavi di idempotenza ---
+
+# Tentativi di INSERT di una chiave che un'altra richiesta continua a rilasciare nel frattempo
+TENTATIVI_ACQUISIZIONE = 5
+
+class RegistroIdempotenza:
+    """
+    Estensione Flask che memorizza nel database le risposte alle richieste con header
+    Idempotency-Key, così funziona anche con più processi worker. La prima richiesta
+    registra la chiave come in corso; i duplicati attendono il suo esito e ricevono la
+    stessa risposta senza eseguire di nuovo la vista. Le righe scadono dopo
+    IDEMPOTENZA_TTL_ORE e vengono cancellate al più ogni IDEMPOTENZA_INTERVALLO_PULIZIA_S.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ultima_pulizia = 0.0
+
+    def init_app(self, app):
+        self.ttl = datetime.timedelta(hours=app.config.get('IDEMPOTENZA_TTL_ORE', 24))
+        self.attesa = app.config.get('IDEMPOTENZA_ATTESA_S', 10)
+        self.durata_in_corso = datetime.timedelta(seconds=app.config.get('IDEMPOTENZA_DURATA_IN_CORSO_S', 60))
+        self.intervallo_pulizia = app.config.get('IDEMPOTENZA_INTERVALLO_PULIZIA_S', 300)
+        app.extensions['idempotenza'] = self
+
+    def acquisisci(self, ambito, chiave, impronta):
+        """
+        Registra la chiave come in corso e restituisce None; se la chiave esiste già
+        restituisce la riga esistente (completata o ancora in corso).
+        Le operazioni usano una connessione propria, indipendente dalla sessione della vista.
+        """
+        self._pulisci_se_necessario()
+        for _ in range(TENTATIVI_ACQUISIZIONE):
+            adesso = datetime.datetime.now()
+            try:
+                with db.engine.begin() as connessione:
+                    # Una chiave scaduta (o rimasta in corso per un processo terminato) si può riusare
+                    connessione.execute(
+                        delete(ChiaveIdempotenza)
+                        .where(ChiaveIdempotenza.ambito == ambito, ChiaveIdempotenza.chiave == chiave,
+                               ChiaveIdempotenza.scade_il <= adesso)
+                    )
+                    connessione.execute(insert(ChiaveIdempotenza).values(
+                        ambito=ambito, chiave=chiave, impronta=impronta, scade_il=adesso + self.durata_in_corso
+                    ))
+                return None
+            except IntegrityError:
+                pass
+            with db.engine.connect() as connessione:
+                esistente = connessione.execute(
+                    select(ChiaveIdempotenza.impronta, ChiaveIdempotenza.codice_stato,
+                           ChiaveIdempotenza.tipo_contenuto, ChiaveIdempotenza.corpo)
+                    .where(ChiaveIdempotenza.ambito == ambito, ChiaveIdempotenza.chiave == chiave)
+                ).first()
+            # Riga assente: chi la possedeva l'ha rilasciata dopo il nostro INSERT, si riprova a inserirla
+            if esistente is not None:
+                return esistente
+        # La chiave continua a comparire e sparire: il chiamante la tratta come in corso e riprova più tardi
+        return ChiaveIdempotenza(impronta=impronta, codice_stato=None)
+
+    def completa(self, ambito, chiave, risposta):
+        with db.engine.begin() as connessione:
+            connessione.execute(
+                update(ChiaveIdempotenza)
+                .where(ChiaveIdempotenza.ambito == ambito, ChiaveIdempotenza.chiave == chiave)
+                .values(codice_stato=risposta.status_code, tipo_contenuto=risposta.mimetype,
+                        corpo=risposta.get_data(), scade_il=datetime.datetime.now() + self.ttl)
+            )
+
+    def rilascia(self, ambito, chiave):
+        """Dimentica una chiave in corso la cui richiesta è fallita: il client potrà ritentare."""
+        with db.engine.begin() as connessione:
+            connessione.execute(
+                delete(ChiaveIdempotenza)
+                .where(ChiaveIdempotenza.ambito == ambito, ChiaveIdempotenza.chiave == chiave,
+                       ChiaveIdempotenza.codice_stato.is_(None))
+            )
+
+    def pulisci(self):
+        """Cancella le chiavi scadute. Restituisce quante sono."""
+        with db.engine.begin() as connessione:
+            return connessione.execute(
+                delete(ChiaveIdempotenza).where(ChiaveIdempotenza.scade_il <= datetime.datetime.now())
+            ).rowcount
+
+    def _pulisci_se_necessario(self):
+        adesso = time.monotonic()
+        with self._lock:
+            if adesso - self._ultima_pulizia < self.intervallo_pulizia:
+                return
+            self._ultima_pulizia = adesso
+        self.pulisci()
+
+registro_idempotenza = RegistroIdempotenza()
+
+LUNGHEZZA_MASSIMA_CHIAVE = 255
+
+def idempotente(per_utente=True):
+    """
+    Rende una vista POST idempotente rispetto all'header Idempotency-Key (facoltativo).
+    La chiave vale per endpoint e, con per_utente, per utente autenticato (la vista deve
+    essere protetta da richiede_jwt); senza, per indirizzo del client, così client anonimi
+    diversi non condividono le chiavi. Riusarla con un corpo diverso dà 422.
+    Le risposte 5xx e le eccezioni non vengono memorizzate, così il client può ritentare.
+    """
+    def decoratore(funzione):
+        @wraps(funzione)
+        def wrapper(*args, **kwargs):
+            chiave = request.headers.get('Idempotency-Key')
+            if chiave is None:
+                return funzione(*args, **kwargs)
+            if not chiave or len(chiave) > LUNGHEZZA_MASSIMA_CHIAVE:
+                return jsonify({"errore": f"Idempotency-Key deve avere da 1 a {LUNGHEZZA_MASSIMA_CHIAVE} caratteri"}), 400
+
+            cliente = get_jwt_identity() if per_utente else f"ip:{request.remote_addr or ''}"
+            ambito = f"{request.endpoint}:{cliente}"
+            impronta = hashlib.sha256(request.get_data()).hexdigest()
+            limite = time.monotonic() + registro_idempotenza.attesa
+            pausa = 0.05
+            while True:
+                esistente = registro_idempotenza.acquisisci(ambito, chiave, impronta)
+                if esistente is None:
+                    break
+                if esistente.impronta != impronta:
+                    return jsonify({"errore": "Idempotency-Key già usata per una richiesta diversa"}), 422
+                if esistente.codice_stato is not None:
+                    risposta = current_app.response_class(
+                        esistente.corpo, status=esistente.codice_stato, mimetype=esistente.tipo_contenuto
+                    )
+                    risposta.headers['Idempotent-Replayed'] = 'true'
+                    return risposta
+                if time.monotonic() >= limite:
+                    risposta = jsonify({"errore": "Una richiesta con la stessa Idempotency-Key è ancora in corso"})
+                    risposta.status_code = 409
+                    risposta.headers['Retry-After'] = '1'
+                    return risposta
+                time.sleep(pausa)
+                pausa = min(pausa * 2, 0.5)
+
+            try:
+                risposta = current_app.make_response(funzione(*args, **kwargs))
+            except BaseException:
+                registro_idempotenza.rilascia(ambito, chiave)
+                raise
+            if risposta.status_code >= 500:
+                registro_idempotenza.rilascia(ambito, chiave)
+            else:
+                registro_idempotenza.completa(ambito, chiave, risposta)
+            return risposta
+        return wrapper
+    return decoratore
+
+# --- Generazione degli slot dai modelli orario ---
+
+def _slot_del_modello(modello, dal, al):
+    """Genera le coppie (data_inizio, data_fine) di un modello orario tra le date dal e al incluse."""
+    primo = max(modello.valido_dal, dal)
+    ultimo = min(modello.valido_al, al)
+    durata = datetime.timedelta(minutes=modello.durata_minuti)
+    # Avanza fino al primo giorno della settimana previsto dal modello
+    giorno = primo + datetime.timedelta(days=(modello.giorno_settimana - primo.weekday()) % 7)
+    settimana = datetime.timedelta(days=7)
+    while giorno <= ultimo:
+        inizio = datetime.datetime.combine(giorno, modello.ora_inizio)
+        limite = datetime.datetime.combine(giorno, modello.ora_fine)
+        while inizio + durata <= limite:
+            yield inizio, inizio + durata
+            inizio += durata
+        giorno += settimana
+
+def _filtra_sovrapposti(candidati, esistenti):
+    """
+    Scarta i candidati che si sovrappongono a uno slot esistente o a un candidato già accettato.
+    Entrambe le liste sono ordinate per data_inizio; per ogni candidato basta una ricerca binaria
+    sugli inizi degli slot esistenti e il massimo progressivo delle loro fini.
+    """
+    inizi = [inizio for inizio, _ in esistenti]
+    fine_massima = list(itertools.accumulate((fine for _, fine in esistenti), max))
+    accettati = []
+    ultima_fine = None
+    for inizio, fine in candidati:
+        if ultima_fine is not None and inizio < ultima_fine:
+            continue
+        indice = bisect.bisect_left(inizi, fine)
+        if indice and fine_massima[indice - 1] > inizio:
+            continue
+        accettati.append((inizio, fine))
+        ultima_fine = fine
+    return accettati
+
+def _formato_data_sqlite(data):
+    # Stesso formato con cui SQLAlchemy salva i DateTime su SQLite
+    return data.isoformat(' ', 'microseconds')
+
+def leggi_intervalli_slot(medico_id, inizio, fine):
+    """Intervalli (data_inizio, data_fine) degli slot del medico che si sovrappongono a [inizio, fine), in ordine."""
+    if db.engine.dialect.name == 'sqlite':
+        # Su grandi volumi la conversione delle date di SQLAlchemy domina: si legge il testo e lo si converte qui
+        righe = db.session.connection().exec_driver_sql(
+            'SELECT data_inizio, data_fine FROM disponibilita '
+            'WHERE medico_id = ? AND data_inizio < ? AND data_fine > ? ORDER BY data_inizio',
+            (medico_id, _formato_data_sqlite(fine), _formato_data_sqlite(inizio))
+        )
+        return [(datetime.datetime.fromisoformat(a), datetime.datetime.fromisoformat(b)) for a, b in righe]
+    return db.session.execute(
+        select(Disponibilita.data_inizio, Disponibilita.data_fine)
+        .where(
+            Disponibilita.medico_id == medico_id,
+            Disponibilita.data_inizio < fine,
+            Disponibilita.data_fine > inizio
+        )
+        .order_by(Disponibilita.data_inizio)
+    ).all()
+
+def inserisci_slot_in_blocco(righe, prenotato=False):
+    """
+    Inserisce slot da tuple (medico_id, data_inizio, data_fine) con un solo executemany.
+    Non fa commit. Su SQLite passa direttamente dal driver per evitare la conversione dei tipi riga per riga.
+    """
+    if not righe:
+        return
+    if db.engine.dialect.name == 'sqlite':
+        db.session.connection().exec_driver_sql(
+            'INSERT INTO disponibilita (medico_id, data_inizio, data_fine, "è_prenotato") VALUES (?, ?, ?, ?)',
+            [
+                (medico_id, _formato_data_sqlite(inizio), _formato_data_sqlite(fine), int(prenotato))
+                for medico_id, inizio, fine in righe
+            ]
+        )
+    else:
+        db.session.execute(Disponibilita.__table__.insert(), [
+            {'medico_id': medico_id, 'data_inizio': inizio, 'data_fine': fine, 'è_prenotato': prenotato}
+            for medico_id, inizio, fine in righe
+        ])
+
+def materializza_modelli(medico_ids=None, dal=None, al=None, dimensione_batch=50000):
+    """
+    Espande i modelli orario in righe Disponibilita con insert di massa, saltando gli slot che
+    si sovrappongono a quelli già presenti. Considera solo date da oggi in poi e fa un commit
+    ogni dimensione_batch slot. Restituisce il numero di slot creati.
+    """
+    oggi = datetime.date.today()
+    dal = max(dal or oggi, oggi)
+    query = select(ModelloOrario).where(ModelloOrario.valido_al >= dal).order_by(ModelloOrario.medico_id)
+    if medico_ids is not None:
+        query = query.where(ModelloOrario.medico_id.in_(medico_ids))
+    if al is not None:
+        query = query.where(ModelloOrario.valido_dal <= al)
+    modelli = db.session.execute(query).scalars().all()
+
+    buffer = []
+    creati = 0
+    for medico_id, modelli_medico in itertools.groupby(modelli, key=lambda m: m.medico_id):
+        modelli_medico = list(modelli_medico)
+        fine_periodo = al or max(m.valido_al for m in modelli_medico)
+        candidati = sorted(
+            slot for modello in modelli_medico for slot in _slot_del_modello(modello, dal, fine_periodo)
+        )
+        if not candidati:
+            continue
+        esistenti = leggi_intervalli_slot(medico_id, candidati[0][0], candidati[-1][1])
+        nuovi = _filtra_sovrapposti(candidati, esistenti)
+        if nuovi:
+            buffer.extend((medico_id, inizio, fine) for inizio, fine in nuovi)
+            registra_evento_slot(medico_id, SLOT_AGGIUNTI, {
+                "medico_id": medico_id,
+                "numero": len(nuovi),
+                "dal": nuovi[0][0].isoformat(),
+                "al": nuovi[-1][1].isoformat()
+            })
+        if len(buffer) >= dimensione_batch:
+            inserisci_slot_in_blocco(buffer)
+            db.session.commit()
+            creati += len(buffer)
+            buffer = []
+    inserisci_slot_in_blocco(buffer)
+    db.session.commit()
+    return creati + len(buffer)
+
+# --- Primi slot liberi di una specializzazione ---
+
+# Slot liberi letti in ordine cronologico, per ogni slot richiesto, prima di passare al merge per medico
+SLOT_SCANSIONE_PER_RISULTATO = 50
+
+def _colonne_slot_con_medico(slot):
+    return (
+        slot.id, slot.data_inizio, slot.data_fine,
+        Medico.id.label('medico_id'), Medico.nome_completo, Medico.specializzazione
+    )
+
+def primi_slot_liberi(specializzazione, inizio, fine, limite):
+    """
+    I primi `limite` slot liberi tra tutti i medici di una specializzazione, in ordine cronologico.
+    Il costo non dipende dal numero di slot né, per le specializzazioni comuni, dal numero di medici:
+    1. si scorrono in ordine cronologico i primi slot liberi di tutti i medici (indice su data_inizio),
+       al massimo SLOT_SCANSIONE_PER_RISULTATO per slot richiesto, tenendo quelli della specializzazione;
+       se bastano, è finita;
+    2. altrimenti la specializzazione è rara e si fa un merge per medico lungo l'indice
+       (medico_id, è_prenotato, data_inizio): per ogni medico si legge solo il primo slot libero,
+       il limite-esimo di questi è la soglia, e si leggono gli slot fino alla soglia dei soli medici
+       che hanno il primo slot entro la soglia.
+    """
+    condizioni_slot = [Disponibilita.è_prenotato.is_(False), Disponibilita.data_inizio >= inizio]
+    if fine is not None:
+        condizioni_slot.append(Disponibilita.data_inizio < fine)
+
+    scansione = (
+        select(Disponibilita.id, Disponibilita.medico_id, Disponibilita.data_inizio, Disponibilita.data_fine)
+        .where(*condizioni_slot)
+        .order_by(Disponibilita.data_inizio, Disponibilita.id)
+        .limit(limite * SLOT_SCANSIONE_PER_RISULTATO)
+        .subquery()
+    )
+    righe = db.session.execute(
+        select(*_colonne_slot_con_medico(scansione.c))
+        .join(Medico, scansione.c.medico_id == Medico.id)
+        .where(Medico.specializzazione == specializzazione)
+        .order_by(scansione.c.data_inizio, scansione.c.id)
+        .limit(limite)
+    ).all()
+    if len(righe) == limite:
+        return righe
+
+    primo_slot = (
+        select(func.min(Disponibilita.data_inizio))
+        .where(Disponibilita.medico_id == Medico.id, *condizioni_slot)
+        .scalar_subquery()
+    )
+    primi = (
+        select(Medico.id.label('medico_id'), primo_slot.label('primo'))
+        .where(Medico.specializzazione == specializzazione)
+        .cte('primi')
+    )
+    # Se meno di `limite` medici hanno slot liberi la soglia è NULL: servono tutti i loro slot
+    soglia = (
+        select(primi.c.primo).where(primi.c.primo.is_not(None))
+        .order_by(primi.c.primo).limit(1).offset(limite - 1).scalar_subquery()
+    )
+    return db.session.execute(
+        select(*_colonne_slot_con_medico(Disponibilita))
+        .join(Medico, Disponibilita.medico_id == Medico.id)
+        .where(
+            Disponibilita.medico_id.in_(
+                select(primi.c.medico_id).where(or_(primi.c.primo <= soglia, soglia.is_(None) & primi.c.primo.is_not(None)))
+            ),
+            or_(Disponibilita.data_inizio <= soglia, soglia.is_(None)),
+            *condizioni_slot
+        )
+        .order_by(Disponibilita.data_inizio, Disponibilita.id)
+        .limit(limite)
+    ).all()
+
+# --- Funzioni di supporto per i parametri di query ---
+
+LIMITE_PREDEFINITO = 100
+LIMITE_MASSIMO = 500
+
+# Disponibilità di più medici in una richiesta: numero massimo di medici e ampiezza della finestra
+MEDICI_PER_RICHIESTA = 100
+FINESTRA_PREDEFINITA = datetime.timedelta(days=31)
+FINESTRA_MASSIMA = datetime.timedelta(days=92)
+
+def leggi_data_parametro(nome, predefinita=None):
+    """Legge un parametro di query in formato ISO 8601 come datetime naive (ora locale)."""
+    valore = request.args.get(nome)
+    if not valore:
+        return predefinita
+    try:
+        data = datetime.datetime.fromisoformat(valore)
+    except ValueError:
+        raise ValueError(f"Parametro '{nome}' non valido: usare il formato ISO 8601")
+    if data.tzinfo is not None:
+        # Le date nel database sono salvate senza fuso orario, in ora locale
+        data = data.astimezone().replace(tzinfo=None)
+    return data
+
+def leggi_limite(predefinito=LIMITE_PREDEFINITO, massimo=LIMITE_MASSIMO):
+    """Legge il parametro 'limit', limitandolo a un massimo per non servire pagine enormi."""
+    valore = request.args.get('limit')
+    if not valore:
+        return predefinito
+    try:
+        limite = int(valore)
+    except ValueError:
+        raise ValueError("Parametro 'limit' non valido: deve essere un intero")
+    if limite < 1:
+        raise ValueError("Parametro 'limit' non valido: deve essere maggiore di zero")
+    return min(limite, massimo)
+
+def leggi_offset():
+    """Legge il parametro 'offset' della paginazione per posizione (predefinito 0)."""
+    valore = request.args.get('offset')
+    if not valore:
+        return 0
+    try:
+        offset = int(valore)
+    except ValueError:
+        raise ValueError("Parametro 'offset' non valido: deve essere un intero")
+    if offset < 0:
+        raise ValueError("Parametro 'offset' non valido: non può essere negativo")
+    return offset
+
+def crea_cursore(data, id_riga):
+    """Cursore di paginazione keyset nel formato <data_inizio,id>."""
+    return f"{data.isoformat()},{id_riga}"
+
+def leggi_cursore(nome='after'):
+    """Legge un cursore <data_inizio,id> e lo restituisce come tupla (datetime, int)."""
+    valore = request.args.get(nome)
+    if not valore:
+        return None
+    try:
+        data, id_riga = valore.rsplit(',', 1)
+        return datetime.datetime.fromisoformat(data), int(id_riga)
+    except ValueError:
+        raise ValueError(f"Parametro '{nome}' non valido: usare il formato <data_inizio,id>")
+
+def leggi_lista_id(nome, massimo):
+    """Legge un elenco di id separati da virgola (es. 1,2,3), senza duplicati e nell'ordine dato."""
+    valore = request.args.get(nome)
+    if not valore:
+        raise ValueError(f"Parametro '{nome}' mancante")
+    try:
+        ids = list(dict.fromkeys(int(parte) for parte in valore.split(',') if parte.strip()))
+    except ValueError:
+        raise ValueError(f"Parametro '{nome}' non valido: usare un elenco di interi separati da virgola")
+    if not ids:
+        raise ValueError(f"Parametro '{nome}' mancante")
+    if len(ids) > massimo:
+        raise ValueError(f"Parametro '{nome}' non valido: al massimo {massimo} id per richiesta")
+    return ids
+
+@api.route("/")
 def home():
     return "Backend SaluteFacile Attivo! (JWT, Bcrypt, SQLAlchemy)"
 
-@app.route("/api/register", methods=['POST'])
+@api.route("/api/register", methods=['POST'])
+@limitatore.limita('registrazione')
+@idempotente(per_utente=False)
 def register_user():
     data = request.get_json()
     email = data.get('email')
@@ -92,8 +1692,8 @@ def register_user():
     if utente_esistente:
         return jsonify({"errore": "Email già registrata"}), 409
 
-    # Crea l'hash della password per non salvarla in chiaro
-    hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+    # Crea l'hash della password per non salvarla in chiaro (nel pool dedicato a bcrypt)
+    hashed_password = genera_hash_password(password)
 
     nuovo_utente = Utente(
         email=email,
@@ -114,7 +1714,8 @@ def register_user():
         db.session.rollback()
         return jsonify({"errore": f"Errore del database: {str(e)}"}), 500
 
-@app.route("/api/login", methods=['POST'])
+@api.route("/api/login", methods=['POST'])
+@limitatore.limita('login', utente=email_della_richiesta)
 def login_user():
     data = request.get_json()
     email = data.get('email')
@@ -125,8 +1726,9 @@ def login_user():
 
     utente = Utente.query.filter_by(email=email).first()
 
-    if utente and bcrypt.check_password_hash(utente.password_hash, password):
-        access_token = create_access_token(identity=str(utente.id)) 
+    if utente and verifica_password(utente.password_hash, password):
+        aggiorna_costo_hash(utente, password)
+        access_token = create_access_token(identity=str(utente.id), additional_claims=claims_profilo(utente))
         
         return jsonify({
             "messaggio": "Login effettuato con successo",
@@ -136,308 +1738,1203 @@ def login_user():
     else:
         return jsonify({"errore": "Credenziali non valide"}), 401
 
-@app.route("/api/profilo", methods=['GET'])
-@jwt_required()
+@api.route("/api/profilo", methods=['GET'])
+@richiede_jwt()
 def get_profilo():
-    current_user_id = get_jwt_identity()
-    
-    utente = Utente.query.get(current_user_id)
-    
-    if not utente:
+    """
+    Profilo dell'utente autenticato. I token emessi dal login contengono già i campi
+    del profilo come claim; per quelli che non li hanno si usa la cache dei profili.
+    """
+    current_user_id = int(get_jwt_identity())
+    claims = get_jwt()
+
+    if all(campo in claims for campo in CLAIMS_PROFILO):
+        profilo = {"id": current_user_id, **{campo: claims[campo] for campo in CLAIMS_PROFILO}}
+    else:
+        profilo = profilo_utente(current_user_id)
+
+    if not profilo:
         return jsonify({"errore": "Utente non trovato"}), 404
-        
-    return jsonify({
-        "id": utente.id,
-        "email": utente.email,
-        "nome": utente.nome,
-        "cognome": utente.cognome,
-        "ruolo": utente.ruolo
-    }), 200
 
-@app.route("/api/medici", methods=['GET'])
+    return jsonify(profilo), 200
+
+@api.route("/api/medici", methods=['GET'])
 def get_medici():
+    """
+    Senza parametri restituisce l'intero catalogo (in cache). Con q e/o specializzazione
+    esegue una ricerca lato server e restituisce {risultati, totale, facet}, con i risultati
+    ordinati per rilevanza e paginati con limit/offset.
+    """
+    testo = request.args.get('q', '').strip()
+    specializzazione = request.args.get('specializzazione') or None
+    if testo or specializzazione:
+        try:
+            limite = leggi_limite(predefinito=20, massimo=100)
+            offset = leggi_offset()
+        except ValueError as e:
+            return jsonify({"errore": str(e)}), 400
+        try:
+            if db.engine.dialect.name == 'sqlite':
+                risultato = cerca_medici_fts(testo, specializzazione, limite, offset)
+            else:
+                risultato = cerca_medici_like(testo, specializzazione, limite, offset)
+            return jsonify({**risultato, "limit": limite, "offset": offset})
+        except Exception as e:
+            return jsonify({"errore": str(e)}), 500
+
     try:
-        medici_dal_db = Medico.query.all()
-        lista_medici_json = []
-        for medico in medici_dal_db:
-            lista_medici_json.append({
-                "id": medico.id,
-                "nome_completo": medico.nome_completo,
-                "specializzazione": medico.specializzazione,
-                "descrizione": medico.descrizione
-            })
-        
-        return jsonify(lista_medici_json)
-    
+        campi = ('id', 'nome_completo', 'specializzazione', 'descrizione')
+        query = select(Medico.id, Medico.nome_completo, Medico.specializzazione, Medico.descrizione).order_by(Medico.id)
+
+        controlla_versione_catalogo()
+        if cache_catalogo.leggi('medici') is None:
+            massimo = current_app.config['CATALOGO_MAX_RIGHE_IN_MEMORIA']
+            # Basta sapere se esiste un medico oltre il massimo: lettura sull'indice della chiave primaria
+            oltre_il_massimo = db.session.execute(
+                select(Medico.id).order_by(Medico.id).offset(massimo).limit(1)
+            ).first()
+            if oltre_il_massimo is not None:
+                risposta = risposta_json_in_streaming(query, campi)
+                risposta.headers['Cache-Control'] = f"public, max-age={current_app.config['CATALOGO_MAX_AGE']}"
+                return risposta
+
+        return risposta_catalogo('medici', lambda: in_dizionari(db.session.execute(query), campi))
+
     except Exception as e:
         return jsonify({"errore": str(e)}), 500
 
-@app.route("/api/medici/<int:medico_id>", methods=['GET'])
+@api.route("/api/medici/<int:medico_id>", methods=['GET'])
 def get_medico_detail(medico_id):
     """Restituisce i dettagli di un singolo medico."""
     try:
-        medico = Medico.query.get(medico_id)
-        if not medico:
+        def carica_dettaglio():
+            medico = db.session.execute(
+                select(
+                    Medico.id, Medico.nome_completo, Medico.specializzazione, Medico.descrizione,
+                    Medico.foto_url, Medico.linkedin_url, Medico.sito_web_url
+                ).where(Medico.id == medico_id)
+            ).first()
+            if medico is None:
+                return None
+            return dict(medico._mapping)
+
+        risposta = risposta_catalogo(f'medico:{medico_id}', carica_dettaglio)
+        if risposta is None:
             return jsonify({"errore": "Medico non trovato"}), 404
-        
-        return jsonify({
-            "id": medico.id,
-            "nome_completo": medico.nome_completo,
-            "specializzazione": medico.specializzazione,
-            "descrizione": medico.descrizione,
-            "foto_url": medico.foto_url,
-            "linkedin_url": medico.linkedin_url,
-            "sito_web_url": medico.sito_web_url
-        })
+        return risposta
 
     except Exception as e:
         return jsonify({"errore": str(e)}), 500
 
-@app.route("/api/medici/<int:medico_id>/disponibilita", methods=['GET'])
-
+@api.route("/api/medici/<int:medico_id>/disponibilita", methods=['GET'])
 def get_disponibilita_medico(medico_id):
-
+    """
+    Restituisce gli slot liberi di un medico in ordine cronologico.
+    Parametri opzionali: from/to (ISO 8601, default da adesso in poi),
+    after=<data_inizio,id> come cursore e limit per la paginazione.
+    Il cursore della pagina successiva è nell'header X-Next-Cursor.
+    """
     try:
-        slots_disponibili = Disponibilita.query.filter_by(
-
-            medico_id=medico_id, 
+        inizio = leggi_data_parametro('from', datetime.datetime.now())
+        fine = leggi_data_parametro('to')
+        cursore = leggi_cursore('after')
+        limite = leggi_limite()
+    except ValueError as e:
+        return jsonify({"errore": str(e)}), 400
 
-            è_prenotato=False
-
-        ).all()
+    try:
+        # La query segue l'indice (medico_id, è_prenotato, data_inizio):
+        # nessuna scansione della tabella e nessun ordinamento in memoria.
+        query = (
+            select(Disponibilita.id, Disponibilita.data_inizio, Disponibilita.data_fine)
+            .where(
+                Disponibilita.medico_id == medico_id,
+                Disponibilita.è_prenotato.is_(False),
+                Disponibilita.data_inizio >= inizio
+            )
+            .order_by(Disponibilita.data_inizio, Disponibilita.id)
+            .limit(limite + 1)
+        )
+        if fine is not None:
+            query = query.where(Disponibilita.data_inizio < fine)
+        if cursore is not None:
+            query = query.where(tuple_(Disponibilita.data_inizio, Disponibilita.id) > cursore)
 
-        lista_slot_json = []
+        righe = db.session.execute(query).all()
 
-        for slot in slots_disponibili:
+        # Le date vengono convertite in ISO 8601 direttamente dall'encoder JSON
+        risposta = jsonify(in_dizionari(righe[:limite], ('id', 'data_inizio', 'data_fine')))
+        if len(righe) > limite:
+            ultimo = righe[limite - 1]
+            risposta.headers['X-Next-Cursor'] = crea_cursore(ultimo.data_inizio, ultimo.id)
+        return risposta
 
-            lista_slot_json.append({
+    except Exception as e:
+        return jsonify({"errore": f"Errore del server: {str(e)}"}), 500
 
-                "id": slot.id,
+@api.route("/api/disponibilita", methods=['GET'])
+def get_disponibilita_medici():
+    """
+    Slot liberi di più medici con una sola query, raggruppati per medico.
+    Parametri: medico_ids=1,2,3 (obbligatorio, al massimo MEDICI_PER_RICHIESTA), from/to (ISO 8601,
+    default da adesso per 31 giorni, al massimo 92) e limit (slot per medico, default 20, massimo 100).
+    Ogni medico ha i suoi slot e cursore_successivo, da passare come after a
+    /api/medici/<id>/disponibilita per leggere gli altri.
+    Con aggregazione=giorno restituisce invece, per ogni medico, il numero di slot liberi per giorno.
+    """
+    aggregazione = request.args.get('aggregazione')
+    if aggregazione not in (None, 'giorno'):
+        return jsonify({"errore": "Parametro 'aggregazione' non valido: usare giorno"}), 400
+    try:
+        medico_ids = leggi_lista_id('medico_ids', MEDICI_PER_RICHIESTA)
+        inizio = leggi_data_parametro('from', datetime.datetime.now())
+        fine = leggi_data_parametro('to', inizio + FINESTRA_PREDEFINITA)
+        limite = leggi_limite(predefinito=20, massimo=100)
+    except ValueError as e:
+        return jsonify({"errore": str(e)}), 400
+    if fine - inizio > FINESTRA_MASSIMA:
+        return jsonify({"errore": f"Intervallo troppo ampio: al massimo {FINESTRA_MASSIMA.days} giorni"}), 400
+
+    condizioni = (
+        Disponibilita.medico_id.in_(medico_ids),
+        Disponibilita.è_prenotato.is_(False),
+        Disponibilita.data_inizio >= inizio,
+        Disponibilita.data_inizio < fine
+    )
+    try:
+        if aggregazione == 'giorno':
+            # Conteggi letti dal solo indice (medico_id, è_prenotato, data_inizio)
+            giorno = func.date(Disponibilita.data_inizio)
+            righe = db.session.execute(
+                select(Disponibilita.medico_id, giorno.label('giorno'), func.count().label('liberi'))
+                .where(*condizioni)
+                .group_by(Disponibilita.medico_id, giorno)
+                .order_by(Disponibilita.medico_id, giorno)
+            ).all()
+            conteggi = {medico_id: {} for medico_id in medico_ids}
+            for riga in righe:
+                conteggi[riga.medico_id][str(riga.giorno)] = riga.liberi
+            return jsonify({str(medico_id): giorni for medico_id, giorni in conteggi.items()})
+
+        # Numera gli slot di ogni medico in ordine cronologico e tiene i primi limite + 1:
+        # l'ultimo serve solo a sapere se ce ne sono altri
+        numero = func.row_number().over(
+            partition_by=Disponibilita.medico_id,
+            order_by=(Disponibilita.data_inizio, Disponibilita.id)
+        ).label('numero')
+        numerati = (
+            select(Disponibilita.id, Disponibilita.medico_id, Disponibilita.data_inizio, Disponibilita.data_fine, numero)
+            .where(*condizioni)
+            .subquery()
+        )
+        righe = db.session.execute(
+            select(numerati.c.id, numerati.c.medico_id, numerati.c.data_inizio, numerati.c.data_fine, numerati.c.numero)
+            .where(numerati.c.numero <= limite + 1)
+            .order_by(numerati.c.medico_id, numerati.c.numero)
+        ).all()
 
-                "data_inizio": slot.data_inizio.isoformat(),
+        risultato = {medico_id: {"slot": [], "cursore_successivo": None} for medico_id in medico_ids}
+        precedente = None
+        for slot in righe:
+            gruppo = risultato[slot.medico_id]
+            if slot.numero > limite:
+                gruppo["cursore_successivo"] = crea_cursore(precedente.data_inizio, precedente.id)
+            else:
+                gruppo["slot"].append({"id": slot.id, "data_inizio": slot.data_inizio, "data_fine": slot.data_fine})
+            precedente = slot
+        return jsonify({str(medico_id): gruppo for medico_id, gruppo in risultato.items()})
 
-                "data_fine": slot.data_fine.isoformat()
+    except Exception as e:
+        return jsonify({"errore": f"Errore del server: {str(e)}"}), 500
 
-            })
+@api.route("/api/calendario", methods=['GET'])
+def get_calendario():
+    """
+    Occupazione giornaliera degli slot di uno o più medici, per le viste a calendario.
+    Parametri: medico_ids=1,2,3 (obbligatorio, al massimo MEDICI_PER_RICHIESTA), from/to
+    (date ISO 8601, default da oggi per 31 giorni, al massimo 92).
+    Per ogni medico e giorno con almeno uno slot: liberi, occupati e posizioni, una stringa
+    con un carattere ogni minuti_per_posizione minuti a partire da prima_posizione
+    ('L' libero, 'O' prenotato o riservato, '.' nessuno slot).
+    """
+    try:
+        medico_ids = leggi_lista_id('medico_ids', MEDICI_PER_RICHIESTA)
+        inizio = leggi_data_parametro('from', datetime.datetime.now()).date()
+        fine = leggi_data_parametro('to')
+        fine = fine.date() if fine is not None else inizio + FINESTRA_PREDEFINITA
+    except ValueError as e:
+        return jsonify({"errore": str(e)}), 400
+    if fine - inizio > FINESTRA_MASSIMA:
+        return jsonify({"errore": f"Intervallo troppo ampio: al massimo {FINESTRA_MASSIMA.days} giorni"}), 400
 
-        
+    try:
+        if db.engine.dialect.name == 'sqlite':
+            # Lettura sulla chiave primaria (medico_id, giorno): una riga piccola per giorno
+            righe = db.session.execute(
+                select(CalendarioGiorno.medico_id, CalendarioGiorno.giorno, CalendarioGiorno.posizioni,
+                       CalendarioGiorno.liberi, CalendarioGiorno.occupati)
+                .where(CalendarioGiorno.medico_id.in_(medico_ids),
+                       CalendarioGiorno.giorno >= inizio, CalendarioGiorno.giorno < fine)
+            ).all()
+        else:
+            righe = calcola_giorni_calendario(db.session.execute(
+                select(Disponibilita.medico_id, Disponibilita.data_inizio, Disponibilita.è_prenotato)
+                .where(Disponibilita.medico_id.in_(medico_ids),
+                       Disponibilita.data_inizio >= inizio, Disponibilita.data_inizio < fine)
+            ))
+
+        calendario = {medico_id: {} for medico_id in medico_ids}
+        for medico_id, giorno, posizioni, liberi, occupati in righe:
+            # Solo il tratto della giornata che contiene slot
+            compatte = posizioni.strip('.')
+            calendario[medico_id][giorno.isoformat()] = {
+                "liberi": liberi,
+                "occupati": occupati,
+                "prima_posizione": len(posizioni) - len(posizioni.lstrip('.')),
+                "posizioni": compatte,
+            }
+        return jsonify({
+            "minuti_per_posizione": MINUTI_PER_POSIZIONE,
+            "medici": {str(medico_id): giorni for medico_id, giorni in calendario.items()}
+        })
 
-        return jsonify(lista_slot_json)
+    except Exception as e:
+        return jsonify({"errore": f"Errore del server: {str(e)}"}), 500
 
+@api.route("/api/disponibilita/eventi", methods=['GET'])
+def stream_eventi_disponibilita():
+    """
+    Stream Server-Sent Events con le variazioni degli slot dei medici indicati (medico_ids=1,2,3):
+    prenotato e riservato {medico_id, slot_id}, liberato {medico_id, slot_id, data_inizio, data_fine}
+    e aggiunti {medico_id, numero, dal, al}. Un client che resta
+    indietro riceve riallinea e lo stream viene chiuso: deve ricaricare le disponibilità.
+    Ogni SSE_HEARTBEAT_S secondi viene inviato un commento per tenere aperta la connessione.
+    Gli eventi arrivano da eventi_slot tramite InoltroEventi, quindi anche dagli altri processi.
+    """
+    try:
+        medico_ids = leggi_lista_id('medico_ids', MEDICI_PER_RICHIESTA)
+    except ValueError as e:
+        return jsonify({"errore": str(e)}), 400
+    try:
+        iscrizione = bus_eventi.iscrivi(medico_ids)
+    except TroppiIscritti:
+        risposta = jsonify({"errore": "Troppi client in ascolto, riprovare più tardi"})
+        risposta.headers['Retry-After'] = str(current_app.config['SSE_HEARTBEAT_S'])
+        return risposta, 503
+    inoltro_eventi.prepara()
+    heartbeat = current_app.config['SSE_HEARTBEAT_S']
+
+    def genera():
+        # Il generatore non usa il database: la connessione non resta occupata durante lo stream
+        yield "retry: 3000\n\n"
+        while True:
+            eventi = iscrizione.attendi(heartbeat)
+            if iscrizione.traboccata:
+                yield formato_sse(RIALLINEA, {})
+                return
+            yield ''.join(eventi) if eventi else ": keep-alive\n\n"
+
+    risposta = current_app.response_class(genera(), mimetype='text/event-stream')
+    risposta.headers['Cache-Control'] = 'no-cache'
+    # Evita che nginx trattenga gli eventi nel suo buffer
+    risposta.headers['X-Accel-Buffering'] = 'no'
+    # Chiamato dal server alla fine dello stream, anche se il client si disconnette prima del primo evento
+    risposta.call_on_close(lambda: bus_eventi.annulla(iscrizione))
+    return risposta
+
+@api.route("/api/disponibilita/prime-libere", methods=['GET'])
+def get_prime_disponibilita():
+    """
+    Restituisce i primi slot liberi tra tutti i medici di una specializzazione, in ordine cronologico.
+    Parametri: specializzazione (obbligatorio), from/to (ISO 8601, default da adesso in poi)
+    e limit (default 10, massimo 50).
+    """
+    specializzazione = request.args.get('specializzazione')
+    if not specializzazione:
+        return jsonify({"errore": "Parametro 'specializzazione' mancante"}), 400
+    try:
+        inizio = leggi_data_parametro('from', datetime.datetime.now())
+        fine = leggi_data_parametro('to')
+        limite = leggi_limite(predefinito=10, massimo=50)
+    except ValueError as e:
+        return jsonify({"errore": str(e)}), 400
 
+    try:
+        righe = primi_slot_liberi(specializzazione, inizio, fine, limite)
+        return jsonify([
+            {
+                "id": slot.id,
+                "data_inizio": slot.data_inizio,
+                "data_fine": slot.data_fine,
+                "medico": {
+                    "id": slot.medico_id,
+                    "nome_completo": slot.nome_completo,
+                    "specializzazione": slot.specializzazione
+                }
+            }
+            for slot in righe
+        ])
 
     except Exception as e:
-
         return jsonify({"errore": f"Errore del server: {str(e)}"}), 500
 
-@app.route("/api/appuntamenti", methods=['GET'])
-
-@jwt_required()
-
+@api.route("/api/appuntamenti", methods=['GET'])
+@richiede_jwt()
 def get_miei_appuntamenti():
-
-    current_user_id = get_jwt_identity()
-
-    
-
+    """
+    Restituisce gli appuntamenti del paziente autenticato ordinati per data della visita.
+    Parametri opzionali: periodo=upcoming|past (i passati sono in ordine decrescente),
+    after=<data_inizio,id> come cursore e limit. Il cursore successivo è in X-Next-Cursor.
+    """
+    current_user_id = int(get_jwt_identity())
+
+    periodo = request.args.get('periodo')
+    if periodo not in (None, 'upcoming', 'past'):
+        return jsonify({"errore": "Parametro 'periodo' non valido: usare upcoming o past"}), 400
     try:
+        cursore = leggi_cursore('after')
+        limite = leggi_limite()
+    except ValueError as e:
+        return jsonify({"errore": str(e)}), 400
 
-        appuntamenti = Appuntamento.query.filter_by(paziente_id=current_user_id).all()
-
-        
-
-        lista_appuntamenti_json = []
-
-        for appuntamento in appuntamenti:
-
-            medico = appuntamento.slot_disponibile.medico
-
-            lista_appuntamenti_json.append({
-
-                "id": appuntamento.id,
-
-                "data_prenotazione": appuntamento.data_prenotazione.isoformat(),
-
-                "stato": appuntamento.stato,
+    try:
+        # Una sola query con join: niente caricamenti lazy di slot e medico per ogni riga
+        attivi = (
+            select(
+                Appuntamento.id,
+                Appuntamento.data_prenotazione,
+                Appuntamento.stato,
+                Disponibilita.data_inizio,
+                Disponibilita.data_fine,
+                Medico.nome_completo,
+                Medico.specializzazione
+            )
+            .join(Disponibilita, Appuntamento.disponibilita_id == Disponibilita.id)
+            .join(Medico, Disponibilita.medico_id == Medico.id)
+            .where(Appuntamento.paziente_id == current_user_id)
+        )
+        # Gli appuntamenti passati possono essere già stati spostati nell'archivio
+        archiviati = (
+            select(
+                AppuntamentoArchiviato.appuntamento_id.label('id'),
+                AppuntamentoArchiviato.data_prenotazione,
+                AppuntamentoArchiviato.stato,
+                AppuntamentoArchiviato.data_inizio,
+                AppuntamentoArchiviato.data_fine,
+                Medico.nome_completo,
+                Medico.specializzazione
+            )
+            .join(Medico, AppuntamentoArchiviato.medico_id == Medico.id)
+            .where(AppuntamentoArchiviato.paziente_id == current_user_id)
+        )
 
+        adesso = datetime.datetime.now()
+        if periodo == 'upcoming':
+            rami = [attivi.where(Disponibilita.data_inizio >= adesso)]
+        elif periodo == 'past':
+            # Lo storico comprende le visite cancellate, una volta passata la loro data
+            rami = [attivi.where(Disponibilita.data_inizio < adesso),
+                    archiviati.where(AppuntamentoArchiviato.data_inizio < adesso)]
+        else:
+            rami = [attivi, archiviati.where(AppuntamentoArchiviato.stato != STATO_CANCELLATO)]
+
+        # Ogni ramo è già ordinato e limitato sul proprio indice; l'unione ordina al più 2 * (limite + 1) righe
+        decrescente = periodo == 'past'
+        parziali = []
+        for ramo in rami:
+            colonne = ramo.selected_columns
+            chiave = tuple_(colonne.data_inizio, colonne.id)
+            if cursore is not None:
+                ramo = ramo.where(chiave < cursore if decrescente else chiave > cursore)
+            if decrescente:
+                ramo = ramo.order_by(colonne.data_inizio.desc(), colonne.id.desc())
+            else:
+                ramo = ramo.order_by(colonne.data_inizio, colonne.id)
+            parziali.append(ramo.limit(limite + 1))
+
+        if len(parziali) == 1:
+            query = parziali[0]
+        else:
+            unione = union_all(*(select(ramo.subquery()) for ramo in parziali)).subquery()
+            ordine = (unione.c.data_inizio, unione.c.id)
+            query = (
+                select(unione)
+                .order_by(*(colonna.desc() for colonna in ordine) if decrescente else ordine)
+                .limit(limite + 1)
+            )
+
+        righe = db.session.execute(query).all()
+
+        lista_appuntamenti_json = [
+            {
+                "id": riga.id,
+                "data_prenotazione": riga.data_prenotazione,
+                "stato": riga.stato,
                 "slot": {
-
-                    "data_inizio": appuntamento.slot_disponibile.data_inizio.isoformat(),
-
-                    "data_fine": appuntamento.slot_disponibile.data_fine.isoformat(),
-
+                    "data_inizio": riga.data_inizio,
+                    "data_fine": riga.data_fine,
                 },
-
                 "medico": {
-
-                    "nome_completo": medico.nome_completo,
-
-                    "specializzazione": medico.specializzazione
-
+                    "nome_completo": riga.nome_completo,
+                    "specializzazione": riga.specializzazione
                 }
+            }
+            for riga in righe[:limite]
+        ]
 
-            })
-
-        return jsonify(lista_appuntamenti_json)
-
-
+        risposta = jsonify(lista_appuntamenti_json)
+        if len(righe) > limite:
+            ultima = righe[limite - 1]
+            risposta.headers['X-Next-Cursor'] = crea_cursore(ultima.data_inizio, ultima.id)
+        return risposta
 
     except Exception as e:
-
         return jsonify({"errore": f"Errore del server: {str(e)}"}), 500
 
 
-
-
-
-@app.route("/api/appuntamenti", methods=['POST'])
-
-@jwt_required()
-
+@api.route("/api/appuntamenti", methods=['POST'])
+@richiede_jwt()
+@limitatore.limita('prenotazione', utente=utente_autenticato)
+@idempotente()
 def prenota_appuntamento():
-
-    current_user_id = get_jwt_identity()
-
+    current_user_id = int(get_jwt_identity())
     data = request.get_json()
-
     disponibilita_id = data.get('disponibilita_id')
 
     if not disponibilita_id:
-
         return jsonify({"errore": "ID della disponibilità mancante"}), 400
 
     try:
+        # Compare-and-set: lo slot viene segnato come prenotato solo se è ancora libero
+        # o se è riservato all'utente stesso (la riserva diventa la prenotazione).
+        # L'UPDATE condizionale acquisisce il lock di scrittura, quindi due richieste
+        # concorrenti sullo stesso slot non possono superare entrambe il controllo.
+        adesso = datetime.datetime.now()
+        medico_id = db.session.execute(
+            update(Disponibilita)
+            .where(
+                Disponibilita.id == disponibilita_id,
+                or_(slot_prenotabile(adesso), Disponibilita.riservato_da == current_user_id)
+            )
+            .values(è_prenotato=True, riservato_da=None, riservato_fino=None)
+            .returning(Disponibilita.medico_id)
+        ).scalar()
+
+        if medico_id is None:
+            db.session.rollback()
+            # Nessuna riga aggiornata: lo slot non esiste oppure è già prenotato o riservato
+            return errore_slot_non_disponibile(disponibilita_id, adesso)
+
+        # Sempre registrato: gli iscritti possono essere collegati a un altro processo
+        registra_evento_slot(medico_id, SLOT_PRENOTATO, {"medico_id": medico_id, "slot_id": disponibilita_id})
+
+        # Crea il nuovo appuntamento nella stessa transazione
+        inserimento = db.session.execute(
+            insert(Appuntamento).values(
+                paziente_id=current_user_id,
+                disponibilita_id=disponibilita_id
+            )
+        )
+        db.session.commit()
 
-        slot = Disponibilita.query.get(disponibilita_id)
-
-        if not slot:
-
-            return jsonify({"errore": "Slot di disponibilità non trovato"}), 404
-
-        
-
-        if slot.è_prenotato:
-
-            return jsonify({"errore": "Questo slot è già stato prenotato"}), 409
-
-
-
-        # Crea il nuovo appuntamento
-
-        nuovo_appuntamento = Appuntamento(
+        return jsonify({
+            "messaggio": "Appuntamento prenotato con successo!",
+            "appuntamento_id": inserimento.inserted_primary_key[0]
+        }), 201
 
-            paziente_id=current_user_id,
+    except IntegrityError:
+        # Esiste già un appuntamento collegato allo slot (vincolo unique su disponibilita_id)
+        db.session.rollback()
+        return jsonify({"errore": "Questo slot è già stato prenotato"}), 409
 
-            disponibilita_id=disponibilita_id
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"errore": f"Errore del database: {str(e)}"}), 500
 
-        )
+@api.route("/api/appuntamenti/<int:appuntamento_id>", methods=['DELETE'])
+@richiede_jwt()
+def cancella_appuntamento(appuntamento_id):
+    """
+    Cancella un appuntamento futuro del paziente autenticato e rende di nuovo libero il suo slot.
+    L'appuntamento resta nell'archivio con stato Cancellato.
+    """
+    current_user_id = int(get_jwt_identity())
+    adesso = datetime.datetime.now()
 
-        
+    try:
+        # Una sola transazione. Il primo statement è la DELETE condizionale: su qualunque database
+        # (anche in READ COMMITTED) una sola cancellazione concorrente trova la riga e prosegue,
+        # le altre non eliminano nulla e non archiviano né liberano lo slot.
+        cancellato = db.session.execute(
+            delete(Appuntamento)
+            .where(
+                Appuntamento.id == appuntamento_id,
+                Appuntamento.paziente_id == current_user_id,
+                select(Disponibilita.id)
+                .where(Disponibilita.id == Appuntamento.disponibilita_id, Disponibilita.data_inizio >= adesso)
+                .exists()
+            )
+            .returning(Appuntamento.data_prenotazione, Appuntamento.disponibilita_id)
+        ).first()
+
+        if cancellato is None:
+            db.session.rollback()
+            appuntamento = db.session.execute(
+                select(Appuntamento.paziente_id)
+                .where(Appuntamento.id == appuntamento_id, Appuntamento.paziente_id == current_user_id)
+            ).first()
+            if appuntamento is None:
+                return jsonify({"errore": "Appuntamento non trovato"}), 404
+            return jsonify({"errore": "Non è possibile cancellare un appuntamento già iniziato"}), 409
+
+        # Solo se lo slot è ancora prenotato: non si libera uno slot che nel frattempo è cambiato
+        slot = db.session.execute(
+            update(Disponibilita)
+            .where(Disponibilita.id == cancellato.disponibilita_id, Disponibilita.è_prenotato.is_(True))
+            .values(è_prenotato=False, riservato_da=None, riservato_fino=None)
+            .returning(Disponibilita.medico_id, Disponibilita.data_inizio, Disponibilita.data_fine)
+        ).first()
+        if slot is None:
+            slot = db.session.execute(
+                select(Disponibilita.medico_id, Disponibilita.data_inizio, Disponibilita.data_fine)
+                .where(Disponibilita.id == cancellato.disponibilita_id)
+            ).first()
+        else:
+            registra_evento_slot(slot.medico_id, SLOT_LIBERATO, dati_slot_liberato(
+                slot.medico_id, cancellato.disponibilita_id, slot.data_inizio, slot.data_fine
+            ))
+        db.session.execute(insert(AppuntamentoArchiviato).values(
+            appuntamento_id=appuntamento_id, data_prenotazione=cancellato.data_prenotazione,
+            stato=STATO_CANCELLATO, data_inizio=slot.data_inizio, data_fine=slot.data_fine,
+            disponibilita_id=cancellato.disponibilita_id, archiviato_il=adesso,
+            paziente_id=current_user_id, medico_id=slot.medico_id
+        ))
+        db.session.commit()
+        return jsonify({"messaggio": "Appuntamento cancellato", "appuntamento_id": appuntamento_id}), 200
 
-        # Segna lo slot come prenotato
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"errore": f"Errore del database: {str(e)}"}), 500
 
-        slot.è_prenotato = True
+@api.route("/api/medici/<int:medico_id>/appuntamenti/cancellazione", methods=['POST'])
+@staff_del_medico()
+def cancella_appuntamenti_medico(medico_id):
+    """
+    Cancella tutti gli appuntamenti futuri di un medico in un intervallo, ad esempio per un'assenza:
+    {"dal": "2026-03-02T00:00", "al": "2026-03-07T00:00", "libera_slot": false}
+    Gli slot dell'intervallo vengono eliminati (il medico non è disponibile); con libera_slot
+    tornano invece prenotabili. Restituisce i pazienti coinvolti, da avvisare.
+    Tutto avviene con poche istruzioni su insiemi di righe, in una sola transazione.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        dal = datetime.datetime.fromisoformat(data['dal'])
+        al = datetime.datetime.fromisoformat(data['al'])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"errore": "Campi mancanti o non validi (dal, al in formato ISO 8601)"}), 400
+    if al <= dal:
+        return jsonify({"errore": "Intervallo non valido: al deve essere successivo a dal"}), 400
+    libera_slot = bool(data.get('libera_slot', False))
+
+    if db.session.get(Medico, medico_id) is None:
+        return jsonify({"errore": "Medico non trovato"}), 404
+
+    adesso = datetime.datetime.now()
+    condizioni_slot = (
+        Disponibilita.medico_id == medico_id,
+        Disponibilita.data_inizio >= max(dal, adesso),
+        Disponibilita.data_inizio < al,
+    )
+    slot_intervallo = select(Disponibilita.id).where(*condizioni_slot)
 
+    try:
+        cancellati = db.session.execute(
+            archivia_appuntamenti(and_(*condizioni_slot), adesso, STATO_CANCELLATO)
+            .returning(AppuntamentoArchiviato.appuntamento_id, AppuntamentoArchiviato.paziente_id,
+                       AppuntamentoArchiviato.data_inizio)
+        ).all()
+        db.session.execute(delete(Appuntamento).where(Appuntamento.disponibilita_id.in_(slot_intervallo)))
+        if libera_slot:
+            slot_modificati = db.session.execute(
+                update(Disponibilita)
+                .where(*condizioni_slot, Disponibilita.è_prenotato.is_(True))
+                .values(è_prenotato=False, riservato_da=None, riservato_fino=None)
+            ).rowcount
+        else:
+            slot_modificati = db.session.execute(delete(Disponibilita).where(*condizioni_slot)).rowcount
+
+        pazienti = {}
+        if cancellati:
+            for utente in db.session.execute(
+                select(Utente.id, Utente.email, Utente.nome, Utente.cognome)
+                .where(Utente.id.in_({riga.paziente_id for riga in cancellati}))
+            ):
+                pazienti[utente.id] = {**utente._mapping, "appuntamenti": []}
+            for riga in sorted(cancellati, key=lambda riga: riga.data_inizio):
+                pazienti[riga.paziente_id]["appuntamenti"].append(
+                    {"id": riga.appuntamento_id, "data_inizio": riga.data_inizio}
+                )
+
+        # Molti slot cambiati insieme: i client in ascolto ricaricano le disponibilità
+        registra_evento_slot(medico_id, RIALLINEA, {"medico_id": medico_id})
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"errore": f"Errore del database: {str(e)}"}), 500
 
+    return jsonify({
+        "cancellati": len(cancellati),
+        "slot_liberati" if libera_slot else "slot_eliminati": slot_modificati,
+        "pazienti": list(pazienti.values())
+    }), 200
 
-        db.session.add(nuovo_appuntamento)
+# Colonne dell'esportazione dell'agenda, nell'ordine del CSV
+COLONNE_AGENDA = ('appuntamento_id', 'data_inizio', 'data_fine', 'stato', 'data_prenotazione',
+                  'paziente_id', 'cognome', 'nome', 'email')
+FORMATI_AGENDA = {'csv': 'text/csv', 'ics': 'text/calendar'}
+
+def righe_agenda(medico_id, dal, al, dimensione_blocco=1000):
+    """
+    Appuntamenti del medico tra dal e al in ordine cronologico, letti a blocchi.
+    Quelli attivi e quelli archiviati (esclusi i cancellati) vengono da due query
+    ordinate sui rispettivi indici e fusi al volo: nessun ordinamento in memoria.
+    """
+    attivi = db.session.execute(
+        select(Appuntamento.id, Disponibilita.data_inizio, Disponibilita.data_fine, Appuntamento.stato,
+               Appuntamento.data_prenotazione, Utente.id, Utente.cognome, Utente.nome, Utente.email)
+        .join(Disponibilita, Appuntamento.disponibilita_id == Disponibilita.id)
+        .join(Utente, Appuntamento.paziente_id == Utente.id)
+        .where(Disponibilita.medico_id == medico_id, Disponibilita.è_prenotato.is_(True),
+               Disponibilita.data_inizio >= dal, Disponibilita.data_inizio < al)
+        .order_by(Disponibilita.data_inizio, Appuntamento.id)
+        .execution_options(yield_per=dimensione_blocco)
+    )
+    archiviati = db.session.execute(
+        select(AppuntamentoArchiviato.appuntamento_id, AppuntamentoArchiviato.data_inizio,
+               AppuntamentoArchiviato.data_fine, AppuntamentoArchiviato.stato,
+               AppuntamentoArchiviato.data_prenotazione, Utente.id, Utente.cognome, Utente.nome, Utente.email)
+        .join(Utente, AppuntamentoArchiviato.paziente_id == Utente.id)
+        .where(AppuntamentoArchiviato.medico_id == medico_id,
+               AppuntamentoArchiviato.stato != STATO_CANCELLATO,
+               AppuntamentoArchiviato.data_inizio >= dal, AppuntamentoArchiviato.data_inizio < al)
+        .order_by(AppuntamentoArchiviato.data_inizio, AppuntamentoArchiviato.appuntamento_id)
+        .execution_options(yield_per=dimensione_blocco)
+    )
+    return heapq.merge(archiviati, attivi, key=lambda riga: (riga[1], riga[0]))
+
+def eventi_agenda(righe):
+    for appuntamento_id, inizio, fine, stato, _, paziente_id, cognome, nome, email in righe:
+        yield {
+            "uid": f"appuntamento-{appuntamento_id}@salute-facile",
+            "inizio": inizio,
+            "fine": fine,
+            "titolo": f"Visita: {nome} {cognome}",
+            "descrizione": f"Paziente n. {paziente_id}, {email}. Stato: {stato}",
+            "stato": "CONFIRMED",
+        }
+
+@api.route("/api/medici/<int:medico_id>/agenda", methods=['GET'])
+@staff_del_medico()
+def esporta_agenda_medico(medico_id):
+    """
+    Esporta gli appuntamenti di un medico come CSV (formato=csv, predefinito) o iCalendar
+    (formato=ics), tra from e to (ISO 8601, predefinito da oggi per 31 giorni, senza limite
+    massimo). La risposta viene prodotta a blocchi mentre si leggono le righe dal cursore:
+    la memoria usata non dipende dall'ampiezza dell'intervallo.
+    """
+    formato = request.args.get('formato', 'csv')
+    if formato not in FORMATI_AGENDA:
+        return jsonify({"errore": f"Formato non supportato: usare {' o '.join(FORMATI_AGENDA)}"}), 400
+    try:
+        dal = leggi_data_parametro('from', datetime.datetime.combine(datetime.date.today(), datetime.time()))
+        al = leggi_data_parametro('to', dal + FINESTRA_PREDEFINITA)
+    except ValueError as e:
+        return jsonify({"errore": str(e)}), 400
+    if al <= dal:
+        return jsonify({"errore": "Intervallo non valido: to deve essere successivo a from"}), 400
+
+    medico = db.session.get(Medico, medico_id)
+    if medico is None:
+        return jsonify({"errore": "Medico non trovato"}), 404
+
+    righe = righe_agenda(medico_id, dal, al)
+    if formato == 'csv':
+        corpo = csv_in_streaming(righe, COLONNE_AGENDA)
+    else:
+        corpo = ics_in_streaming(eventi_agenda(righe), f"Agenda {medico.nome_completo}")
+    risposta = current_app.response_class(
+        stream_with_context(corpo), mimetype=FORMATI_AGENDA[formato]
+    )
+    nome_file = f"agenda-medico-{medico_id}-{dal.date().isoformat()}-{al.date().isoformat()}.{formato}"
+    risposta.headers['Content-Disposition'] = f'attachment; filename="{nome_file}"'
+    return risposta
+
+def errore_slot_non_disponibile(disponibilita_id, adesso):
+    """Risposta 404/409 quando il compare-and-set su uno slot non ha aggiornato nessuna riga."""
+    slot = db.session.execute(
+        select(Disponibilita.riservato_fino).where(Disponibilita.id == disponibilita_id)
+    ).first()
+    if slot is None:
+        return jsonify({"errore": "Slot di disponibilità non trovato"}), 404
+    if slot.riservato_fino is not None and slot.riservato_fino > adesso:
+        return jsonify({"errore": "Questo slot è riservato da un altro utente che sta completando la prenotazione"}), 409
+    return jsonify({"errore": "Questo slot è già stato prenotato"}), 409
+
+@api.route("/api/disponibilita/<int:disponibilita_id>/riserva", methods=['POST'])
+@richiede_jwt()
+@limitatore.limita('riserva', utente=utente_autenticato)
+def riserva_slot(disponibilita_id):
+    """
+    Riserva lo slot all'utente per RISERVA_DURATA_MINUTI minuti, mentre completa la prenotazione:
+    lo slot sparisce dalle liste degli slot liberi e gli altri utenti ricevono subito 409.
+    Una nuova richiesta dello stesso utente rinnova la riserva. Ogni utente ha al più
+    una riserva attiva: nella stessa transazione vengono rilasciate le sue riserve su
+    altri slot. La conferma con POST /api/appuntamenti trasforma la riserva in prenotazione.
+    """
+    current_user_id = int(get_jwt_identity())
+    adesso = datetime.datetime.now()
+    scadenza = adesso + datetime.timedelta(minutes=current_app.config['RISERVA_DURATA_MINUTI'])
 
+    try:
+        medico_id = db.session.execute(
+            update(Disponibilita)
+            .where(
+                Disponibilita.id == disponibilita_id,
+                or_(
+                    slot_prenotabile(adesso),
+                    (Disponibilita.riservato_da == current_user_id) & Disponibilita.riservato_fino.is_not(None)
+                )
+            )
+            .values(è_prenotato=True, riservato_da=current_user_id, riservato_fino=scadenza)
+            .returning(Disponibilita.medico_id)
+        ).scalar()
+
+        if medico_id is None:
+            db.session.rollback()
+            return errore_slot_non_disponibile(disponibilita_id, adesso)
+
+        # Confronto su riservato_fino invece di IS NOT NULL: usa l'indice e tocca solo le riserve attive
+        rilasciati = db.session.execute(
+            update(Disponibilita)
+            .where(
+                Disponibilita.riservato_fino > adesso,
+                Disponibilita.riservato_da == current_user_id,
+                Disponibilita.id != disponibilita_id
+            )
+            .values(è_prenotato=False, riservato_da=None, riservato_fino=None)
+            .returning(Disponibilita.id, Disponibilita.medico_id, Disponibilita.data_inizio, Disponibilita.data_fine)
+        ).all()
+        for slot_id, medico_slot, data_inizio, data_fine in rilasciati:
+            registra_evento_slot(medico_slot, SLOT_LIBERATO,
+                                 dati_slot_liberato(medico_slot, slot_id, data_inizio, data_fine))
+        registra_evento_slot(medico_id, SLOT_RISERVATO, {"medico_id": medico_id, "slot_id": disponibilita_id})
         db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"errore": f"Errore del database: {str(e)}"}), 500
 
+    return jsonify({
+        "messaggio": "Slot riservato",
+        "disponibilita_id": disponibilita_id,
+        "scade_il": scadenza
+    }), 201
 
+@api.route("/api/disponibilita/<int:disponibilita_id>/riserva", methods=['DELETE'])
+@richiede_jwt()
+def annulla_riserva_slot(disponibilita_id):
+    """Rilascia la riserva dell'utente sullo slot (ad esempio quando sceglie un altro orario)."""
+    current_user_id = int(get_jwt_identity())
 
-        return jsonify({
-
-            "messaggio": "Appuntamento prenotato con successo!",
+    try:
+        slot = db.session.execute(
+            update(Disponibilita)
+            .where(
+                Disponibilita.id == disponibilita_id,
+                Disponibilita.riservato_da == current_user_id,
+                Disponibilita.riservato_fino.is_not(None)
+            )
+            .values(è_prenotato=False, riservato_da=None, riservato_fino=None)
+            .returning(Disponibilita.medico_id, Disponibilita.data_inizio, Disponibilita.data_fine)
+        ).first()
+
+        if slot is None:
+            db.session.rollback()
+            return jsonify({"errore": "Nessuna riserva attiva su questo slot"}), 404
+
+        registra_evento_slot(slot.medico_id, SLOT_LIBERATO,
+                             dati_slot_liberato(slot.medico_id, disponibilita_id, slot.data_inizio, slot.data_fine))
+        db.session.commit()
+        return jsonify({"messaggio": "Riserva annullata"}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"errore": f"Errore del database: {str(e)}"}), 500
 
-            "appuntamento_id": nuovo_appuntamento.id
+@api.route("/api/metrics", methods=['GET'])
+def get_metriche():
+    """Metriche aggregate per route del processo corrente, in formato testo Prometheus."""
+    if 'metriche' not in current_app.extensions:
+        return jsonify({"errore": "Metriche disattivate"}), 404
+    return current_app.response_class(
+        metriche.formato_prometheus(), mimetype='text/plain; version=0.0.4; charset=utf-8'
+    )
 
-        }), 201
+@api.route("/api/salute", methods=['GET'])
+def get_salute():
+    """Liveness: il processo risponde. Non tocca il database, così un database lento non fa riavviare i worker."""
+    return jsonify({"stato": "ok", "pid": os.getpid()}), 200
 
+@api.route("/api/pronto", methods=['GET'])
+def get_pronto():
+    """Readiness: il database risponde e contiene tutte le tabelle (flask --app app crea-schema)."""
+    try:
+        mancanti = tabelle_mancanti()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"stato": "non pronto", "errore": f"Database non raggiungibile: {str(e)}"}), 503
+    if mancanti:
+        return jsonify({"stato": "non pronto", "errore": "Schema non creato", "tabelle_mancanti": mancanti}), 503
+    return jsonify({"stato": "pronto", "pid": os.getpid()}), 200
+
+@api.route("/api/medici/<int:medico_id>/modelli-orario", methods=['GET'])
+def get_modelli_orario(medico_id):
+    """Restituisce gli orari ricorrenti di un medico."""
+    modelli = db.session.execute(
+        select(ModelloOrario)
+        .where(ModelloOrario.medico_id == medico_id)
+        .order_by(ModelloOrario.giorno_settimana, ModelloOrario.ora_inizio)
+    ).scalars()
+    return jsonify([
+        {
+            "id": modello.id,
+            "giorno_settimana": modello.giorno_settimana,
+            "ora_inizio": modello.ora_inizio.strftime('%H:%M'),
+            "ora_fine": modello.ora_fine.strftime('%H:%M'),
+            "durata_minuti": modello.durata_minuti,
+            "valido_dal": modello.valido_dal.isoformat(),
+            "valido_al": modello.valido_al.isoformat()
+        }
+        for modello in modelli
+    ])
+
+@api.route("/api/medici/<int:medico_id>/modelli-orario", methods=['POST'])
+@staff_del_medico()
+def crea_modello_orario(medico_id):
+    """
+    Crea un orario ricorrente per il medico, ad esempio:
+    {"giorno_settimana": 0, "ora_inizio": "09:00", "ora_fine": "13:00",
+     "durata_minuti": 15, "valido_dal": "2026-01-01", "valido_al": "2026-12-31"}
+    """
+    data = request.get_json()
+    try:
+        giorno_settimana = int(data['giorno_settimana'])
+        ora_inizio = datetime.time.fromisoformat(data['ora_inizio'])
+        ora_fine = datetime.time.fromisoformat(data['ora_fine'])
+        durata_minuti = int(data['durata_minuti'])
+        valido_dal = datetime.date.fromisoformat(data['valido_dal'])
+        valido_al = datetime.date.fromisoformat(data['valido_al'])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"errore": "Campi mancanti o non validi (giorno_settimana, ora_inizio, ora_fine, "
+                                  "durata_minuti, valido_dal, valido_al)"}), 400
+
+    if not 0 <= giorno_settimana <= 6 or durata_minuti <= 0 or ora_fine <= ora_inizio or valido_al < valido_dal:
+        return jsonify({"errore": "Orario non valido"}), 400
+
+    if db.session.get(Medico, medico_id) is None:
+        return jsonify({"errore": "Medico non trovato"}), 404
+
+    modello = ModelloOrario(
+        medico_id=medico_id,
+        giorno_settimana=giorno_settimana,
+        ora_inizio=ora_inizio,
+        ora_fine=ora_fine,
+        durata_minuti=durata_minuti,
+        valido_dal=valido_dal,
+        valido_al=valido_al
+    )
+    try:
+        db.session.add(modello)
+        db.session.commit()
+        return jsonify({"messaggio": "Orario creato con successo!", "modello_id": modello.id}), 201
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"errore": f"Errore del database: {str(e)}"}), 500
 
+@api.route("/api/medici/<int:medico_id>/disponibilita/genera", methods=['POST'])
+@staff_del_medico()
+def genera_disponibilita_medico(medico_id):
+    """Genera gli slot del medico a partire dai suoi orari ricorrenti. Body opzionale: {"dal": ..., "al": ...}."""
+    data = request.get_json(silent=True) or {}
+    try:
+        dal = datetime.date.fromisoformat(data['dal']) if data.get('dal') else None
+        al = datetime.date.fromisoformat(data['al']) if data.get('al') else None
+    except (TypeError, ValueError):
+        return jsonify({"errore": "Date non valide: usare il formato AAAA-MM-GG"}), 400
 
+    try:
+        creati = materializza_modelli(medico_ids=[medico_id], dal=dal, al=al)
+        return jsonify({"messaggio": "Disponibilità generate con successo!", "slot_creati": creati}), 201
     except Exception as e:
-
         db.session.rollback()
-
         return jsonify({"errore": f"Errore del database: {str(e)}"}), 500
 
 
+# --- Comandi da riga di comando (flask --app app <comando>) ---
+
+@click.command('genera-slot')
+@click.option('--medico', 'medico_ids', type=int, multiple=True, help="Limita la generazione a questi medici.")
+@click.option('--dal', type=click.DateTime(formats=['%Y-%m-%d']), default=None)
+@click.option('--al', type=click.DateTime(formats=['%Y-%m-%d']), default=None)
+@with_appcontext
+def comando_genera_slot(medico_ids, dal, al):
+    """Genera gli slot di disponibilità dai modelli orario."""
+    inizio = time.perf_counter()
+    creati = materializza_modelli(
+        medico_ids=list(medico_ids) or None,
+        dal=dal.date() if dal else None,
+        al=al.date() if al else None
+    )
+    durata = time.perf_counter() - inizio
+    click.echo(f"Creati {creati} slot in {durata:.2f}s ({creati / durata:.0f} slot/s).")
+
+@click.command('archivia')
+@click.option('--margine-ore', type=int, default=None,
+              help="Archivia gli slot iniziati da più di queste ore (predefinito ARCHIVIAZIONE_MARGINE_ORE).")
+@click.option('--batch', 'dimensione_batch', type=int, default=None, help="Slot per transazione.")
+@with_appcontext
+def comando_archivia(margine_ore, dimensione_batch):
+    """Elimina gli slot passati liberi e sposta nell'archivio quelli prenotati."""
+    config = dict(current_app.config)
+    if margine_ore is not None:
+        config['ARCHIVIAZIONE_MARGINE_ORE'] = margine_ore
+    statistiche = archivia_passato(
+        soglia_archiviazione(config),
+        dimensione_batch or config['ARCHIVIAZIONE_BATCH'],
+        config['ARCHIVIAZIONE_PAUSA_MS'] / 1000
+    )
+    click.echo(
+        f"Eliminati {statistiche['slot_eliminati']} slot liberi e archiviati "
+        f"{statistiche['appuntamenti_archiviati']} appuntamenti in {statistiche['durata_s']:.2f}s "
+        f"({statistiche['righe_al_secondo']} righe/s, {statistiche['batch']} batch, "
+        f"batch più lungo {statistiche['batch_max_ms']} ms)."
+    )
 
-# --- Funzione di Seed per il Database (da eseguire una sola volta) ---
+@click.command('crea-schema')
+@with_appcontext
+def comando_crea_schema():
+    """Crea tabelle, colonne, indici e trigger mancanti. Non modifica i dati esistenti."""
+    prepara_schema()
+    click.echo("Schema del database aggiornato.")
+
+@click.command('seed')
+@with_appcontext
+def comando_seed():
+    """Prepara lo schema e inserisce i dati di esempio se il database è vuoto."""
+    prepara_schema()
+    seed_database()
+
+@click.command('collega-medico')
+@click.argument('email')
+@click.argument('medico_id', type=int)
+@with_appcontext
+def comando_collega_medico(email, medico_id):
+    """Collega l'account EMAIL al medico MEDICO_ID e gli assegna il ruolo 'medico'."""
+    utente = db.session.execute(select(Utente).where(Utente.email == email.strip())).scalar()
+    medico = db.session.get(Medico, medico_id)
+    if utente is None or medico is None:
+        raise click.ClickException("Utente o medico non trovato.")
+    if utente.ruolo != 'admin':
+        utente.ruolo = 'medico'
+    medico.utente_id = utente.id
+    db.session.commit()
+    click.echo(f"{utente.email} ora gestisce {medico.nome_completo}.")
+
+@click.command('rilascia-riserve')
+@with_appcontext
+def comando_rilascia_riserve():
+    """Rilascia subito gli slot con la riserva scaduta."""
+    click.echo(f"Rilasciati {rilascia_riserve_scadute()} slot.")
+
+# --- Creazione dell'applicazione ---
+
+def create_app(config=None):
+    """
+    Crea e configura l'applicazione Flask.
+    La configurazione viene letta dall'ambiente (DATABASE_URL, SQLITE_*, DB_POOL_*, ...)
+    e può essere sovrascritta passando un dizionario, ad esempio nei benchmark.
+    """
+    app = Flask(__name__)
+    app.config.update(configurazione_da_ambiente())
+    if config:
+        app.config.update(config)
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', opzioni_engine(app.config))
+    app.json = ProviderJSON(app)
+
+    CORS(app, resources={r"/api/*": {"origins": "*"}}, expose_headers=["X-Next-Cursor", "Idempotent-Replayed", "Retry-After"])
+    db.init_app(app)
+    bcrypt.init_app(app)
+    jwt.init_app(app)
+    app.extensions['pool_hash'] = PoolHash(app.config['BCRYPT_WORKERS'], app.config['BCRYPT_MAX_CODA'])
+    app.register_blueprint(api)
+    app.cli.add_command(comando_genera_slot)
+    app.cli.add_command(comando_rilascia_riserve)
+    app.cli.add_command(comando_collega_medico)
+    app.cli.add_command(comando_archivia)
+    app.cli.add_command(comando_crea_schema)
+    app.cli.add_command(comando_seed)
 
+    with app.app_context():
+        if _usa_sqlite(app.config):
+            registra_pragma_sqlite(db.engine, app.config)
+        metriche.init_app(app, db.engine)
+    bus_eventi.init_app(app)
+    compressione.init_app(app)
+    limitatore.init_app(app)
+    cache_utenti.init_app(app)
+    rilascio_riserve.init_app(app)
+    inoltro_eventi.init_app(app)
+    registro_idempotenza.init_app(app)
+    archiviazione.init_app(app)
+
+    _app_create.add(app)
+    return app
+
+# App create in questo processo, da reinizializzare nei processi figli dopo un fork
+_app_create = weakref.WeakSet()
+
+def reinizializza_dopo_fork():
+    """
+    Eseguita nel processo figlio dopo un fork (server con preload, come gunicorn --preload):
+    le connessioni del pool e il pool di bcrypt ereditati dal processo padre non vanno
+    riusati, il figlio apre i propri. Le attività periodiche e i secchi dei limiti su
+    SQLite si accorgono da soli del cambio di pid.
+    """
+    for app in list(_app_create):
+        with app.app_context():
+            for engine in db.engines.values():
+                # close=False: le connessioni appartengono ancora al padre, il figlio le abbandona soltanto
+                engine.dispose(close=False)
+        app.extensions['pool_hash'] = PoolHash(app.config['BCRYPT_WORKERS'], app.config['BCRYPT_MAX_CODA'])
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reinizializza_dopo_fork)
+
+_app_predefinita = None
+
+def __getattr__(nome):
+    """
+    L'istanza 'app' usata da seed.py, dai benchmark e da flask --app app viene creata al
+    primo accesso: importare il modulo non crea app, engine né thread. I server WSGI
+    usano wsgi.py, che chiama create_app().
+    """
+    global _app_predefinita
+    if nome == 'app':
+        if _app_predefinita is None:
+            _app_predefinita = create_app()
+        return _app_predefinita
+    raise AttributeError(f"module {__name__!r} has no attribute {nome!r}")
 
+# --- Funzione di Seed per il Database (da eseguire una sola volta) ---
 
 def seed_database():
 
-    """Popola il database con dati di esempio se è vuoto."""
+    """Popola il database con dati di esempio se è vuoto. Va eseguita dentro un app context."""
 
-    with app.app_context():
+    # Controlla se ci sono già medici
 
-        # Controlla se ci sono già medici
+    if Medico.query.count() > 0:
 
-        if Medico.query.count() > 0:
+        print("Database già popolato. Salto il seeding.")
 
-            print("Database già popolato. Salto il seeding.")
+        return
 
-            return
+    print("Popolamento del database con dati di esempio...")
 
-        print("Popolamento del database con dati di esempio...")
+    # 1. Creazione di alcuni medici di esempio
+    medico1 = Medico(nome_completo="Dott. Mario Rossi", specializzazione="Cardiologia", descrizione="Esperto in cardiologia clinica e interventistica.")
 
-        # 1. Creazione di alcuni medici di esempio
-        medico1 = Medico(nome_completo="Dott. Mario Rossi", specializzazione="Cardiologia", descrizione="Esperto in cardiologia clinica e interventistica.")
+    medico2 = Medico(nome_completo="Dott.ssa Anna Bianchi", specializzazione="Dermatologia", descrizione="Specializzata in dermatologia estetica e mappatura nevi.")
 
-        medico2 = Medico(nome_completo="Dott.ssa Anna Bianchi", specializzazione="Dermatologia", descrizione="Specializzata in dermatologia estetica e mappatura nevi.")
+    medico3 = Medico(nome_completo="Dott. Luca Verdi", specializzazione="Ortopedia", descrizione="Focus su chirurgia del ginocchio e anca.")
 
-        medico3 = Medico(nome_completo="Dott. Luca Verdi", specializzazione="Ortopedia", descrizione="Focus su chirurgia del ginocchio e anca.")
+    db.session.add_all([medico1, medico2, medico3])
 
-        db.session.add_all([medico1, medico2, medico3])
+    db.session.commit()
 
-        db.session.commit()
+    # 2. Creazione di slot di disponibilità per i medici
+    today = datetime.date.today()
 
-        # 2. Creazione di slot di disponibilità per i medici
-        today = datetime.date.today()
+    # Slot per il Dott. Rossi
+    for i in range(3):
 
-        # Slot per il Dott. Rossi
-        for i in range(3):
+        giorno = today + datetime.timedelta(days=i + 1)
 
-            giorno = today + datetime.timedelta(days=i + 1)
+        db.session.add(Disponibilita(medico_id=medico1.id, data_inizio=datetime.datetime(giorno.year, giorno.month, giorno.day, 9, 0), data_fine=datetime.datetime(giorno.year, giorno.month, giorno.day, 9, 30)))
 
-            db.session.add(Disponibilita(medico_id=medico1.id, data_inizio=datetime.datetime(giorno.year, giorno.month, giorno.day, 9, 0), data_fine=datetime.datetime(giorno.year, giorno.month, giorno.day, 9, 30)))
+        db.session.add(Disponibilita(medico_id=medico1.id, data_inizio=datetime.datetime(giorno.year, giorno.month, giorno.day, 10, 0), data_fine=datetime.datetime(giorno.year, giorno.month, giorno.day, 10, 30)))
 
-            db.session.add(Disponibilita(medico_id=medico1.id, data_inizio=datetime.datetime(giorno.year, giorno.month, giorno.day, 10, 0), data_fine=datetime.datetime(giorno.year, giorno.month, giorno.day, 10, 30)))
+    # Slot per la Dott.ssa Bianchi
+    for i in range(2):
 
-        # Slot per la Dott.ssa Bianchi
-        for i in range(2):
+        giorno = today + datetime.timedelta(days=i + 2)
 
-            giorno = today + datetime.timedelta(days=i + 2)
+        db.session.add(Disponibilita(medico_id=medico2.id, data_inizio=datetime.datetime(giorno.year, giorno.month, giorno.day, 14, 0), data_fine=datetime.datetime(giorno.year, giorno.month, giorno.day, 14, 20)))
 
-            db.session.add(Disponibilita(medico_id=medico2.id, data_inizio=datetime.datetime(giorno.year, giorno.month, giorno.day, 14, 0), data_fine=datetime.datetime(giorno.year, giorno.month, giorno.day, 14, 20)))
+        db.session.add(Disponibilita(medico_id=medico2.id, data_inizio=datetime.datetime(giorno.year, giorno.month, giorno.day, 15, 0), data_fine=datetime.datetime(giorno.year, giorno.month, giorno.day, 15, 20)))
 
-            db.session.add(Disponibilita(medico_id=medico2.id, data_inizio=datetime.datetime(giorno.year, giorno.month, giorno.day, 15, 0), data_fine=datetime.datetime(giorno.year, giorno.month, giorno.day, 15, 20)))
+    db.session.commit()
 
+    print("Database popolato con successo!")
 
+def aggiungi_colonne_mancanti():
+    """create_all() non modifica tabelle già esistenti: aggiunge qui le colonne nuove (tutte nullable)."""
+    ispettore = inspect(db.engine)
+    with db.engine.begin() as connessione:
+        for tabella in db.metadata.sorted_tables:
+            if not ispettore.has_table(tabella.name):
+                continue
+            esistenti = {colonna['name'] for colonna in ispettore.get_columns(tabella.name)}
+            for colonna in tabella.columns:
+                if colonna.name not in esistenti and colonna.nullable:
+                    tipo = colonna.type.compile(dialect=db.engine.dialect)
+                    connessione.execute(text(f'ALTER TABLE "{tabella.name}" ADD COLUMN "{colonna.name}" {tipo}'))
 
-        db.session.commit()
-
-        print("Database popolato con successo!")
-
-
+def crea_indici_mancanti():
+    """create_all() non aggiunge indici a tabelle già esistenti: li crea qui se mancano."""
+    for tabella in db.metadata.sorted_tables:
+        for indice in tabella.indexes:
+            indice.create(db.engine, checkfirst=True)
+    with db.engine.begin() as connessione:
+        crea_indice_ricerca(connessione)
+        crea_calendario(connessione)
+        crea_versione_catalogo(connessione)
 
+def prepara_schema():
+    """Crea le tabelle mancanti e aggiunge colonne, indici e trigger nuovi ai database esistenti."""
+    db.create_all()
+    aggiungi_colonne_mancanti()
+    crea_indici_mancanti()
 
+def tabelle_mancanti():
+    """Tabelle dei modelli che non esistono ancora nel database (una sola query al catalogo)."""
+    esistenti = set(inspect(db.engine).get_table_names())
+    return sorted(tabella for tabella in db.metadata.tables if tabella not in esistenti)
 
 # --- Blocco di Esecuzione ---
 
-
+# Solo per lo sviluppo. Lo schema e i dati di esempio si preparano a parte:
+#   flask --app app crea-schema      (oppure: flask --app app seed)
+# In produzione l'app va servita da un server WSGI multi-processo tramite wsgi.py.
 
 if __name__ == '__main__':
 
+    app = create_app()
+
     with app.app_context():
 
-        db.create_all()  # Crea le tabelle se non esistono
+        mancanti = tabelle_mancanti()
 
-        seed_database()  # Popola il DB con dati di esempio
+    if mancanti:
 
-    
+        print(f"Tabelle mancanti: {', '.join(mancanti)}. Esegui prima: flask --app app seed")
 
-    app.run(debug=True, port=5000)
+    app.run(debug=_env_bool('FLASK_DEBUG', True), port=int(os.environ.get('PORT', 5000)))
@@ -0,0 +1,5 @@
+# backend/benchmarks/__init__.py
+#
+# Script di benchmark del backend. Vanno eseguiti dalla cartella backend, ad esempio:
+#   python -m benchmarks.prenotazioni_concorrenti --clienti 32 --slot 50
+# Ogni script lavora su un database temporaneo e non tocca salute_facile.db.
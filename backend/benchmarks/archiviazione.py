@@ -0,0 +1,108 @@
+# backend/benchmarks/archiviazione.py
+#
+# Archiviazione dello storico: genera un dataset con molti giorni passati, misura
+# le query sugli slot, esegue archivia_passato mentre un thread continua a
+# prenotare slot futuri e riporta righe spostate al secondo, durata del batch più
+# lungo (quanto resta preso il lock di scrittura di SQLite) e latenza delle
+# prenotazioni durante il job. Infine ripete le query sulla tabella ridotta.
+#
+# Esempio:
+#   python -m benchmarks.archiviazione --medici 500 --giorni-passati 60 --batch 500
+
+import argparse
+import importlib
+import threading
+import time
+
+from sqlalchemy import func, select
+
+from benchmarks.comune import carica_app, database_temporaneo, riassunto_latenze, stampa_report
+
+
+def conta(modulo, modello):
+    with modulo.app.app_context():
+        return modulo.db.session.execute(select(func.count()).select_from(modello)).scalar()
+
+
+def latenze_query(client, medici_ids, ripetizioni):
+    """ Slot liberi di un medico e primi slot liberi della specializzazione """
+    per_medico, prime = [], []
+    for i in range(ripetizioni):
+        t0 = time.perf_counter()
+        client.get(f"/api/medici/{medici_ids[i % len(medici_ids)]}/disponibilita?limit=50")
+        per_medico.append(time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        client.get("/api/disponibilita/prime-libere?specializzazione=Cardiologia&limit=20")
+        prime.append(time.perf_counter() - t0)
+    return {"disponibilita_medico": riassunto_latenze(per_medico), "prime_libere": riassunto_latenze(prime)}
+
+
+def prenota_in_continuo(modulo, slot_ids, token, ferma, latenze):
+    client = modulo.app.test_client()
+    for slot_id in slot_ids:
+        if ferma.is_set():
+            break
+        t0 = time.perf_counter()
+        client.post("/api/appuntamenti", json={"disponibilita_id": slot_id},
+                    headers={"Authorization": f"Bearer {token}"})
+        latenze.append(time.perf_counter() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archiviazione di slot e appuntamenti passati")
+    parser.add_argument("--medici", type=int, default=500)
+    parser.add_argument("--giorni", type=int, default=7, help="giorni futuri")
+    parser.add_argument("--giorni-passati", type=int, default=60)
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--pausa-ms", type=float, default=10)
+    parser.add_argument("--ripetizioni", type=int, default=200)
+    args = parser.parse_args()
+
+    modulo = carica_app(database_temporaneo("archiviazione.db"))
+    seed = importlib.import_module("seed")
+    seed.genera_dati_sintetici(num_medici=args.medici, giorni=args.giorni, num_pazienti=2000,
+                               giorni_passati=args.giorni_passati, tasso_prenotazione=0.3)
+    app = modulo.app
+    with app.app_context():
+        db = modulo.db
+        medici_ids = db.session.scalars(select(modulo.Medico.id).limit(100)).all()
+        slot_futuri = db.session.scalars(
+            select(modulo.Disponibilita.id)
+            .where(modulo.Disponibilita.è_prenotato.is_(False),
+                   modulo.Disponibilita.data_inizio > func.datetime('now', 'localtime'))
+            .limit(100000)
+        ).all()
+        token = modulo.create_access_token(identity="1")
+
+    client = app.test_client()
+    report = {"righe_prima": {"disponibilita": conta(modulo, modulo.Disponibilita),
+                              "appuntamenti": conta(modulo, modulo.Appuntamento)}}
+    report["query_prima"] = latenze_query(client, medici_ids, args.ripetizioni)
+
+    # Prenotazioni senza job in corso, come riferimento
+    base = []
+    prenota_in_continuo(modulo, slot_futuri[:args.ripetizioni], token, threading.Event(), base)
+    report["prenotazioni_senza_job"] = riassunto_latenze(base)
+
+    ferma, durante = threading.Event(), []
+    prenotatore = threading.Thread(target=prenota_in_continuo,
+                                   args=(modulo, slot_futuri[args.ripetizioni:], token, ferma, durante))
+    prenotatore.start()
+    try:
+        with app.app_context():
+            report["job"] = modulo.archivia_passato(modulo.soglia_archiviazione(app.config), args.batch,
+                                                    args.pausa_ms / 1000)
+    finally:
+        ferma.set()
+        prenotatore.join()
+    report["prenotazioni_durante_job"] = riassunto_latenze(durante)
+
+    report["righe_dopo"] = {"disponibilita": conta(modulo, modulo.Disponibilita),
+                            "appuntamenti": conta(modulo, modulo.Appuntamento),
+                            "appuntamenti_archiviati": conta(modulo, modulo.AppuntamentoArchiviato)}
+    report["query_dopo"] = latenze_query(client, medici_ids, args.ripetizioni)
+    stampa_report(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+# backend/benchmarks/avvio_worker.py
+#
+# Avvio a freddo e memoria per worker, per dimensionare il numero di processi su
+# una macchina. Ogni misura gira in un interprete nuovo:
+#   - avvio: tempo di "import app" (senza effetti collaterali), di "import wsgi"
+#     (create_app) e fino alla prima risposta di /api/pronto e /api/medici;
+#   - memoria: N worker creati con fork come fa un server pre-fork, con l'app
+#     creata nel master prima del fork (preload) oppure in ogni worker dopo il
+#     fork. Dopo alcune richieste si leggono RSS, PSS e memoria privata (USS) di
+#     ogni worker da /proc/<pid>/smaps_rollup (solo Linux).
+#
+# Esempio:
+#   python -m benchmarks.avvio_worker --ripetizioni 5 --worker 4
+
+import argparse
+import importlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.comune import carica_app, database_temporaneo, stampa_report
+
+CARTELLA_BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Eseguito in un interprete nuovo: tempi dall'inizio dell'import, in millisecondi
+CODICE_AVVIO = """
+import json, time
+t0 = time.perf_counter()
+import app
+t_import = time.perf_counter()
+import wsgi
+t_app = time.perf_counter()
+client = wsgi.app.test_client()
+assert client.get('/api/pronto').status_code == 200
+t_pronto = time.perf_counter()
+assert client.get('/api/medici').status_code == 200
+t_medici = time.perf_counter()
+print(json.dumps({
+    'import_app_ms': (t_import - t0) * 1000,
+    'create_app_ms': (t_app - t_import) * 1000,
+    'prima_risposta_pronto_ms': (t_pronto - t0) * 1000,
+    'prima_risposta_medici_ms': (t_medici - t0) * 1000,
+}))
+"""
+
+
+def memoria_processo(pid):
+    """ Rss, Pss e memoria privata (Private_Clean + Private_Dirty) in MiB """
+    valori = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for riga in f:
+            campi = riga.split()
+            if len(campi) >= 2 and campi[0].endswith(":") and campi[1].isdigit():
+                valori[campi[0][:-1]] = int(campi[1])
+    return {
+        "rss_mib": valori["Rss"] / 1024,
+        "pss_mib": valori["Pss"] / 1024,
+        "privata_mib": (valori["Private_Clean"] + valori["Private_Dirty"]) / 1024,
+    }
+
+
+def lavora(richieste):
+    """ Corpo di un worker: crea l'app se serve e serve qualche richiesta tipica """
+    wsgi = importlib.import_module("wsgi")
+    client = wsgi.app.test_client()
+    for i in range(richieste):
+        client.get("/api/medici")
+        client.get(f"/api/medici/{i % 50 + 1}/disponibilita?limit=50")
+        client.get("/api/disponibilita/prime-libere?specializzazione=Cardiologia&limit=20")
+
+
+def misura_memoria(preload, num_worker, richieste):
+    """ Eseguita in un interprete nuovo: fork dei worker e lettura della loro memoria """
+    if preload:
+        importlib.import_module("wsgi")
+    master = memoria_processo(os.getpid())
+    figli = []
+    for _ in range(num_worker):
+        lettura, scrittura = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(lettura)
+            lavora(richieste)
+            os.write(scrittura, b"x")
+            # Resta vivo finché il master non ha letto la sua memoria
+            time.sleep(60)
+            os._exit(0)
+        os.close(scrittura)
+        figli.append((pid, lettura))
+    worker = []
+    for pid, lettura in figli:
+        os.read(lettura, 1)
+        worker.append(memoria_processo(pid))
+    for pid, _ in figli:
+        os.kill(pid, 9)
+        os.waitpid(pid, 0)
+    media = {chiave: round(statistics.mean(w[chiave] for w in worker), 1) for chiave in worker[0]}
+    return {
+        "master": {chiave: round(valore, 1) for chiave, valore in master.items()},
+        "media_per_worker": media,
+        "pss_totale_worker_mib": round(sum(w["pss_mib"] for w in worker), 1),
+    }
+
+
+def esegui_interprete(argomenti, ambiente):
+    uscita = subprocess.run([sys.executable, *argomenti], cwd=CARTELLA_BACKEND, env=ambiente,
+                            capture_output=True, text=True, check=True)
+    return json.loads(uscita.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Avvio a freddo e memoria per worker")
+    parser.add_argument("--ripetizioni", type=int, default=5)
+    parser.add_argument("--worker", type=int, default=4)
+    parser.add_argument("--richieste", type=int, default=200, help="richieste servite da ogni worker")
+    parser.add_argument("--medici", type=int, default=500)
+    parser.add_argument("--misura-memoria", choices=("preload", "senza_preload"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.misura_memoria:
+        print(json.dumps(misura_memoria(args.misura_memoria == "preload", args.worker, args.richieste)))
+        return
+
+    database_url = database_temporaneo("avvio.db")
+    carica_app(database_url)
+    seed = importlib.import_module("seed")
+    seed.genera_dati_sintetici(num_medici=args.medici, giorni=14, num_pazienti=1000)
+    ambiente = dict(os.environ, DATABASE_URL=database_url)
+
+    avvii = []
+    for _ in range(args.ripetizioni):
+        t0 = time.perf_counter()
+        tempi = esegui_interprete(["-c", CODICE_AVVIO], ambiente)
+        tempi["processo_completo_ms"] = (time.perf_counter() - t0) * 1000
+        avvii.append(tempi)
+    report = {"avvio_mediana_ms": {chiave: round(statistics.median(a[chiave] for a in avvii), 1)
+                                   for chiave in avvii[0]}}
+
+    report["memoria"] = {"worker": args.worker}
+    for modalita in ("preload", "senza_preload"):
+        report["memoria"][modalita] = esegui_interprete(
+            ["-m", "benchmarks.avvio_worker", "--misura-memoria", modalita,
+             "--worker", str(args.worker), "--richieste", str(args.richieste)],
+            ambiente,
+        )
+    stampa_report(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+# backend/benchmarks/calendario.py
+#
+# Vista a calendario: dimensione della risposta (anche gzip) e latenza di
+# /api/calendario rispetto alla lista degli slot, per il mese di un medico e per
+# la settimana di cinquanta medici. Misura anche quanto costano i trigger che
+# mantengono calendario_giorni sugli insert di massa degli slot.
+#
+# Esempio:
+#   python -m benchmarks.calendario --medici 2000 --giorni 45 --ripetizioni 100
+
+import argparse
+import datetime
+import importlib
+import time
+
+from sqlalchemy import delete, select, text
+
+from benchmarks.comune import carica_app, database_temporaneo, riassunto_latenze, stampa_report
+
+
+def leggi_tutto(client, url, headers):
+    """ Segue X-Next-Cursor fino all'ultima pagina: byte totali trasferiti e numero di richieste """
+    byte = richieste = 0
+    cursore = None
+    while True:
+        risposta = client.get(url + (f"&after={cursore}" if cursore else ""), headers=headers)
+        byte += len(risposta.data)
+        richieste += 1
+        cursore = risposta.headers.get("X-Next-Cursor")
+        if not cursore:
+            return byte, richieste
+
+
+def confronta(client, url, ripetizioni):
+    voce = {}
+    for nome, headers in (("json", {}), ("gzip", {"Accept-Encoding": "gzip"})):
+        latenze = []
+        for _ in range(ripetizioni):
+            t0 = time.perf_counter()
+            byte, richieste = leggi_tutto(client, url, headers)
+            latenze.append(time.perf_counter() - t0)
+        voce[nome] = {"byte": byte, "richieste_http": richieste, **riassunto_latenze(latenze)}
+    return voce
+
+
+def costo_trigger(modulo, num_slot):
+    """ Slot inseriti al secondo con inserisci_slot_in_blocco, con e senza i trigger del calendario """
+    app = modulo.app
+    risultati = {}
+    with app.app_context():
+        db = modulo.db
+        medico_id = db.session.execute(select(modulo.Medico.id).limit(1)).scalar()
+        inizio = datetime.datetime(2100, 1, 1, 8)
+        righe = [(medico_id, inizio + datetime.timedelta(minutes=15 * i), inizio + datetime.timedelta(minutes=15 * (i + 1)))
+                 for i in range(num_slot)]
+        for nome in ("con_trigger", "senza_trigger"):
+            if nome == "senza_trigger":
+                for trigger in ("calendario_ai", "calendario_ad", "calendario_au"):
+                    db.session.execute(text(f"DROP TRIGGER {trigger}"))
+                db.session.commit()
+            t0 = time.perf_counter()
+            modulo.inserisci_slot_in_blocco(righe)
+            db.session.commit()
+            risultati[nome] = round(num_slot / (time.perf_counter() - t0))
+            db.session.execute(delete(modulo.Disponibilita).where(modulo.Disponibilita.data_inizio >= inizio))
+            db.session.commit()
+        with db.engine.begin() as connessione:
+            for istruzione in modulo.DDL_CALENDARIO:
+                connessione.exec_driver_sql(istruzione)
+    return {"slot_al_secondo": risultati}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calendario compatto contro lista degli slot")
+    parser.add_argument("--medici", type=int, default=2000)
+    parser.add_argument("--giorni", type=int, default=45)
+    parser.add_argument("--ripetizioni", type=int, default=100)
+    parser.add_argument("--slot-trigger", type=int, default=100000)
+    args = parser.parse_args()
+
+    modulo = carica_app(database_temporaneo("calendario.db"))
+    seed = importlib.import_module("seed")
+    seed.genera_dati_sintetici(num_medici=args.medici, giorni=args.giorni, num_pazienti=2000, tasso_prenotazione=0.3)
+
+    client = modulo.app.test_client()
+    oggi = datetime.date.today()
+    mese = f"from={oggi.isoformat()}&to={(oggi + datetime.timedelta(days=30)).isoformat()}"
+    settimana = f"from={oggi.isoformat()}&to={(oggi + datetime.timedelta(days=7)).isoformat()}"
+    cinquanta = ",".join(str(i) for i in range(1, 51))
+
+    report = {
+        "mese_un_medico": {
+            "lista_slot": confronta(client, f"/api/medici/1/disponibilita?limit=500&{mese}", args.ripetizioni),
+            "calendario": confronta(client, f"/api/calendario?medico_ids=1&{mese}", args.ripetizioni),
+        },
+        "settimana_cinquanta_medici": {
+            # La lista per più medici restituisce al massimo 100 slot per medico in una sola richiesta
+            "lista_slot": confronta(client, f"/api/disponibilita?limit=100&medico_ids={cinquanta}&{settimana}",
+                                    args.ripetizioni),
+            "calendario": confronta(client, f"/api/calendario?medico_ids={cinquanta}&{settimana}", args.ripetizioni),
+        },
+        "insert_di_massa": costo_trigger(modulo, args.slot_trigger),
+    }
+    stampa_report(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+# backend/benchmarks/cancellazione_medico.py
+#
+# Assenza di un medico molto richiesto: cancellazione di una settimana intera di
+# appuntamenti. Confronta la cancellazione di massa
+# (POST /api/medici/<id>/appuntamenti/cancellazione, poche istruzioni su insiemi di
+# righe in una transazione) con una DELETE /api/appuntamenti/<id> per appuntamento,
+# come farebbero i pazienti uno alla volta. Riporta durata e appuntamenti al secondo;
+# la durata della richiesta di massa è anche il tempo in cui resta preso il lock di
+# scrittura di SQLite.
+#
+# Esempio:
+#   python -m benchmarks.cancellazione_medico --slot 672 --pazienti 300
+
+import argparse
+import time
+
+from sqlalchemy import func, insert, select, update
+
+from benchmarks.comune import carica_app, crea_dati_di_prova, database_temporaneo, riassunto_latenze, stampa_report
+
+
+def prenota_tutto(modulo, app, slot_ids, num_pazienti):
+    """ Prenota ogni slot del medico, a rotazione tra i pazienti, direttamente sul database """
+    db = modulo.db
+    with app.app_context():
+        pazienti = db.session.scalars(
+            select(modulo.Utente.id).where(modulo.Utente.ruolo == "paziente").order_by(modulo.Utente.id)
+        ).all()
+        db.session.execute(modulo.Appuntamento.__table__.delete())
+        db.session.execute(update(modulo.Disponibilita).where(modulo.Disponibilita.id.in_(slot_ids))
+                           .values(è_prenotato=True))
+        db.session.execute(insert(modulo.Appuntamento), [
+            {"paziente_id": pazienti[i % num_pazienti], "disponibilita_id": slot_id, "stato": "Confermato"}
+            for i, slot_id in enumerate(slot_ids)
+        ])
+        db.session.commit()
+        return db.session.execute(
+            select(modulo.Appuntamento.id, modulo.Appuntamento.paziente_id)
+        ).all()
+
+
+def conta_rimasti(modulo, app):
+    with app.app_context():
+        return modulo.db.session.execute(select(func.count()).select_from(modulo.Appuntamento)).scalar()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cancellazione di massa contro cancellazioni singole")
+    parser.add_argument("--slot", type=int, default=672, help="slot da 15 minuti del medico (672 = 7 giorni)")
+    parser.add_argument("--medici", type=int, default=200, help="medici nel database, oltre a quello assente")
+    parser.add_argument("--pazienti", type=int, default=300)
+    args = parser.parse_args()
+
+    modulo = carica_app(database_temporaneo("cancellazione.db"))
+    app = modulo.app
+    crea_dati_di_prova(modulo, app, num_medici=args.medici, slot_per_medico=args.slot, num_pazienti=args.pazienti)
+    with app.app_context():
+        db = modulo.db
+        medico_id = db.session.execute(select(func.min(modulo.Medico.id))).scalar()
+        slot_medico = db.session.scalars(
+            select(modulo.Disponibilita.id).where(modulo.Disponibilita.medico_id == medico_id)
+        ).all()
+        admin = modulo.Utente(email="admin@bench.local", password_hash="non-usato", nome="Admin",
+                              cognome="Benchmark", ruolo="admin")
+        db.session.add(admin)
+        db.session.commit()
+        token_admin = modulo.create_access_token(identity=str(admin.id))
+        token_per_paziente = {
+            paziente_id: modulo.create_access_token(identity=str(paziente_id))
+            for paziente_id in db.session.scalars(select(modulo.Utente.id).where(modulo.Utente.ruolo == "paziente"))
+        }
+
+    client = app.test_client()
+    report = {"appuntamenti_da_cancellare": len(slot_medico)}
+
+    # Una DELETE per appuntamento (gli slot tornano liberi)
+    appuntamenti = prenota_tutto(modulo, app, slot_medico, args.pazienti)
+    latenze = []
+    inizio = time.perf_counter()
+    for appuntamento in appuntamenti:
+        t0 = time.perf_counter()
+        risposta = client.delete(f"/api/appuntamenti/{appuntamento.id}",
+                                 headers={"Authorization": f"Bearer {token_per_paziente[appuntamento.paziente_id]}"})
+        latenze.append(time.perf_counter() - t0)
+        if risposta.status_code != 200:
+            raise RuntimeError(f"DELETE ha risposto {risposta.status_code}: {risposta.json}")
+    durata = time.perf_counter() - inizio
+    report["delete_singole"] = {
+        "durata_s": round(durata, 3),
+        "appuntamenti_al_secondo": round(len(appuntamenti) / durata),
+        "rimasti": conta_rimasti(modulo, app),
+        "per_richiesta": riassunto_latenze(latenze),
+    }
+
+    # Cancellazione di massa, nelle due varianti
+    for nome, libera_slot in (("massa_libera_slot", True), ("massa_elimina_slot", False)):
+        appuntamenti = prenota_tutto(modulo, app, slot_medico, args.pazienti)
+        t0 = time.perf_counter()
+        risposta = client.post(f"/api/medici/{medico_id}/appuntamenti/cancellazione",
+                               json={"dal": "2000-01-01T00:00", "al": "2100-01-01T00:00", "libera_slot": libera_slot},
+                               headers={"Authorization": f"Bearer {token_admin}"})
+        durata = time.perf_counter() - t0
+        if risposta.status_code != 200:
+            raise RuntimeError(f"cancellazione di massa ha risposto {risposta.status_code}: {risposta.json}")
+        report[nome] = {
+            "durata_s": round(durata, 3),
+            "appuntamenti_al_secondo": round(risposta.json["cancellati"] / durata),
+            "cancellati": risposta.json["cancellati"],
+            "pazienti_da_avvisare": len(risposta.json["pazienti"]),
+            "byte_risposta": len(risposta.data),
+            "rimasti": conta_rimasti(modulo, app),
+        }
+    stampa_report(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+# backend/benchmarks/comune.py
+
+import datetime
+import importlib
+import json
+import math
+import os
+import sys
+import tempfile
+
+from sqlalchemy import insert, select
+
+
+def database_temporaneo(nome="benchmark.db"):
+    """ Restituisce l'URL di un database SQLite in una cartella temporanea """
+    cartella = tempfile.mkdtemp(prefix="salute_facile_bench_")
+    return "sqlite:///" + os.path.join(cartella, nome)
+
+
+def carica_app(database_url):
+    """
+    Importa il modulo app puntandolo al database indicato. L'import non crea nulla:
+    l'app e il suo engine nascono al primo accesso a modulo.app, che legge
+    DATABASE_URL in quel momento, quindi la variabile va impostata prima.
+    """
+    os.environ["DATABASE_URL"] = database_url
+    # I benchmark generano apposta molte richieste dallo stesso client: i limiti di frequenza
+    # restano spenti, salvo che il benchmark li attivi esplicitamente
+    os.environ.setdefault("LIMITI_ABILITATI", "false")
+    cartella_backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if cartella_backend not in sys.path:
+        sys.path.insert(0, cartella_backend)
+    return importlib.import_module("app")
+
+
+def crea_dati_di_prova(modulo, app, num_medici, slot_per_medico, num_pazienti):
+    """
+    Ricrea lo schema e inserisce medici, slot liberi da 15 minuti a partire da domani
+    e pazienti. Restituisce gli id degli slot e un JWT per ogni paziente.
+    """
+    db = modulo.db
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        db.session.execute(insert(modulo.Medico), [
+            {"nome_completo": f"Dott. Benchmark {i}", "specializzazione": "Cardiologia"}
+            for i in range(num_medici)
+        ])
+        medici_ids = [riga[0] for riga in db.session.execute(select(modulo.Medico.id))]
+
+        inizio = datetime.datetime.now().replace(minute=0, second=0, microsecond=0) + datetime.timedelta(days=1)
+        db.session.execute(insert(modulo.Disponibilita), [
+            {
+                "medico_id": medico_id,
+                "data_inizio": inizio + datetime.timedelta(minutes=15 * i),
+                "data_fine": inizio + datetime.timedelta(minutes=15 * (i + 1)),
+                "è_prenotato": False,
+            }
+            for medico_id in medici_ids
+            for i in range(slot_per_medico)
+        ])
+        if num_pazienti:
+            # L'hash non viene mai verificato: i clienti usano direttamente un JWT
+            db.session.execute(insert(modulo.Utente), [
+                {
+                    "email": f"paziente{i}@bench.local",
+                    "password_hash": "non-usato",
+                    "nome": "Paziente",
+                    "cognome": str(i),
+                    "ruolo": "paziente",
+                }
+                for i in range(num_pazienti)
+            ])
+        db.session.commit()
+
+        slot_ids = [riga[0] for riga in db.session.execute(select(modulo.Disponibilita.id))]
+        utenti_ids = [riga[0] for riga in db.session.execute(select(modulo.Utente.id))]
+        tokens = [modulo.create_access_token(identity=str(uid)) for uid in utenti_ids]
+    return slot_ids, tokens
+
+
+def percentile(valori, p):
+    """ Percentile con metodo nearest-rank su una lista di valori """
+    if not valori:
+        return 0.0
+    ordinati = sorted(valori)
+    indice = max(0, math.ceil(p / 100 * len(ordinati)) - 1)
+    return ordinati[indice]
+
+
+def riassunto_latenze(latenze):
+    """ Statistiche di latenza in millisecondi a partire da durate in secondi """
+    return {
+        "richieste": len(latenze),
+        "media_ms": round(sum(latenze) / len(latenze) * 1000, 3) if latenze else 0.0,
+        "p50_ms": round(percentile(latenze, 50) * 1000, 3),
+        "p95_ms": round(percentile(latenze, 95) * 1000, 3),
+        "p99_ms": round(percentile(latenze, 99) * 1000, 3),
+        "max_ms": round(max(latenze) * 1000, 3) if latenze else 0.0,
+    }
+
+
+def stampa_report(report):
+    """ Stampa il report in JSON, così che esecuzioni diverse si possano confrontare """
+    print(json.dumps(report, indent=2, ensure_ascii=False))
@@ -0,0 +1,154 @@
+# backend/benchmarks/esportazione_agenda.py
+#
+# Esportazione dell'agenda di un medico (GET /api/medici/<id>/agenda) su un
+# dataset con un milione di appuntamenti dello stesso medico. Ogni misura gira in
+# un interprete nuovo, così il picco di memoria (VmHWM) riguarda solo
+# l'esportazione: per intervalli sempre più ampi si riportano righe al secondo,
+# byte prodotti e picco di RSS, in CSV e iCalendar. Come riferimento, la stessa
+# esportazione costruita in memoria con .all() prima di rispondere.
+# Con la configurazione predefinita parte del picco è la cache di SQLite (fino a
+# SQLITE_CACHE_SIZE_KIB) e le pagine del file mappate in memoria (fino a
+# SQLITE_MMAP_SIZE), che crescono con le pagine lette ma hanno un tetto: la prova
+# "csv_tutto_cache_sqlite_ridotta" le riduce per mostrare la sola parte Python.
+#
+# Esempio:
+#   python -m benchmarks.esportazione_agenda --appuntamenti 1000000
+
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import sys
+import time
+
+from sqlalchemy import select, text
+
+from benchmarks.comune import carica_app, database_temporaneo, stampa_report
+
+CARTELLA_BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INIZIO_DATI = datetime.datetime(2020, 1, 1)
+
+
+def memoria_mib(campo):
+    """ VmRSS (attuale) o VmHWM (picco) del processo da /proc/self/status, in MiB """
+    with open("/proc/self/status") as f:
+        for riga in f:
+            if riga.startswith(campo + ":"):
+                return int(riga.split()[1]) / 1024
+    return 0.0
+
+
+def crea_dataset(modulo, num_appuntamenti, num_pazienti):
+    """ Un medico con num_appuntamenti slot da 15 minuti tutti prenotati, a rotazione tra i pazienti """
+    app, db = modulo.app, modulo.db
+    with app.app_context():
+        modulo.prepara_schema()
+        db.session.execute(modulo.Medico.__table__.insert(),
+                           [{"nome_completo": "Dott. Benchmark Agenda", "specializzazione": "Cardiologia"}])
+        db.session.execute(modulo.Utente.__table__.insert(), [
+            {"email": f"paziente{i}@bench.local", "password_hash": "non-usato", "nome": "Paziente",
+             "cognome": str(i), "ruolo": "paziente"}
+            for i in range(num_pazienti)
+        ] + [{"email": "admin@bench.local", "password_hash": "non-usato", "nome": "Admin",
+              "cognome": "Benchmark", "ruolo": "admin"}])
+        medico_id = db.session.execute(select(modulo.Medico.id)).scalar()
+        passo = datetime.timedelta(minutes=15)
+        for inizio_blocco in range(0, num_appuntamenti, 100000):
+            modulo.inserisci_slot_in_blocco([
+                (medico_id, INIZIO_DATI + passo * i, INIZIO_DATI + passo * (i + 1))
+                for i in range(inizio_blocco, min(num_appuntamenti, inizio_blocco + 100000))
+            ], prenotato=True)
+        db.session.execute(text(
+            "INSERT INTO appuntamenti (paziente_id, disponibilita_id, stato, data_prenotazione) "
+            "SELECT 1 + d.id % :pazienti, d.id, 'Confermato', d.data_inizio FROM disponibilita d"
+        ), {"pazienti": num_pazienti})
+        db.session.commit()
+        admin_id = db.session.execute(
+            select(modulo.Utente.id).where(modulo.Utente.ruolo == "admin")
+        ).scalar()
+        return medico_id, modulo.create_access_token(identity=str(admin_id))
+
+
+def misura(medico_id, token, giorni, formato, in_memoria):
+    """ Eseguita in un interprete nuovo: una esportazione, letta a blocchi come farebbe un client """
+    import app as modulo
+
+    client = modulo.app.test_client()
+    fine = INIZIO_DATI + datetime.timedelta(days=giorni)
+    url = f"/api/medici/{medico_id}/agenda?formato={formato}&from={INIZIO_DATI.isoformat()}&to={fine.isoformat()}"
+    client.get(f"/api/medici/{medico_id}/agenda?formato={formato}&from=2000-01-01&to=2000-01-02",
+               headers={"Authorization": f"Bearer {token}"})  # riscaldamento
+    rss_iniziale = memoria_mib("VmRSS")
+    t0 = time.perf_counter()
+    if in_memoria:
+        # Riferimento: tutte le righe in una lista e il corpo costruito per intero prima di rispondere
+        with modulo.app.app_context():
+            righe = list(modulo.righe_agenda(medico_id, INIZIO_DATI, fine))
+            genera = modulo.csv_in_streaming if formato == "csv" else modulo.ics_in_streaming
+            argomento = modulo.COLONNE_AGENDA if formato == "csv" else "Agenda"
+            sorgente = righe if formato == "csv" else list(modulo.eventi_agenda(righe))
+            corpo = b"".join(genera(sorgente, argomento))
+            byte, num_righe = len(corpo), len(righe)
+    else:
+        risposta = client.get(url, headers={"Authorization": f"Bearer {token}"}, buffered=False)
+        if risposta.status_code != 200:
+            raise RuntimeError(f"esportazione ha risposto {risposta.status_code}")
+        byte = num_righe = 0
+        for blocco in risposta.response:
+            byte += len(blocco)
+            num_righe += blocco.count(b"\n" if formato == "csv" else b"BEGIN:VEVENT")
+        risposta.close()
+        if formato == "csv":
+            num_righe -= 1  # intestazione
+    durata = time.perf_counter() - t0
+    return {
+        "righe": num_righe,
+        "mib": round(byte / 2 ** 20, 1),
+        "durata_s": round(durata, 2),
+        "righe_al_secondo": round(num_righe / durata) if durata else 0,
+        "rss_iniziale_mib": round(rss_iniziale, 1),
+        # Non ru_maxrss: dopo fork ed exec riporta anche il picco del processo padre
+        "picco_rss_mib": round(memoria_mib("VmHWM"), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Esportazione in streaming dell'agenda di un medico")
+    parser.add_argument("--appuntamenti", type=int, default=1000000)
+    parser.add_argument("--pazienti", type=int, default=10000)
+    parser.add_argument("--misura", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.misura:
+        print(json.dumps(misura(**json.loads(args.misura))))
+        return
+
+    database_url = database_temporaneo("agenda.db")
+    modulo = carica_app(database_url)
+    t0 = time.perf_counter()
+    medico_id, token = crea_dataset(modulo, args.appuntamenti, args.pazienti)
+    report = {"appuntamenti": args.appuntamenti, "creazione_dataset_s": round(time.perf_counter() - t0, 1)}
+
+    giorni_totali = args.appuntamenti // 96 + 1  # 96 slot da 15 minuti al giorno
+    intervalli = {"30_giorni": 30, "1_anno": 365, "tutto": giorni_totali}
+    ambiente = dict(os.environ, DATABASE_URL=database_url)
+    prove = [(f"{formato}_{nome}", giorni, formato, False)
+             for formato in ("csv", "ics") for nome, giorni in intervalli.items()]
+    prove += [("csv_tutto_in_memoria", giorni_totali, "csv", True)]
+    ridotta = dict(ambiente, SQLITE_MMAP_SIZE="0", SQLITE_CACHE_SIZE_KIB="2000")
+    prove = [prova + (ambiente,) for prova in prove]
+    prove += [("csv_tutto_cache_sqlite_ridotta", giorni_totali, "csv", False, ridotta)]
+    for nome, giorni, formato, in_memoria, ambiente_prova in prove:
+        parametri = json.dumps({"medico_id": medico_id, "token": token, "giorni": giorni,
+                                "formato": formato, "in_memoria": in_memoria})
+        uscita = subprocess.run(
+            [sys.executable, "-m", "benchmarks.esportazione_agenda", "--misura", parametri],
+            cwd=CARTELLA_BACKEND, env=ambiente_prova, capture_output=True, text=True, check=True,
+        )
+        report[nome] = json.loads(uscita.stdout.strip().splitlines()[-1])
+    stampa_report(report)
+
+
+if __name__ == '__main__':
+    main()
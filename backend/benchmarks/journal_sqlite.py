@@ -0,0 +1,102 @@
+# backend/benchmarks/journal_sqlite.py
+#
+# Carico misto su SQLite: molti lettori sulle disponibilità e sugli appuntamenti
+# e alcuni client che prenotano nello stesso momento. Confronta la configurazione
+# predefinita di SQLite (journal DELETE, synchronous FULL) con WAL e i pragma
+# usati dall'app.
+#
+# Esempio:
+#   python -m benchmarks.journal_sqlite --lettori 16 --prenotatori 4 --durata 10
+
+import argparse
+import random
+import threading
+import time
+
+from benchmarks.comune import (
+    carica_app, crea_dati_di_prova, database_temporaneo, riassunto_latenze, stampa_report
+)
+
+CONFIGURAZIONI = {
+    # Valori di default di SQLite, senza i pragma dell'app
+    "predefinita": {
+        "SQLITE_JOURNAL_MODE": "DELETE",
+        "SQLITE_SYNCHRONOUS": "FULL",
+        "SQLITE_CACHE_SIZE_KIB": 2000,
+        "SQLITE_MMAP_SIZE": 0,
+    },
+    "wal": {
+        "SQLITE_JOURNAL_MODE": "WAL",
+        "SQLITE_SYNCHRONOUS": "NORMAL",
+    },
+}
+
+
+def lettore(client, medici_ids, token, fine, risultati):
+    rng = random.Random()
+    headers = {"Authorization": f"Bearer {token}"}
+    while time.perf_counter() < fine:
+        if rng.random() < 0.7:
+            url, kwargs = f"/api/medici/{rng.choice(medici_ids)}/disponibilita", {}
+        else:
+            url, kwargs = "/api/appuntamenti", {"headers": headers}
+        t0 = time.perf_counter()
+        risposta = client.get(url, **kwargs)
+        risultati.append((risposta.status_code, time.perf_counter() - t0))
+
+
+def prenotatore(client, slot_ids, token, fine, risultati):
+    rng = random.Random()
+    headers = {"Authorization": f"Bearer {token}"}
+    while time.perf_counter() < fine:
+        t0 = time.perf_counter()
+        risposta = client.post("/api/appuntamenti", json={"disponibilita_id": rng.choice(slot_ids)}, headers=headers)
+        risultati.append((risposta.status_code, time.perf_counter() - t0))
+
+
+def esegui(modulo, nome, config, args):
+    app = modulo.create_app({"SQLALCHEMY_DATABASE_URI": database_temporaneo(f"{nome}.db"), **config})
+    slot_ids, tokens = crea_dati_di_prova(modulo, app, num_medici=args.medici, slot_per_medico=args.slot,
+                                          num_pazienti=args.lettori + args.prenotatori)
+    medici_ids = list(range(1, args.medici + 1))
+
+    letture, prenotazioni = [], []
+    fine = time.perf_counter() + args.durata
+    threads = [
+        threading.Thread(target=lettore, args=(app.test_client(), medici_ids, tokens[i], fine, letture))
+        for i in range(args.lettori)
+    ] + [
+        threading.Thread(target=prenotatore, args=(app.test_client(), slot_ids, tokens[args.lettori + i], fine, prenotazioni))
+        for i in range(args.prenotatori)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    errori = sum(1 for stato, _ in letture + prenotazioni if stato >= 500)
+    return {
+        "letture_rps": round(len(letture) / args.durata, 1),
+        "prenotazioni_rps": round(len(prenotazioni) / args.durata, 1),
+        "latenza_letture": riassunto_latenze([lat for _, lat in letture]),
+        "latenza_prenotazioni": riassunto_latenze([lat for _, lat in prenotazioni]),
+        "errori_5xx": errori,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Confronto journal DELETE e WAL su carico misto")
+    parser.add_argument("--lettori", type=int, default=16)
+    parser.add_argument("--prenotatori", type=int, default=4)
+    parser.add_argument("--medici", type=int, default=20)
+    parser.add_argument("--slot", type=int, default=500, help="slot liberi per medico")
+    parser.add_argument("--durata", type=float, default=10.0, help="secondi di carico per configurazione")
+    args = parser.parse_args()
+
+    modulo = carica_app(database_temporaneo("import.db"))
+    report = {nome: esegui(modulo, nome, config, args) for nome, config in CONFIGURAZIONI.items()}
+    stampa_report(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+# backend/benchmarks/limiti_frequenza.py
+#
+# Costo dei limiti di frequenza. Prima i secchi da soli: consumi al secondo in
+# memoria e sul file SQLite condiviso, con più thread e con molte più chiavi di
+# LIMITI_MAX_CHIAVI (quindi con gli scarti LRU attivi). Poi l'overhead per
+# richiesta su POST /api/login (utente inesistente, quindi senza bcrypt: il costo
+# del limitatore non viene nascosto dall'hash) con limiti spenti, in memoria e su
+# SQLite, con limiti abbastanza alti da non rifiutare nessuna richiesta.
+#
+# Esempio:
+#   python -m benchmarks.limiti_frequenza --consumi 200000 --richieste 3000 --giri 3
+
+import argparse
+import importlib
+import os
+import tempfile
+import threading
+import time
+
+from benchmarks.comune import carica_app, database_temporaneo, riassunto_latenze, stampa_report
+
+
+def consumi_al_secondo(secchi, consumi, thread, chiavi):
+    def lavora(indice):
+        for i in range(indice, consumi, thread):
+            secchi.consuma(f"bench:ip:{i % chiavi}", 1000, 1000.0)
+
+    lavoratori = [threading.Thread(target=lavora, args=(i,)) for i in range(thread)]
+    inizio = time.perf_counter()
+    for lavoratore in lavoratori:
+        lavoratore.start()
+    for lavoratore in lavoratori:
+        lavoratore.join()
+    durata = time.perf_counter() - inizio
+    return {"consumi_al_secondo": round(consumi / durata), "us_per_consumo": round(durata / consumi * 1e6, 2),
+            "chiavi_in_memoria": len(secchi)}
+
+
+def latenze_login(client, richieste):
+    latenze = []
+    for i in range(richieste):
+        t0 = time.perf_counter()
+        risposta = client.post("/api/login", json={"email": f"nessuno{i % 1000}@bench.local", "password": "x"},
+                               environ_base={"REMOTE_ADDR": f"10.0.{i % 250}.{i % 200}"})
+        latenze.append(time.perf_counter() - t0)
+        if risposta.status_code != 401:
+            raise RuntimeError(f"/api/login ha risposto {risposta.status_code}")
+    return riassunto_latenze(latenze)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Overhead dei limiti di frequenza")
+    parser.add_argument("--consumi", type=int, default=200000)
+    parser.add_argument("--thread", type=int, default=8)
+    parser.add_argument("--chiavi", type=int, default=50000, help="chiavi distinte nei consumi")
+    parser.add_argument("--max-chiavi", type=int, default=10000, help="LIMITI_MAX_CHIAVI dei secchi in memoria")
+    parser.add_argument("--richieste", type=int, default=3000, help="richieste di login per giro")
+    parser.add_argument("--giri", type=int, default=3)
+    args = parser.parse_args()
+
+    os.environ["LIMITI_ABILITATI"] = "true"
+    os.environ["LIMITE_LOGIN_IP"] = os.environ["LIMITE_LOGIN_UTENTE"] = "1000000/1"
+    modulo = carica_app(database_temporaneo("limiti.db"))
+    limiti = importlib.import_module("limiti")
+    with modulo.app.app_context():
+        modulo.db.create_all()
+    file_secchi = os.path.join(tempfile.mkdtemp(prefix="salute_facile_bench_"), "secchi.db")
+
+    report = {"secchi": {}}
+    for nome, crea in (("memoria", lambda: limiti.SecchiInMemoria(args.max_chiavi)),
+                       ("sqlite", lambda: limiti.SecchiSQLite(file_secchi, 60))):
+        report["secchi"][nome] = {
+            "1_thread": consumi_al_secondo(crea(), args.consumi, 1, args.chiavi),
+            f"{args.thread}_thread": consumi_al_secondo(crea(), args.consumi, args.thread, args.chiavi),
+        }
+
+    client = modulo.app.test_client()
+    limitatore = modulo.limitatore
+    configurazioni = {"senza_limiti": (False, limitatore.secchi),
+                      "memoria": (True, limiti.SecchiInMemoria(100000)),
+                      "sqlite": (True, limiti.SecchiSQLite(file_secchi, 60))}
+    latenze_login(client, 200)  # riscaldamento
+    # Le differenze sono di pochi microsecondi: le configurazioni si alternano per più giri
+    # e di ciascuna si tiene il giro con la media più bassa
+    report["login"] = {}
+    for _ in range(args.giri):
+        for nome, (abilitato, secchi) in configurazioni.items():
+            limitatore.abilitato, limitatore.secchi = abilitato, secchi
+            risultato = latenze_login(client, args.richieste)
+            if nome not in report["login"] or risultato["media_ms"] < report["login"][nome]["media_ms"]:
+                report["login"][nome] = risultato
+    base = report["login"]["senza_limiti"]["media_ms"]
+    for nome in ("memoria", "sqlite"):
+        report["login"][nome]["overhead_medio_us"] = round((report["login"][nome]["media_ms"] - base) * 1000, 1)
+    stampa_report(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+# backend/benchmarks/prenotazioni_concorrenti.py
+#
+# Benchmark di contesa su POST /api/appuntamenti: N clienti concorrenti
+# cercano di prenotare M slot. Misura throughput, latenza e verifica che
+# nessuno slot venga prenotato due volte.
+#
+# Esempio:
+#   python -m benchmarks.prenotazioni_concorrenti --clienti 32 --slot 50 --tentativi 20
+
+import argparse
+import random
+import threading
+import time
+
+from sqlalchemy import func, select
+
+from benchmarks.comune import (
+    carica_app, crea_dati_di_prova, database_temporaneo, riassunto_latenze, stampa_report
+)
+
+
+def esegui_cliente(app, token, slot_ids, tentativi, barriera, risultati, intervalli, lock):
+    """ Un cliente prova a prenotare slot casuali e registra esito e latenza di ogni richiesta """
+    client = app.test_client()
+    headers = {"Authorization": f"Bearer {token}"}
+    rng = random.Random(token)
+    locali = []
+    barriera.wait()
+    inizio = time.perf_counter()
+    for _ in range(tentativi):
+        slot_id = rng.choice(slot_ids)
+        t0 = time.perf_counter()
+        risposta = client.post("/api/appuntamenti", json={"disponibilita_id": slot_id}, headers=headers)
+        locali.append((risposta.status_code, time.perf_counter() - t0))
+    fine = time.perf_counter()
+    with lock:
+        intervalli.append((inizio, fine))
+        risultati.extend(locali)
+
+
+def conta_doppie_prenotazioni(modulo, successi):
+    """
+    Una doppia prenotazione è un 201 in più rispetto agli slot effettivamente occupati,
+    oppure uno slot con più di un appuntamento o uno stato incoerente tra le due tabelle.
+    """
+    db, Appuntamento, Disponibilita = modulo.db, modulo.Appuntamento, modulo.Disponibilita
+    with modulo.app.app_context():
+        slot_occupati = db.session.execute(
+            select(func.count(func.distinct(Appuntamento.disponibilita_id)))
+        ).scalar()
+        slot_multipli = db.session.execute(
+            select(func.count()).select_from(
+                select(Appuntamento.disponibilita_id)
+                .group_by(Appuntamento.disponibilita_id)
+                .having(func.count() > 1)
+                .subquery()
+            )
+        ).scalar()
+        flag_senza_appuntamento = db.session.execute(
+            select(func.count()).select_from(Disponibilita)
+            .outerjoin(Appuntamento, Appuntamento.disponibilita_id == Disponibilita.id)
+            .where(Disponibilita.è_prenotato.is_(True), Appuntamento.id.is_(None))
+        ).scalar()
+    return max(0, successi - slot_occupati) + slot_multipli + flag_senza_appuntamento
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark di contesa sulle prenotazioni")
+    parser.add_argument("--clienti", type=int, default=32, help="numero di clienti concorrenti (N)")
+    parser.add_argument("--slot", type=int, default=50, help="numero di slot contesi (M)")
+    parser.add_argument("--tentativi", type=int, default=20, help="richieste di prenotazione per cliente")
+    parser.add_argument("--database-url", default=None, help="database da usare (default: SQLite temporaneo)")
+    args = parser.parse_args()
+
+    modulo = carica_app(args.database_url or database_temporaneo("prenotazioni.db"))
+    slot_ids, tokens = crea_dati_di_prova(modulo, modulo.app, num_medici=1, slot_per_medico=args.slot,
+                                          num_pazienti=args.clienti)
+
+    risultati, intervalli, lock = [], [], threading.Lock()
+    barriera = threading.Barrier(args.clienti)
+    threads = [
+        threading.Thread(
+            target=esegui_cliente,
+            args=(modulo.app, token, slot_ids, args.tentativi, barriera, risultati, intervalli, lock),
+        )
+        for token in tokens
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    # Tempi presi dai clienti: il thread principale potrebbe non essere schedulato subito dopo la barriera
+    durata = max(fine for _, fine in intervalli) - min(inizio for inizio, _ in intervalli)
+
+    stati = {}
+    for stato, _ in risultati:
+        stati[stato] = stati.get(stato, 0) + 1
+    successi = stati.get(201, 0)
+    doppie = conta_doppie_prenotazioni(modulo, successi)
+
+    report = {
+        "clienti": args.clienti,
+        "slot": args.slot,
+        "richieste": len(risultati),
+        "durata_s": round(durata, 3),
+        "throughput_rps": round(len(risultati) / durata, 1) if durata else 0.0,
+        "esiti": {str(k): v for k, v in sorted(stati.items())},
+        "latenza": riassunto_latenze([lat for _, lat in risultati]),
+        "doppie_prenotazioni": doppie,
+    }
+    stampa_report(report)
+    if doppie or set(stati) - {201, 409}:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
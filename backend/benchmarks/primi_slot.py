@@ -0,0 +1,72 @@
+# backend/benchmarks/primi_slot.py
+#
+# Latenza di /api/disponibilita/prime-libere al crescere del numero di medici,
+# per una specializzazione comune e per una con un solo medico.
+#
+# Esempio:
+#   python -m benchmarks.primi_slot --medici 1000 10000 50000 --giorni 3
+
+import argparse
+import datetime
+import importlib
+import time
+
+from sqlalchemy import insert
+
+from benchmarks.comune import carica_app, database_temporaneo, riassunto_latenze, stampa_report
+
+
+def aggiungi_medico_raro(modulo, app):
+    """ Un medico con una specializzazione che nessun altro ha, con pochi slot tra una settimana """
+    with app.app_context():
+        db = modulo.db
+        medico_id = db.session.execute(
+            insert(modulo.Medico).values(nome_completo="Dott. Raro", specializzazione="Medicina del sonno")
+        ).inserted_primary_key[0]
+        inizio = datetime.datetime.now().replace(hour=9, minute=0, second=0, microsecond=0) + datetime.timedelta(days=7)
+        modulo.inserisci_slot_in_blocco([
+            (medico_id, inizio + datetime.timedelta(hours=i), inizio + datetime.timedelta(hours=i, minutes=30))
+            for i in range(8)
+        ])
+        db.session.commit()
+
+
+def misura(client, url, ripetizioni):
+    latenze = []
+    for _ in range(ripetizioni):
+        t0 = time.perf_counter()
+        risposta = client.get(url)
+        latenze.append(time.perf_counter() - t0)
+    return {"risultati": len(risposta.get_json()), **riassunto_latenze(latenze)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latenza della ricerca del primo slot libero per specializzazione")
+    parser.add_argument("--medici", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--giorni", type=int, default=3)
+    parser.add_argument("--limite", type=int, default=10)
+    parser.add_argument("--ripetizioni", type=int, default=200)
+    args = parser.parse_args()
+
+    modulo = carica_app(database_temporaneo("import.db"))
+    seed = importlib.import_module("seed")
+    report = {}
+    for num_medici in args.medici:
+        app = modulo.create_app({"SQLALCHEMY_DATABASE_URI": database_temporaneo(f"primi_slot_{num_medici}.db")})
+        # seed.py genera i dati nel database della sua app: la si punta al database di questo giro
+        seed.app = app
+        seed.genera_dati_sintetici(num_medici=num_medici, giorni=args.giorni, num_pazienti=0)
+        aggiungi_medico_raro(modulo, app)
+
+        client = app.test_client()
+        report[f"{num_medici}_medici"] = {
+            "comune": misura(client, f"/api/disponibilita/prime-libere?specializzazione=Cardiologia&limit={args.limite}",
+                             args.ripetizioni),
+            "rara": misura(client, f"/api/disponibilita/prime-libere?specializzazione=Medicina%20del%20sonno&limit={args.limite}",
+                           args.ripetizioni),
+        }
+    stampa_report(report)
+
+
+if __name__ == '__main__':
+    main()
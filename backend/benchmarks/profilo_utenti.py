@@ -0,0 +1,66 @@
+# backend/benchmarks/profilo_utenti.py
+#
+# Richieste al secondo su GET /api/profilo in tre modalità: profilo letto dai
+# claim del token (come dopo il login), token senza claim con la cache dei
+# profili attiva e token senza claim con la cache disattivata (una query per
+# richiesta). Le richieste passano dal test client di Flask, senza rete.
+#
+# Esempio:
+#   python -m benchmarks.profilo_utenti --utenti 1000 --richieste 5000
+
+import argparse
+import time
+
+from sqlalchemy import select
+
+from benchmarks.comune import carica_app, crea_dati_di_prova, database_temporaneo, riassunto_latenze, stampa_report
+
+
+def misura(client, tokens, richieste):
+    latenze = []
+    inizio = time.perf_counter()
+    for i in range(richieste):
+        t0 = time.perf_counter()
+        risposta = client.get("/api/profilo", headers={"Authorization": f"Bearer {tokens[i % len(tokens)]}"})
+        latenze.append(time.perf_counter() - t0)
+        if risposta.status_code != 200:
+            raise RuntimeError(f"/api/profilo ha risposto {risposta.status_code}")
+    durata = time.perf_counter() - inizio
+    return {"richieste_al_secondo": round(richieste / durata), **riassunto_latenze(latenze)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Richieste al secondo di /api/profilo con e senza cache")
+    parser.add_argument("--utenti", type=int, default=1000)
+    parser.add_argument("--richieste", type=int, default=5000)
+    args = parser.parse_args()
+
+    modulo = carica_app(database_temporaneo("profilo.db"))
+    app = modulo.app
+    # I token senza claim sono quelli emessi prima che il profilo venisse incluso nel JWT
+    _, tokens_senza_claims = crea_dati_di_prova(modulo, app, num_medici=1, slot_per_medico=1,
+                                                num_pazienti=args.utenti)
+    with app.app_context():
+        utenti = modulo.db.session.execute(select(modulo.Utente)).scalars().all()
+        tokens_con_claims = [
+            modulo.create_access_token(identity=str(u.id), additional_claims=modulo.claims_profilo(u))
+            for u in utenti
+        ]
+
+    client = app.test_client()
+    cache = modulo.cache_utenti
+    ttl = cache.ttl
+    report = {"utenti": args.utenti}
+    try:
+        report["claims_jwt"] = misura(client, tokens_con_claims, args.richieste)
+        cache.invalida()
+        report["cache_profili"] = misura(client, tokens_senza_claims, args.richieste)
+        cache.ttl = 0
+        report["senza_cache"] = misura(client, tokens_senza_claims, args.richieste)
+    finally:
+        cache.ttl = ttl
+    stampa_report(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+# backend/benchmarks/query_appuntamenti.py
+#
+# Verifica che GET /api/appuntamenti esegua un numero costante di query SQL,
+# qualunque sia il numero di appuntamenti del paziente, e ne misura la latenza.
+# Termina con codice 1 se il numero di query cresce con gli appuntamenti.
+#
+# Esempio:
+#   python -m benchmarks.query_appuntamenti --dimensioni 1 10 100 1000
+
+import argparse
+import datetime
+import time
+
+from sqlalchemy import event, insert
+
+from benchmarks.comune import carica_app, database_temporaneo, riassunto_latenze, stampa_report
+
+
+def crea_paziente_con_appuntamenti(modulo, indice, num_appuntamenti):
+    """ Crea un paziente con num_appuntamenti visite, metà passate e metà future, su medici diversi """
+    db = modulo.db
+    utente = modulo.Utente(email=f"storico{indice}@bench.local", password_hash="non-usato", nome="Paziente", cognome=str(indice))
+    db.session.add(utente)
+    medici = [modulo.Medico(nome_completo=f"Dott. Bench {indice}-{i}", specializzazione="Cardiologia") for i in range(5)]
+    db.session.add_all(medici)
+    db.session.flush()
+
+    base = datetime.datetime.now().replace(second=0, microsecond=0) - datetime.timedelta(days=num_appuntamenti // 2)
+    slot_ids = []
+    for i in range(num_appuntamenti):
+        inizio = base + datetime.timedelta(days=i)
+        risultato = db.session.execute(insert(modulo.Disponibilita).values(
+            medico_id=medici[i % len(medici)].id,
+            data_inizio=inizio,
+            data_fine=inizio + datetime.timedelta(minutes=30),
+            è_prenotato=True,
+        ))
+        slot_ids.append(risultato.inserted_primary_key[0])
+    if slot_ids:
+        db.session.execute(insert(modulo.Appuntamento), [
+            {"paziente_id": utente.id, "disponibilita_id": slot_id} for slot_id in slot_ids
+        ])
+    db.session.commit()
+    return utente.id
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Numero di query e latenza di GET /api/appuntamenti")
+    parser.add_argument("--dimensioni", type=int, nargs="+", default=[1, 10, 100, 500],
+                        help="numero di appuntamenti per paziente da provare")
+    parser.add_argument("--ripetizioni", type=int, default=50)
+    args = parser.parse_args()
+
+    modulo = carica_app(database_temporaneo("appuntamenti.db"))
+    app, db = modulo.app, modulo.db
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        pazienti = {
+            n: crea_paziente_con_appuntamenti(modulo, i, n) for i, n in enumerate(args.dimensioni)
+        }
+        tokens = {n: modulo.create_access_token(identity=str(uid)) for n, uid in pazienti.items()}
+        engine = db.engine
+
+    conteggio = {"query": 0}
+
+    def conta_query(*_):
+        conteggio["query"] += 1
+
+    event.listen(engine, "before_cursor_execute", conta_query)
+
+    client = app.test_client()
+    risultati = {}
+    for n, token in tokens.items():
+        headers = {"Authorization": f"Bearer {token}"}
+        conteggio["query"] = 0
+        # limit alto per serializzare tutti gli appuntamenti in una sola pagina
+        risposta = client.get("/api/appuntamenti?limit=500", headers=headers)
+        query_eseguite = conteggio["query"]
+        latenze = []
+        for _ in range(args.ripetizioni):
+            t0 = time.perf_counter()
+            client.get("/api/appuntamenti?limit=500", headers=headers)
+            latenze.append(time.perf_counter() - t0)
+        risultati[str(n)] = {
+            "appuntamenti_restituiti": len(risposta.get_json()),
+            "query_sql": query_eseguite,
+            "latenza": riassunto_latenze(latenze),
+        }
+
+    event.remove(engine, "before_cursor_execute", conta_query)
+
+    costante = len({r["query_sql"] for r in risultati.values()}) == 1
+    stampa_report({"query_costanti": costante, "per_dimensione": risultati})
+    if not costante:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+# backend/benchmarks/ricerca_medici.py
+#
+# Latenza della ricerca medici (/api/medici?q=&specializzazione=) su un catalogo
+# sintetico grande. Confronta l'indice FTS5 con la ricerca LIKE senza indice.
+#
+# Esempio:
+#   python -m benchmarks.ricerca_medici --medici 50000
+
+import argparse
+import importlib
+import time
+import urllib.parse
+
+from benchmarks.comune import carica_app, database_temporaneo, riassunto_latenze, stampa_report
+
+RICERCHE = {
+    "parola": {"q": "cardiologia"},
+    "prefisso": {"q": "derm"},
+    "nome_e_cognome": {"q": "giulia bianchi"},
+    "testo_descrizione": {"q": "ecografiche ultima generazione"},
+    "con_specializzazione": {"q": "prevenzione", "specializzazione": "Neurologia"},
+    "solo_specializzazione": {"specializzazione": "Pediatria"},
+    "pagina_lontana": {"q": "pazienti", "offset": "2000"},
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latenza della ricerca medici con FTS5 e con LIKE")
+    parser.add_argument("--medici", type=int, default=50000)
+    parser.add_argument("--ripetizioni", type=int, default=100)
+    args = parser.parse_args()
+
+    modulo = carica_app(database_temporaneo("ricerca.db"))
+    seed = importlib.import_module("seed")
+    inizio = time.perf_counter()
+    seed.genera_dati_sintetici(num_medici=args.medici, giorni=0, num_pazienti=0)
+    durata_generazione = time.perf_counter() - inizio
+
+    client = modulo.app.test_client()
+    report = {"medici": args.medici, "generazione_con_indicizzazione_s": round(durata_generazione, 2), "ricerche": {}}
+    for nome, parametri in RICERCHE.items():
+        url = "/api/medici?" + urllib.parse.urlencode(parametri)
+        latenze = []
+        for _ in range(args.ripetizioni):
+            t0 = time.perf_counter()
+            risposta = client.get(url)
+            latenze.append(time.perf_counter() - t0)
+        corpo = risposta.get_json()
+
+        # Stessa ricerca senza indice full-text, chiamata direttamente
+        latenze_like = []
+        with modulo.app.app_context():
+            for _ in range(max(1, args.ripetizioni // 10)):
+                t0 = time.perf_counter()
+                modulo.cerca_medici_like(parametri.get("q", ""), parametri.get("specializzazione"),
+                                         20, int(parametri.get("offset", 0)))
+                latenze_like.append(time.perf_counter() - t0)
+
+        report["ricerche"][nome] = {
+            "parametri": parametri,
+            "totale": corpo["totale"],
+            "specializzazioni": len(corpo["facet"]),
+            "fts5": riassunto_latenze(latenze),
+            "like": riassunto_latenze(latenze_like),
+        }
+    stampa_report(report)
+
+
+if __name__ == '__main__':
+    main()
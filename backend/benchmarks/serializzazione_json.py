@@ -0,0 +1,98 @@
+# backend/benchmarks/serializzazione_json.py
+#
+# Costo della serializzazione delle liste più grandi: latenza con orjson e con
+# il modulo json della libreria standard, dimensione delle risposte con e senza
+# gzip, e memoria di picco del catalogo medici costruito in memoria o inviato a blocchi.
+#
+# Esempio:
+#   python -m benchmarks.serializzazione_json --medici 20000 --ripetizioni 50
+
+import argparse
+import importlib
+import time
+import tracemalloc
+
+from sqlalchemy import func, select
+
+from benchmarks.comune import carica_app, database_temporaneo, riassunto_latenze, stampa_report
+
+
+def misura(client, url, headers, ripetizioni):
+    latenze = []
+    for _ in range(ripetizioni):
+        t0 = time.perf_counter()
+        risposta = client.get(url, headers=headers)
+        risposta.get_data()
+        latenze.append(time.perf_counter() - t0)
+    return risposta, riassunto_latenze(latenze)
+
+
+def memoria_catalogo(modulo, client, massimo_in_memoria):
+    """ Picco di memoria allocata per servire il catalogo (senza cache) fino all'ultimo byte """
+    modulo.app.config["CATALOGO_MAX_RIGHE_IN_MEMORIA"] = massimo_in_memoria
+    modulo.cache_catalogo.invalida()
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    risposta = client.get("/api/medici")
+    byte = sum(len(blocco) for blocco in risposta.response)
+    durata = time.perf_counter() - t0
+    _, picco = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    risposta.close()
+    # Solo il catalogo tenuto in memoria ha l'ETag calcolato sul contenuto
+    return {"streaming": "ETag" not in risposta.headers, "byte": byte, "picco_mb": round(picco / 2 ** 20, 1),
+            "durata_ms": round(durata * 1000, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serializzazione JSON e compressione delle liste")
+    parser.add_argument("--medici", type=int, default=20000)
+    parser.add_argument("--giorni", type=int, default=5)
+    parser.add_argument("--ripetizioni", type=int, default=50)
+    args = parser.parse_args()
+
+    modulo = carica_app(database_temporaneo("serializzazione.db"))
+    serializzazione = importlib.import_module("serializzazione")
+    seed = importlib.import_module("seed")
+    seed.genera_dati_sintetici(num_medici=args.medici, giorni=args.giorni, num_pazienti=2000,
+                               giorni_passati=args.giorni, tasso_prenotazione=0.5)
+    with modulo.app.app_context():
+        db = modulo.db
+        # Il paziente con più appuntamenti
+        paziente_id = db.session.execute(
+            select(modulo.Appuntamento.paziente_id).group_by(modulo.Appuntamento.paziente_id)
+            .order_by(func.count().desc()).limit(1)
+        ).scalar()
+        token = modulo.create_access_token(identity=str(paziente_id))
+
+    client = modulo.app.test_client()
+    endpoint = {
+        "disponibilita_medico": ("/api/medici/1/disponibilita?limit=500", {}),
+        "disponibilita_100_medici": ("/api/disponibilita?limit=50&medico_ids=" + ",".join(map(str, range(1, 101))), {}),
+        "appuntamenti": ("/api/appuntamenti?limit=500", {"Authorization": f"Bearer {token}"}),
+    }
+    codificatori = {"orjson": serializzazione.codifica_json, "stdlib": serializzazione.codifica_json_stdlib}
+    report = {"orjson_disponibile": serializzazione.orjson is not None, "endpoint": {}}
+    try:
+        for nome, (url, headers) in endpoint.items():
+            voce = report["endpoint"][nome] = {}
+            for nome_codificatore, codificatore in codificatori.items():
+                serializzazione.codifica_json = codificatore
+                risposta, latenze = misura(client, url, headers, args.ripetizioni)
+                voce[nome_codificatore] = latenze
+            compressa, latenze_gzip = misura(client, url, {**headers, "Accept-Encoding": "gzip"}, args.ripetizioni)
+            voce["gzip"] = latenze_gzip
+            voce["byte"] = len(risposta.data)
+            voce["byte_gzip"] = len(compressa.data)
+    finally:
+        serializzazione.codifica_json = codificatori["orjson"]
+
+    report["catalogo"] = {
+        "in_memoria": memoria_catalogo(modulo, client, args.medici + 1),
+        "a_blocchi": memoria_catalogo(modulo, client, 0),
+    }
+    stampa_report(report)
+
+
+if __name__ == '__main__':
+    main()
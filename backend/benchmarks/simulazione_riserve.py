@@ -0,0 +1,166 @@
+# backend/benchmarks/simulazione_riserve.py
+#
+# Simulazione dell'apertura dell'agenda di un medico molto richiesto: molti
+# pazienti arrivano a ridosso dell'apertura, caricano gli slot, scelgono uno dei
+# primi orari e dopo un tempo di riflessione confermano. Si confrontano due
+# comportamenti del client:
+#   - senza riserve: la conferma arriva direttamente a POST /api/appuntamenti e
+#     chi trova lo slot già preso ricarica la lista e riprova;
+#   - con riserve: lo slot viene riservato appena selezionato
+#     (POST /api/disponibilita/<id>/riserva), i conflitti emergono subito e la
+#     conferma trasforma la riserva in appuntamento.
+# Gli eventi avvengono su un orologio simulato (nessuna attesa reale), ma ogni
+# richiesta passa dagli endpoint veri tramite il test client di Flask.
+#
+# Esempio:
+#   python -m benchmarks.simulazione_riserve --pazienti 300 --slot 60
+
+import argparse
+import heapq
+import random
+
+from sqlalchemy import func, select, update
+
+from benchmarks.comune import carica_app, crea_dati_di_prova, database_temporaneo, stampa_report
+
+
+class Simulazione:
+    def __init__(self, modulo, client, tokens, args, con_riserve):
+        self.modulo = modulo
+        self.client = client
+        self.tokens = tokens
+        self.args = args
+        self.con_riserve = con_riserve
+        self.caso = random.Random(args.seme)
+        self.eventi = []
+        self.sequenza = 0
+        self.conteggi = {
+            "conferme_inviate": 0, "conferme_in_conflitto": 0,
+            "riserve_inviate": 0, "riserve_in_conflitto": 0,
+            "ricaricamenti_lista": 0, "tentativi_ripetuti": 0,
+            "prenotati": 0, "rinunce": 0, "abbandoni": 0,
+        }
+        self.tempi_prenotazione = []
+
+    def pianifica(self, istante, azione, paziente, **stato):
+        self.sequenza += 1
+        heapq.heappush(self.eventi, (istante, self.sequenza, azione, paziente, stato))
+
+    def header(self, paziente):
+        return {"Authorization": f"Bearer {self.tokens[paziente]}"}
+
+    def scegli_slot(self, paziente, istante, stato):
+        """ Ricarica la lista e sceglie uno dei primi orari liberi, come fa chi apre la pagina del medico """
+        self.conteggi["ricaricamenti_lista"] += 1
+        slot = self.client.get(f"/api/medici/{self.args.medico_id}/disponibilita?limit=100").json
+        if not slot:
+            self.conteggi["rinunce"] += 1
+            return
+        stato["slot_id"] = self.caso.choice(slot[:self.args.preferiti])["id"]
+        # Il paziente guarda la lista prima di selezionare un orario
+        istante += self.caso.expovariate(1 / self.args.scelta)
+        if self.con_riserve:
+            self.pianifica(istante, "riserva", paziente, **stato)
+        else:
+            self.pianifica(istante + self.caso.expovariate(1 / self.args.riflessione), "conferma", paziente, **stato)
+
+    def ritenta(self, paziente, istante, stato):
+        stato["tentativi"] += 1
+        self.conteggi["tentativi_ripetuti"] += 1
+        if stato["tentativi"] > self.args.max_tentativi:
+            self.conteggi["rinunce"] += 1
+        else:
+            self.pianifica(istante + self.args.attesa_ritentativo, "ricarica", paziente, **stato)
+
+    def esegui(self):
+        for paziente in range(len(self.tokens)):
+            self.pianifica(self.caso.uniform(0, self.args.finestra_arrivi), "arrivo", paziente)
+
+        while self.eventi:
+            istante, _, azione, paziente, stato = heapq.heappop(self.eventi)
+            if azione == "arrivo":
+                self.scegli_slot(paziente, istante, {"arrivo": istante, "tentativi": 0})
+
+            elif azione == "ricarica":
+                self.scegli_slot(paziente, istante, stato)
+
+            elif azione == "riserva":
+                self.conteggi["riserve_inviate"] += 1
+                risposta = self.client.post(f"/api/disponibilita/{stato['slot_id']}/riserva",
+                                            headers=self.header(paziente))
+                if risposta.status_code == 201:
+                    self.pianifica(istante + self.caso.expovariate(1 / self.args.riflessione), "conferma",
+                                   paziente, **stato)
+                else:
+                    self.conteggi["riserve_in_conflitto"] += 1
+                    self.ritenta(paziente, istante, stato)
+
+            elif azione == "conferma":
+                if self.caso.random() < self.args.abbandono:
+                    # Chiude la pagina: con le riserve lo slot resta bloccato fino alla scadenza
+                    self.conteggi["abbandoni"] += 1
+                    continue
+                self.conteggi["conferme_inviate"] += 1
+                risposta = self.client.post("/api/appuntamenti", json={"disponibilita_id": stato["slot_id"]},
+                                            headers=self.header(paziente))
+                if risposta.status_code == 201:
+                    self.conteggi["prenotati"] += 1
+                    self.tempi_prenotazione.append(istante - stato["arrivo"])
+                else:
+                    self.conteggi["conferme_in_conflitto"] += 1
+                    self.ritenta(paziente, istante, stato)
+
+    def report(self):
+        c = self.conteggi
+        tempi = sorted(self.tempi_prenotazione)
+        return {
+            **c,
+            "scritture_totali": c["conferme_inviate"] + c["riserve_inviate"],
+            "tasso_conflitto_conferme": round(c["conferme_in_conflitto"] / max(1, c["conferme_inviate"]), 3),
+            "tentativi_per_prenotazione": round(c["tentativi_ripetuti"] / max(1, c["prenotati"]), 3),
+            "secondi_alla_prenotazione_p50": round(tempi[len(tempi) // 2], 1) if tempi else None,
+        }
+
+
+def ripristina_slot(modulo, app):
+    """ Libera tutti gli slot e cancella gli appuntamenti creati dalla simulazione precedente """
+    with app.app_context():
+        db = modulo.db
+        db.session.execute(modulo.Appuntamento.__table__.delete())
+        db.session.execute(update(modulo.Disponibilita).values(è_prenotato=False, riservato_da=None,
+                                                                riservato_fino=None))
+        db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Conflitti e tentativi ripetuti con e senza riserve degli slot")
+    parser.add_argument("--pazienti", type=int, default=300)
+    parser.add_argument("--slot", type=int, default=60)
+    parser.add_argument("--finestra-arrivi", type=float, default=60.0, help="secondi in cui arrivano i pazienti")
+    parser.add_argument("--scelta", type=float, default=5.0, help="secondi medi tra caricamento e selezione")
+    parser.add_argument("--riflessione", type=float, default=20.0, help="secondi medi tra scelta e conferma")
+    parser.add_argument("--preferiti", type=int, default=8, help="tra quanti dei primi orari sceglie il paziente")
+    parser.add_argument("--abbandono", type=float, default=0.1, help="probabilità di chiudere senza confermare")
+    parser.add_argument("--max-tentativi", type=int, default=5)
+    parser.add_argument("--attesa-ritentativo", type=float, default=3.0)
+    parser.add_argument("--seme", type=int, default=42)
+    args = parser.parse_args()
+
+    modulo = carica_app(database_temporaneo("riserve.db"))
+    app = modulo.app
+    _, tokens = crea_dati_di_prova(modulo, app, num_medici=1, slot_per_medico=args.slot, num_pazienti=args.pazienti)
+    with app.app_context():
+        args.medico_id = modulo.db.session.execute(select(func.min(modulo.Medico.id))).scalar()
+
+    client = app.test_client()
+    report = {"pazienti": args.pazienti, "slot": args.slot}
+    for nome, con_riserve in (("senza_riserve", False), ("con_riserve", True)):
+        ripristina_slot(modulo, app)
+        simulazione = Simulazione(modulo, client, tokens, args, con_riserve)
+        simulazione.esegui()
+        report[nome] = simulazione.report()
+    stampa_report(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+# backend/benchmarks/sse_iscritti.py
+#
+# Costo dei client in ascolto su /api/disponibilita/eventi. Avvia --processi server
+# sullo stesso database, apre centinaia di stream SSE inattivi distribuiti tra i
+# processi (tutti gestiti lato client da un solo thread con selectors), misura la CPU
+# dei server mentre sono fermi e poi la latenza con cui una prenotazione, inviata
+# sempre al primo processo, arriva a tutti gli iscritti di quel medico: anche a quelli
+# collegati agli altri processi, tramite la tabella eventi_slot.
+# Legge CPU, thread e memoria dei server da /proc, quindi funziona solo su Linux.
+# Con --server gevent (predefinito, come in produzione, vedi wsgi.py) ogni stream è un
+# greenlet e thread_per_iscritto resta vicino a 0; con --server thread il server di
+# sviluppo apre un thread per connessione. SSE_MAX_ISCRITTI viene fissato agli stream
+# del processo più carico: la prova "oltre_il_limite" apre uno stream in più e
+# verifica la risposta 503 con Retry-After.
+#
+# Esempio:
+#   python -m benchmarks.sse_iscritti --iscritti 500 --processi 2 --inattivita 10 --prenotazioni 20
+
+import argparse
+import http.client
+import json
+import os
+import selectors
+import socket
+import time
+
+from sqlalchemy import select
+
+from benchmarks.comune import (
+    carica_app, crea_dati_di_prova, database_temporaneo, riassunto_latenze, stampa_report
+)
+from benchmarks.suite_api import avvia_server, porta_libera
+
+
+def stato_processo(pid):
+    """ Secondi di CPU (utente + sistema), thread e memoria residente del processo """
+    with open(f"/proc/{pid}/stat") as f:
+        campi = f.read().rsplit(")", 1)[1].split()
+    cpu = (int(campi[11]) + int(campi[12])) / os.sysconf("SC_CLK_TCK")
+    stato = {}
+    with open(f"/proc/{pid}/status") as f:
+        for riga in f:
+            chiave, _, valore = riga.partition(":")
+            stato[chiave] = valore.strip()
+    return cpu, int(stato["Threads"]), int(stato["VmRSS"].split()[0]) // 1024
+
+
+def stato_server(processi):
+    """ stato_processo sommato su tutti i processi server """
+    return tuple(sum(valori) for valori in zip(*(stato_processo(processo.pid) for processo in processi)))
+
+
+def apri_iscrizioni(porte, medici_ids, quante, selettore):
+    """
+    Apre gli stream SSE (HTTP/1.0: niente chunked encoding) alternando i server
+    e aspetta la prima riga di ciascuno
+    """
+    connessioni = {}
+    for i in range(quante):
+        s = socket.create_connection(("127.0.0.1", porte[i % len(porte)]))
+        medico_id = medici_ids[i % len(medici_ids)]
+        s.sendall(f"GET /api/disponibilita/eventi?medico_ids={medico_id} HTTP/1.0\r\nHost: localhost\r\n\r\n".encode())
+        s.setblocking(False)
+        connessioni[s] = {"medico_id": medico_id, "buffer": b""}
+        selettore.register(s, selectors.EVENT_READ)
+
+    pronte = set()
+    limite = time.monotonic() + 60
+    while len(pronte) < quante and time.monotonic() < limite:
+        for chiave, _ in selettore.select(timeout=1):
+            stato = connessioni[chiave.fileobj]
+            stato["buffer"] += chiave.fileobj.recv(65536)
+            if b"retry:" in stato["buffer"]:
+                pronte.add(chiave.fileobj)
+    if len(pronte) < quante:
+        raise RuntimeError(f"Solo {len(pronte)} stream su {quante} si sono aperti")
+    for stato in connessioni.values():
+        stato["buffer"] = b""
+    return connessioni
+
+
+def attendi_evento(selettore, connessioni, destinatari, marcatore, inizio):
+    """ Latenze con cui il marcatore arriva a ciascuno dei destinatari """
+    latenze = {}
+    limite = time.monotonic() + 10
+    while len(latenze) < len(destinatari) and time.monotonic() < limite:
+        for chiave, _ in selettore.select(timeout=1):
+            s = chiave.fileobj
+            stato = connessioni[s]
+            stato["buffer"] += s.recv(65536)
+            if s in destinatari and s not in latenze and marcatore in stato["buffer"]:
+                latenze[s] = time.perf_counter() - inizio
+                stato["buffer"] = b""
+    return list(latenze.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU e latenza di consegna degli stream SSE degli slot")
+    parser.add_argument("--iscritti", type=int, default=500)
+    parser.add_argument("--medici", type=int, default=50)
+    parser.add_argument("--inattivita", type=float, default=10.0, help="secondi di misura con gli stream fermi")
+    parser.add_argument("--prenotazioni", type=int, default=20)
+    parser.add_argument("--processi", type=int, default=2, help="server sullo stesso database")
+    parser.add_argument("--server", choices=["gevent", "thread"], default="gevent")
+    args = parser.parse_args()
+
+    modulo = carica_app(database_temporaneo("sse.db"))
+    slot_ids, tokens = crea_dati_di_prova(modulo, modulo.app, num_medici=args.medici, slot_per_medico=50,
+                                          num_pazienti=1)
+    with modulo.app.app_context():
+        medico_di = dict(modulo.db.session.execute(
+            select(modulo.Disponibilita.id, modulo.Disponibilita.medico_id)
+        ).all())
+    medici_ids = sorted(set(medico_di.values()))
+
+    # Il primo processo riceve più stream degli altri quando la divisione non è esatta
+    limite_per_processo = -(-args.iscritti // args.processi)
+    ambiente = dict(os.environ, SSE_MAX_ISCRITTI=str(limite_per_processo))
+    porte, processi = [], []
+    selettore = selectors.DefaultSelector()
+    try:
+        for _ in range(args.processi):
+            porte.append(porta_libera())
+            processi.append(avvia_server(porte[-1], ambiente, args.server))
+        cpu_base, thread_base, rss_base = stato_server(processi)
+        connessioni = apri_iscrizioni(porte, medici_ids, args.iscritti, selettore)
+
+        cpu_inizio, thread_aperti, rss_aperti = stato_server(processi)
+        oltre = http.client.HTTPConnection("127.0.0.1", porte[0], timeout=10)
+        oltre.request("GET", f"/api/disponibilita/eventi?medico_ids={medici_ids[0]}")
+        risposta_oltre = oltre.getresponse()
+        oltre_il_limite = {"stato": risposta_oltre.status, "retry_after": risposta_oltre.getheader("Retry-After")}
+        oltre.close()
+        time.sleep(args.inattivita)
+        cpu_fine, _, _ = stato_server(processi)
+
+        client = http.client.HTTPConnection("127.0.0.1", porte[0], timeout=10)
+        latenze, consegne = [], 0
+        for slot_id in slot_ids[::max(1, len(slot_ids) // args.prenotazioni)][:args.prenotazioni]:
+            destinatari = {s for s, stato in connessioni.items() if stato["medico_id"] == medico_di[slot_id]}
+            inizio = time.perf_counter()
+            client.request("POST", "/api/appuntamenti", body=json.dumps({"disponibilita_id": slot_id}),
+                           headers={"Content-Type": "application/json", "Authorization": f"Bearer {tokens[0]}"})
+            client.getresponse().read()
+            ricevute = attendi_evento(selettore, connessioni, destinatari, f'"slot_id":{slot_id}'.encode(), inizio)
+            consegne += len(ricevute)
+            latenze.extend(ricevute)
+            if len(ricevute) < len(destinatari):
+                print(f"Slot {slot_id}: evento arrivato a {len(ricevute)} iscritti su {len(destinatari)}")
+    finally:
+        for processo in processi:
+            processo.terminate()
+            processo.wait()
+        selettore.close()
+
+    stampa_report({
+        "iscritti": args.iscritti,
+        "processi": args.processi,
+        "server": {
+            "tipo": args.server,
+            "thread_prima": thread_base,
+            "thread_con_iscritti": thread_aperti,
+            "thread_per_iscritto": round((thread_aperti - thread_base) / args.iscritti, 2),
+            "rss_mb_prima": rss_base,
+            "rss_mb_con_iscritti": rss_aperti,
+            "cpu_apertura_s": round(cpu_inizio - cpu_base, 3),
+            "cpu_inattivita_s": round(cpu_fine - cpu_inizio, 3),
+            "cpu_inattivita_percento": round(100 * (cpu_fine - cpu_inizio) / args.inattivita, 2),
+        },
+        "oltre_il_limite": oltre_il_limite,
+        "consegne": consegne,
+        "latenza_consegna": riassunto_latenze(latenze),
+    })
+
+
+if __name__ == '__main__':
+    main()
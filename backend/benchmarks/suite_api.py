@@ -0,0 +1,284 @@
+# backend/benchmarks/suite_api.py
+#
+# Benchmark end-to-end di tutte le route dell'API su un dataset generato con seed.py.
+# Può girare in-process con il test client di Flask oppure contro un server HTTP
+# locale (avviato dallo script o indicato con --url), con più worker concorrenti.
+# Il risultato è un JSON con throughput e p50/p95/p99 per endpoint; con --baseline
+# lo confronta con un'esecuzione precedente e termina con codice 1 se c'è una regressione.
+#
+# Esempi:
+#   python -m benchmarks.suite_api --output risultati.json
+#   python -m benchmarks.suite_api --modalita server --workers 8 --baseline risultati.json --soglia 0.2
+
+import argparse
+import http.client
+import importlib
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+
+from sqlalchemy import select
+
+from benchmarks.comune import carica_app, database_temporaneo, riassunto_latenze, stampa_report
+
+CARTELLA_BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ClientInterno:
+    """ Esegue le richieste con il test client di Flask, nello stesso processo """
+
+    def __init__(self, app):
+        self._client = app.test_client()
+
+    def richiesta(self, metodo, percorso, corpo=None, headers=None):
+        risposta = self._client.open(percorso, method=metodo, json=corpo, headers=headers or {})
+        return risposta.status_code
+
+
+class ClientHttp:
+    """ Esegue le richieste su HTTP riusando la stessa connessione (keep-alive) """
+
+    def __init__(self, url):
+        parti = urllib.parse.urlsplit(url)
+        self._host, self._porta = parti.hostname, parti.port or 80
+        self._connessione = None
+
+    def richiesta(self, metodo, percorso, corpo=None, headers=None):
+        headers = dict(headers or {})
+        dati = None
+        if corpo is not None:
+            dati = json.dumps(corpo).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        for tentativo in range(2):
+            if self._connessione is None:
+                self._connessione = http.client.HTTPConnection(self._host, self._porta, timeout=30)
+            try:
+                self._connessione.request(metodo, percorso, body=dati, headers=headers)
+                risposta = self._connessione.getresponse()
+                risposta.read()
+                if risposta.getheader("Connection", "").lower() == "close":
+                    self._connessione.close()
+                    self._connessione = None
+                return risposta.status
+            except (http.client.HTTPException, ConnectionError):
+                # Il server ha chiuso la connessione: se ne apre una nuova e si riprova una volta
+                self._connessione.close()
+                self._connessione = None
+                if tentativo:
+                    raise
+
+
+def prepara_dataset(modulo, args):
+    """ Genera il dataset con seed.py e raccoglie id, email e token usati dagli scenari """
+    seed = importlib.import_module("seed")
+    seed.genera_dati_sintetici(
+        num_medici=args.medici, giorni=args.giorni, num_pazienti=args.pazienti,
+        seme=args.seme, dimensione_batch=50000,
+    )
+    with modulo.app.app_context():
+        db = modulo.db
+        medici_ids = db.session.execute(select(modulo.Medico.id)).scalars().all()
+        utenti = db.session.execute(select(modulo.Utente.id, modulo.Utente.email).limit(1000)).all()
+        slot_liberi = db.session.execute(
+            select(modulo.Disponibilita.id).where(modulo.Disponibilita.è_prenotato.is_(False)).limit(50000)
+        ).scalars().all()
+        tokens = [modulo.create_access_token(identity=str(uid)) for uid, _ in utenti]
+    return {
+        "medici_ids": medici_ids,
+        "email": [email for _, email in utenti],
+        "password": seed.PASSWORD_SINTETICA,
+        "slot_liberi": slot_liberi,
+        "tokens": tokens,
+    }
+
+
+def scenari(dati):
+    """ Per ogni endpoint, una funzione che dato un generatore casuale produce (metodo, percorso, corpo, headers) """
+    def auth(rng):
+        return {"Authorization": f"Bearer {rng.choice(dati['tokens'])}"}
+
+    return {
+        "GET /api/medici": lambda rng: ("GET", "/api/medici", None, None),
+        "GET /api/medici/<id>": lambda rng: ("GET", f"/api/medici/{rng.choice(dati['medici_ids'])}", None, None),
+        "GET /api/medici/<id>/disponibilita": lambda rng: (
+            "GET", f"/api/medici/{rng.choice(dati['medici_ids'])}/disponibilita", None, None),
+        "POST /api/login": lambda rng: (
+            "POST", "/api/login", {"email": rng.choice(dati["email"]), "password": dati["password"]}, None),
+        "GET /api/profilo": lambda rng: ("GET", "/api/profilo", None, auth(rng)),
+        "GET /api/appuntamenti": lambda rng: ("GET", "/api/appuntamenti", None, auth(rng)),
+        "POST /api/appuntamenti": lambda rng: (
+            "POST", "/api/appuntamenti", {"disponibilita_id": rng.choice(dati["slot_liberi"])}, auth(rng)),
+    }
+
+
+def misura_endpoint(crea_client, genera, workers, richieste_per_worker, riscaldamento):
+    """ Esegue lo scenario con più worker in parallelo e restituisce le statistiche """
+    latenze, esiti, intervalli, lock = [], {}, [], threading.Lock()
+    barriera = threading.Barrier(workers)
+
+    def worker(indice):
+        client = crea_client()
+        rng = random.Random(indice)
+        for _ in range(riscaldamento):
+            client.richiesta(*genera(rng))
+        locali, stati = [], {}
+        barriera.wait()
+        inizio = time.perf_counter()
+        for _ in range(richieste_per_worker):
+            metodo, percorso, corpo, headers = genera(rng)
+            t0 = time.perf_counter()
+            stato = client.richiesta(metodo, percorso, corpo, headers)
+            locali.append(time.perf_counter() - t0)
+            stati[stato] = stati.get(stato, 0) + 1
+        fine = time.perf_counter()
+        with lock:
+            intervalli.append((inizio, fine))
+            latenze.extend(locali)
+            for stato, quante in stati.items():
+                esiti[str(stato)] = esiti.get(str(stato), 0) + quante
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(workers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    # Tempi presi dai worker: il thread principale potrebbe non essere schedulato subito dopo la barriera
+    durata = max(fine for _, fine in intervalli) - min(inizio for inizio, _ in intervalli)
+
+    return {
+        "throughput_rps": round(len(latenze) / durata, 1) if durata else 0.0,
+        **riassunto_latenze(latenze),
+        "esiti": dict(sorted(esiti.items())),
+    }
+
+
+def porta_libera():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def avvia_server(porta, ambiente, server="thread"):
+    """
+    Avvia in un processo separato il server di sviluppo multi-thread oppure, con server="gevent",
+    il server WSGI di gevent (un greenlet per connessione) e aspetta che risponda
+    """
+    if server == "gevent":
+        codice = (
+            "from gevent import monkey; monkey.patch_all(); "
+            "from gevent.pywsgi import WSGIServer; from app import app; "
+            f"WSGIServer(('127.0.0.1', {porta}), app, log=None).serve_forever()"
+        )
+    else:
+        codice = (
+            "from werkzeug.serving import run_simple; from app import app; "
+            f"run_simple('127.0.0.1', {porta}, app, threaded=True)"
+        )
+    processo = subprocess.Popen(
+        [sys.executable, "-c", codice], cwd=CARTELLA_BACKEND, env=ambiente,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    limite = time.monotonic() + 30
+    while time.monotonic() < limite:
+        try:
+            with socket.create_connection(("127.0.0.1", porta), timeout=0.5):
+                return processo
+        except OSError:
+            time.sleep(0.1)
+    processo.terminate()
+    raise RuntimeError("Il server di benchmark non si è avviato")
+
+
+def confronta(risultati, baseline, soglia):
+    """ Elenco delle regressioni: p95 più alto o throughput più basso della baseline oltre la soglia """
+    regressioni = []
+    for endpoint, attuale in risultati.items():
+        precedente = baseline.get("endpoint", {}).get(endpoint)
+        if precedente is None:
+            continue
+        if precedente["p95_ms"] and attuale["p95_ms"] > precedente["p95_ms"] * (1 + soglia):
+            regressioni.append(f"{endpoint}: p95 {precedente['p95_ms']} -> {attuale['p95_ms']} ms")
+        if precedente["throughput_rps"] and attuale["throughput_rps"] < precedente["throughput_rps"] * (1 - soglia):
+            regressioni.append(
+                f"{endpoint}: throughput {precedente['throughput_rps']} -> {attuale['throughput_rps']} rps")
+    return regressioni
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark end-to-end delle route dell'API")
+    parser.add_argument("--modalita", choices=["inprocess", "server"], default="inprocess")
+    parser.add_argument("--url", default=None, help="server già avviato da misurare (implica --modalita server)")
+    parser.add_argument("--workers", type=int, default=4, help="client concorrenti per endpoint")
+    parser.add_argument("--richieste", type=int, default=200, help="richieste per worker e per endpoint")
+    parser.add_argument("--riscaldamento", type=int, default=5, help="richieste non misurate per worker")
+    parser.add_argument("--endpoint", action="append", help="misura solo questi endpoint (ripetibile)")
+    parser.add_argument("--medici", type=int, default=200)
+    parser.add_argument("--giorni", type=int, default=60)
+    parser.add_argument("--pazienti", type=int, default=5000)
+    parser.add_argument("--seme", type=int, default=42)
+    parser.add_argument("--bcrypt-rounds", type=int, default=10, help="costo bcrypt del dataset e del server")
+    parser.add_argument("--output", default=None, help="file JSON in cui salvare i risultati")
+    parser.add_argument("--baseline", default=None, help="risultati precedenti con cui confrontarsi")
+    parser.add_argument("--soglia", type=float, default=0.2, help="regressione massima tollerata (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    os.environ["BCRYPT_LOG_ROUNDS"] = str(args.bcrypt_rounds)
+    database_url = database_temporaneo("suite_api.db")
+    modulo = carica_app(database_url)
+    dati = prepara_dataset(modulo, args)
+
+    processo = None
+    if args.url:
+        modalita = "server"
+        crea_client = lambda: ClientHttp(args.url)
+    elif args.modalita == "server":
+        modalita = "server"
+        porta = porta_libera()
+        processo = avvia_server(porta, dict(os.environ))
+        crea_client = lambda: ClientHttp(f"http://127.0.0.1:{porta}")
+    else:
+        modalita = "inprocess"
+        crea_client = lambda: ClientInterno(modulo.app)
+
+    try:
+        risultati = {}
+        for endpoint, genera in scenari(dati).items():
+            if args.endpoint and endpoint not in args.endpoint:
+                continue
+            risultati[endpoint] = misura_endpoint(crea_client, genera, args.workers, args.richieste,
+                                                  args.riscaldamento)
+    finally:
+        if processo is not None:
+            processo.terminate()
+            processo.wait()
+
+    report = {
+        "modalita": modalita,
+        "workers": args.workers,
+        "richieste_per_worker": args.richieste,
+        "dataset": {"medici": args.medici, "giorni": args.giorni, "pazienti": args.pazienti, "seme": args.seme},
+        "endpoint": risultati,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    stampa_report(report)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressioni = confronta(risultati, json.load(f), args.soglia)
+        if regressioni:
+            print("Regressioni rispetto alla baseline:", file=sys.stderr)
+            for riga in regressioni:
+                print(f"  {riga}", file=sys.stderr)
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+# backend/benchmarks/tempesta_login.py
+#
+# Latenza del catalogo durante una raffica di login. Confronta bcrypt eseguito
+# nel thread della richiesta (BCRYPT_WORKERS=0) con il pool dedicato e limitato.
+#
+# Esempio:
+#   python -m benchmarks.tempesta_login --login 16 --catalogo 4 --durata 10
+
+import argparse
+import threading
+import time
+
+from sqlalchemy import insert
+
+from benchmarks.comune import (
+    carica_app, crea_dati_di_prova, database_temporaneo, riassunto_latenze, stampa_report
+)
+
+PASSWORD = "password-benchmark"
+
+
+def client_login(client, email, fine, risultati):
+    while time.perf_counter() < fine:
+        t0 = time.perf_counter()
+        risposta = client.post("/api/login", json={"email": email, "password": PASSWORD})
+        risultati.append((risposta.status_code, time.perf_counter() - t0))
+        if risposta.status_code == 503:
+            # Un client reale rispetterebbe Retry-After: qui si aspetta poco per mantenere la pressione
+            time.sleep(0.05)
+
+
+def client_catalogo(client, num_medici, fine, risultati):
+    i = 0
+    while time.perf_counter() < fine:
+        # Le disponibilità non sono in cache: ogni richiesta fa una query reale
+        url = f"/api/medici/{i % num_medici + 1}/disponibilita"
+        t0 = time.perf_counter()
+        risposta = client.get(url)
+        risultati.append((risposta.status_code, time.perf_counter() - t0))
+        i += 1
+
+
+def esegui(modulo, nome, config, args):
+    app = modulo.create_app({
+        "SQLALCHEMY_DATABASE_URI": database_temporaneo(f"{nome}.db"),
+        "BCRYPT_LOG_ROUNDS": args.costo,
+        **config,
+    })
+    crea_dati_di_prova(modulo, app, num_medici=10, slot_per_medico=200, num_pazienti=0)
+    with app.app_context():
+        # Un solo hash riusato per tutti gli utenti di prova
+        password_hash = modulo.bcrypt.generate_password_hash(PASSWORD, args.costo).decode("utf-8")
+        modulo.db.session.execute(insert(modulo.Utente), [
+            {"email": f"login{i}@bench.local", "password_hash": password_hash, "nome": "Login", "cognome": str(i)}
+            for i in range(args.login)
+        ])
+        modulo.db.session.commit()
+
+    login, catalogo = [], []
+    fine = time.perf_counter() + args.durata
+    threads = [
+        threading.Thread(target=client_login, args=(app.test_client(), f"login{i}@bench.local", fine, login))
+        for i in range(args.login)
+    ] + [
+        threading.Thread(target=client_catalogo, args=(app.test_client(), 10, fine, catalogo))
+        for _ in range(args.catalogo)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    esiti_login = {}
+    for stato, _ in login:
+        esiti_login[str(stato)] = esiti_login.get(str(stato), 0) + 1
+    return {
+        "config": config,
+        "catalogo_rps": round(len(catalogo) / args.durata, 1),
+        "latenza_catalogo": riassunto_latenze([lat for _, lat in catalogo]),
+        "login_riusciti_rps": round(esiti_login.get("200", 0) / args.durata, 1),
+        "esiti_login": esiti_login,
+        "latenza_login_200": riassunto_latenze([lat for stato, lat in login if stato == 200]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latenza del catalogo durante una raffica di login")
+    parser.add_argument("--login", type=int, default=16, help="client che fanno login in continuazione")
+    parser.add_argument("--catalogo", type=int, default=4, help="client che leggono le disponibilità")
+    parser.add_argument("--durata", type=float, default=10.0)
+    parser.add_argument("--costo", type=int, default=12, help="BCRYPT_LOG_ROUNDS")
+    parser.add_argument("--workers", type=int, default=1, help="thread del pool bcrypt nella variante 'pool'")
+    parser.add_argument("--max-coda", type=int, default=2)
+    args = parser.parse_args()
+
+    modulo = carica_app(database_temporaneo("import.db"))
+    configurazioni = {
+        "inline": {"BCRYPT_WORKERS": 0},
+        "pool": {"BCRYPT_WORKERS": args.workers, "BCRYPT_MAX_CODA": args.max_coda},
+    }
+    stampa_report({nome: esegui(modulo, nome, config, args) for nome, config in configurazioni.items()})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+# backend/eventi.py
+#
+# Pub/sub in-process per le variazioni degli slot (prenotato, riservato, liberato, aggiunti).
+# Chi pubblica consegna l'evento solo agli iscritti interessati a quel medico; ogni
+# iscritto ha una coda propria e un segnale su cui attende senza consumare CPU.
+# In ogni processo pubblica un solo thread, InoltroEventi in app.py, che legge gli eventi
+# di tutti i processi dalla tabella eventi_slot. Con i worker gevent threading.Event
+# diventa un evento di gevent: un iscritto in attesa occupa un greenlet, non un thread.
+
+import collections
+import threading
+
+from serializzazione import codifica_json
+
+# Tipi di evento sugli slot di un medico
+SLOT_PRENOTATO = 'prenotato'
+SLOT_LIBERATO = 'liberato'
+SLOT_AGGIUNTI = 'aggiunti'
+# Riservato temporaneamente da un utente che sta completando la prenotazione
+SLOT_RISERVATO = 'riservato'
+# Inviato a un iscritto troppo lento prima di chiuderne lo stream: deve ricaricare le disponibilità
+RIALLINEA = 'riallinea'
+
+
+class TroppiIscritti(Exception):
+    pass
+
+
+class Iscrizione:
+    """Coda di eventi di un singolo client, per un insieme di medici."""
+
+    __slots__ = ('chiavi', '_coda', '_segnale', '_max_coda', 'traboccata')
+
+    def __init__(self, chiavi, max_coda):
+        self.chiavi = chiavi
+        self._coda = collections.deque()
+        self._segnale = threading.Event()
+        self._max_coda = max_coda
+        self.traboccata = False
+
+    def consegna(self, evento):
+        if len(self._coda) >= self._max_coda:
+            # Il client non sta leggendo: invece di accumulare memoria si chiude il suo stream
+            self.traboccata = True
+        else:
+            self._coda.append(evento)
+        self._segnale.set()
+
+    def attendi(self, timeout):
+        """Eventi arrivati da quando è stata chiamata l'ultima volta; lista vuota allo scadere del timeout."""
+        self._segnale.wait(timeout)
+        self._segnale.clear()
+        eventi = []
+        while self._coda:
+            eventi.append(self._coda.popleft())
+        return eventi
+
+
+class BusEventi:
+    """
+    Estensione Flask con il registro degli iscritti per medico.
+    Configurazione: SSE_MAX_ISCRITTI, SSE_MAX_CODA (eventi in attesa per iscritto).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._iscritti = {}
+        self._totale = 0
+        self.max_iscritti = 1000
+        self.max_coda = 256
+
+    def init_app(self, app):
+        self.max_iscritti = app.config.get('SSE_MAX_ISCRITTI', self.max_iscritti)
+        self.max_coda = app.config.get('SSE_MAX_CODA', self.max_coda)
+        app.extensions['bus_eventi'] = self
+
+    def iscrivi(self, chiavi):
+        iscrizione = Iscrizione(tuple(chiavi), self.max_coda)
+        with self._lock:
+            if self._totale >= self.max_iscritti:
+                raise TroppiIscritti()
+            for chiave in iscrizione.chiavi:
+                self._iscritti.setdefault(chiave, set()).add(iscrizione)
+            self._totale += 1
+        return iscrizione
+
+    def annulla(self, iscrizione):
+        with self._lock:
+            for chiave in iscrizione.chiavi:
+                gruppo = self._iscritti.get(chiave)
+                if gruppo is not None:
+                    gruppo.discard(iscrizione)
+                    if not gruppo:
+                        del self._iscritti[chiave]
+            self._totale -= 1
+
+    def pubblica(self, chiave, tipo, dati):
+        with self._lock:
+            destinatari = list(self._iscritti.get(chiave, ()))
+        if not destinatari:
+            return 0
+        # Serializzato una volta sola per tutti gli iscritti
+        evento = formato_sse(tipo, dati)
+        for iscrizione in destinatari:
+            iscrizione.consegna(evento)
+        return len(destinatari)
+
+    @property
+    def numero_iscritti(self):
+        return self._totale
+
+
+def formato_sse(tipo, dati):
+    """Un evento nel formato text/event-stream. Dati codificati come le risposte JSON (date in ISO 8601)."""
+    return f"event: {tipo}\ndata: {codifica_json(dati).decode()}\n\n"
@@ -0,0 +1,207 @@
+# backend/limiti.py
+#
+# Limiti di frequenza sugli endpoint costosi (bcrypt, scritture su SQLite) con
+# l'algoritmo token bucket: ogni chiave (route + IP, route + utente) ha un secchio
+# di "capacità" gettoni che si ricarica a velocità costante e ogni richiesta ne
+# consuma uno. Senza gettoni la richiesta viene rifiutata con 429 e Retry-After.
+# I secchi stanno in memoria, divisi in partizioni con un lock ciascuna e limitati
+# nel numero (si scartano quelli inutilizzati da più tempo); in alternativa stanno
+# in un file SQLite condiviso da tutti i processi worker.
+
+import collections
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from functools import wraps
+
+from flask import current_app, request
+
+# Partizioni dei secchi in memoria: richieste su chiavi diverse raramente aspettano lo stesso lock
+NUM_PARTIZIONI = 16
+
+
+class LimiteSuperato(Exception):
+    """Richiesta rifiutata da un limite di frequenza; attesa sono i secondi dopo cui riprovare."""
+
+    def __init__(self, attesa):
+        super().__init__(attesa)
+        self.attesa = attesa
+
+
+def leggi_limite(valore):
+    """
+    Converte "richieste/secondi" (es. "10/60": fino a 10 richieste di fila, poi una
+    ogni 6 secondi) in (capacità, gettoni al secondo). Vuoto o "0" = nessun limite.
+    """
+    if not valore or valore.strip() in ('0', '0/0'):
+        return None
+    richieste, _, secondi = valore.partition('/')
+    capacita = int(richieste)
+    secondi = float(secondi or 1)
+    if capacita <= 0 or secondi <= 0:
+        raise ValueError(f"Limite non valido: {valore!r}")
+    return capacita, capacita / secondi
+
+
+class SecchiInMemoria:
+    """Secchi del processo corrente, al massimo max_chiavi (LRU per partizione)."""
+
+    def __init__(self, max_chiavi):
+        self._max_per_partizione = max(1, max_chiavi // NUM_PARTIZIONI)
+        self._partizioni = [(threading.Lock(), collections.OrderedDict()) for _ in range(NUM_PARTIZIONI)]
+
+    def consuma(self, chiave, capacita, ricarica):
+        """Consuma un gettone: restituisce 0 se la richiesta passa, altrimenti i secondi da attendere."""
+        lock, secchi = self._partizioni[zlib.crc32(chiave.encode()) % NUM_PARTIZIONI]
+        adesso = time.monotonic()
+        with lock:
+            secchio = secchi.get(chiave)
+            if secchio is None:
+                # Un secchio scartato o mai creato è pieno
+                secchi[chiave] = [capacita - 1.0, adesso]
+                if len(secchi) > self._max_per_partizione:
+                    secchi.popitem(last=False)
+                return 0.0
+            secchi.move_to_end(chiave)
+            gettoni = min(capacita, secchio[0] + (adesso - secchio[1]) * ricarica)
+            secchio[1] = adesso
+            if gettoni >= 1:
+                secchio[0] = gettoni - 1
+                return 0.0
+            secchio[0] = gettoni
+            return (1 - gettoni) / ricarica
+
+    def __len__(self):
+        return sum(len(secchi) for _, secchi in self._partizioni)
+
+
+class SecchiSQLite:
+    """
+    Secchi in un file SQLite condiviso tra i processi. Ogni consumo è un solo UPSERT
+    atomico; le righe dei secchi che nel frattempo si sarebbero riempiti vengono
+    cancellate al più ogni intervallo_pulizia secondi. Ogni thread (e ogni processo
+    dopo un fork) apre una connessione propria.
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS secchi_limiti ("
+        " chiave TEXT PRIMARY KEY, gettoni REAL NOT NULL, aggiornato REAL NOT NULL,"
+        " consentito INTEGER NOT NULL) WITHOUT ROWID"
+    )
+    # Nella SET le colonne hanno ancora i valori precedenti all'aggiornamento
+    CONSUMA = (
+        "INSERT INTO secchi_limiti (chiave, gettoni, aggiornato, consentito) VALUES (:chiave, :capacita - 1, :adesso, 1) "
+        "ON CONFLICT (chiave) DO UPDATE SET "
+        " gettoni = min(:capacita, gettoni + max(0, :adesso - aggiornato) * :ricarica)"
+        "  - (min(:capacita, gettoni + max(0, :adesso - aggiornato) * :ricarica) >= 1),"
+        " consentito = min(:capacita, gettoni + max(0, :adesso - aggiornato) * :ricarica) >= 1,"
+        " aggiornato = :adesso "
+        "RETURNING consentito, gettoni"
+    )
+
+    def __init__(self, percorso, durata_massima, intervallo_pulizia=60):
+        self.percorso = percorso
+        # Dopo durata_massima secondi di inattività qualunque secchio è di nuovo pieno
+        self.durata_massima = durata_massima
+        self.intervallo_pulizia = intervallo_pulizia
+        self._locale = threading.local()
+        self._lock = threading.Lock()
+        self._ultima_pulizia = 0.0
+        self._connessione().execute(self.SCHEMA)
+
+    def _connessione(self):
+        pid = os.getpid()
+        if getattr(self._locale, 'pid', None) != pid:
+            connessione = sqlite3.connect(self.percorso, timeout=5, isolation_level=None, check_same_thread=False)
+            connessione.execute("PRAGMA journal_mode=WAL")
+            # Perdere gli ultimi consumi in un crash non è un problema per un limite di frequenza
+            connessione.execute("PRAGMA synchronous=OFF")
+            self._locale.pid, self._locale.connessione = pid, connessione
+        return self._locale.connessione
+
+    def consuma(self, chiave, capacita, ricarica):
+        adesso = time.time()
+        self._pulisci_se_necessario(adesso)
+        consentito, gettoni = self._connessione().execute(
+            self.CONSUMA, {"chiave": chiave, "capacita": capacita, "ricarica": ricarica, "adesso": adesso}
+        ).fetchone()
+        return 0.0 if consentito else (1 - gettoni) / ricarica
+
+    def pulisci(self, adesso=None):
+        adesso = time.time() if adesso is None else adesso
+        return self._connessione().execute(
+            "DELETE FROM secchi_limiti WHERE aggiornato < ?", (adesso - self.durata_massima,)
+        ).rowcount
+
+    def _pulisci_se_necessario(self, adesso):
+        with self._lock:
+            if adesso - self._ultima_pulizia < self.intervallo_pulizia:
+                return
+            self._ultima_pulizia = adesso
+        self.pulisci(adesso)
+
+    def __len__(self):
+        return self._connessione().execute("SELECT count(*) FROM secchi_limiti").fetchone()[0]
+
+
+class LimitatoreRichieste:
+    """
+    Estensione Flask con i limiti per route. Configurazione:
+    LIMITI_ABILITATI, LIMITI_MAX_CHIAVI, LIMITI_DATABASE (file SQLite condiviso, vuoto =
+    in memoria) e per ogni nome di limite LIMITE_<NOME>_IP e LIMITE_<NOME>_UTENTE
+    nel formato "richieste/secondi".
+    """
+
+    def __init__(self):
+        self.abilitato = False
+        self.secchi = None
+        self._limiti = {}
+
+    def init_app(self, app):
+        self.abilitato = app.config.get('LIMITI_ABILITATI', True)
+        self._config = app.config
+        self._limiti = {}
+        percorso = app.config.get('LIMITI_DATABASE')
+        if percorso:
+            limiti = [leggi_limite(valore) for nome, valore in app.config.items() if nome.startswith('LIMITE_')]
+            durata_massima = max((capacita / ricarica for capacita, ricarica in filter(None, limiti)), default=3600)
+            self.secchi = SecchiSQLite(percorso, durata_massima)
+        else:
+            self.secchi = SecchiInMemoria(app.config.get('LIMITI_MAX_CHIAVI', 100000))
+        app.extensions['limitatore'] = self
+
+    def _limite(self, nome, tipo):
+        chiave = f'LIMITE_{nome.upper()}_{tipo}'
+        if chiave not in self._limiti:
+            self._limiti[chiave] = leggi_limite(self._config.get(chiave))
+        return self._limiti[chiave]
+
+    def verifica(self, nome, utente=None):
+        """
+        Consuma un gettone dal secchio dell'IP e, se utente non è None, da quello
+        dell'utente per il limite indicato. Solleva LimiteSuperato se uno dei due è vuoto.
+        """
+        attesa = 0.0
+        for tipo, valore in (('IP', request.remote_addr), ('UTENTE', utente)):
+            limite = self._limite(nome, tipo)
+            if limite is None or valore is None:
+                continue
+            attesa = max(attesa, self.secchi.consuma(f'{nome}:{tipo.lower()}:{valore}', *limite))
+        if attesa > 0:
+            raise LimiteSuperato(attesa)
+
+    def limita(self, nome, utente=None):
+        """
+        Decoratore che applica il limite nome alla vista. utente è una funzione senza
+        argomenti che restituisce la chiave dell'utente (o None) per il secchio per utente.
+        """
+        def decoratore(funzione):
+            @wraps(funzione)
+            def wrapper(*args, **kwargs):
+                if self.abilitato:
+                    self.verifica(nome, utente() if utente is not None else None)
+                return current_app.ensure_sync(funzione)(*args, **kwargs)
+            return wrapper
+        return decoratore
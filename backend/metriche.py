@@ -0,0 +1,202 @@
+# backend/metriche.py
+#
+# Strumentazione per richiesta: numero e durata delle query SQL e tempo delle fasi
+# (sql, bcrypt, jwt, json). I tempi vengono restituiti nell'header Server-Timing,
+# le richieste lente finiscono nel log e tutto viene aggregato per route in
+# istogrammi esposti in formato testo Prometheus.
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from flask import current_app, g, has_request_context, request
+from flask.json.provider import JSONProvider
+from sqlalchemy import event
+
+# Limiti superiori (in secondi) dei bucket dell'istogramma di durata, come nei client Prometheus
+BUCKET_DURATA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FASI = ('sql', 'bcrypt', 'jwt', 'json')
+
+
+class _StatisticheRoute:
+    """Contatori aggregati di una coppia (route, metodo)."""
+
+    __slots__ = ('bucket', 'conteggio', 'somma', 'query', 'fasi', 'stati')
+
+    def __init__(self):
+        self.bucket = [0] * (len(BUCKET_DURATA) + 1)
+        self.conteggio = 0
+        self.somma = 0.0
+        self.query = 0
+        self.fasi = dict.fromkeys(FASI, 0.0)
+        self.stati = {}
+
+
+class Metriche:
+    """
+    Estensione Flask per la strumentazione delle richieste.
+    Con METRICHE_ABILITATE=False non viene registrato nessun hook (costo nullo).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._route = {}
+        self.abilitate = False
+
+    def init_app(self, app, engine):
+        self.abilitate = app.config.get('METRICHE_ABILITATE', True)
+        if not self.abilitate:
+            return
+        app.extensions['metriche'] = self
+        app.json = _JSONMisurato(app, app.json)
+        app.before_request(self._inizio_richiesta)
+        app.after_request(self._fine_richiesta)
+        event.listen(engine, 'before_cursor_execute', self._prima_della_query)
+        event.listen(engine, 'after_cursor_execute', self._dopo_la_query)
+
+    # --- Raccolta per richiesta ---
+
+    @staticmethod
+    def _stato_richiesta():
+        if has_request_context():
+            return g.get('_metriche')
+        return None
+
+    def _inizio_richiesta(self):
+        g._metriche = {'inizio': time.perf_counter(), 'query': 0, 'fasi': dict.fromkeys(FASI, 0.0)}
+
+    @contextmanager
+    def fase(self, nome):
+        """Somma al tempo della fase la durata del blocco, se la richiesta è strumentata."""
+        stato = self._stato_richiesta()
+        if stato is None:
+            yield
+            return
+        inizio = time.perf_counter()
+        try:
+            yield
+        finally:
+            stato['fasi'][nome] += time.perf_counter() - inizio
+
+    def _prima_della_query(self, conn, cursor, statement, parameters, context, executemany):
+        if self._stato_richiesta() is not None:
+            conn.info.setdefault('_metriche_inizio_query', []).append(time.perf_counter())
+
+    def _dopo_la_query(self, conn, cursor, statement, parameters, context, executemany):
+        stato = self._stato_richiesta()
+        inizi = conn.info.get('_metriche_inizio_query')
+        if stato is None or not inizi:
+            return
+        stato['query'] += 1
+        stato['fasi']['sql'] += time.perf_counter() - inizi.pop()
+
+    def _fine_richiesta(self, risposta):
+        stato = g.pop('_metriche', None)
+        if stato is None:
+            return risposta
+        durata = time.perf_counter() - stato['inizio']
+        fasi = stato['fasi']
+
+        voci = [f'sql;dur={fasi["sql"] * 1000:.2f};desc="{stato["query"]} query"']
+        voci += [f'{nome};dur={fasi[nome] * 1000:.2f}' for nome in FASI[1:] if fasi[nome]]
+        voci.append(f'total;dur={durata * 1000:.2f}')
+        risposta.headers['Server-Timing'] = ', '.join(voci)
+
+        route = request.url_rule.rule if request.url_rule is not None else '<nessuna>'
+        self._registra(route, request.method, risposta.status_code, durata, stato)
+
+        soglia = current_app.config.get('METRICHE_SOGLIA_LENTE_MS', 500)
+        if durata * 1000 >= soglia:
+            current_app.logger.warning(
+                'Richiesta lenta: %s %s -> %s in %.1f ms (%d query, sql %.1f ms, bcrypt %.1f ms, jwt %.1f ms, json %.1f ms)',
+                request.method, request.path, risposta.status_code, durata * 1000, stato['query'],
+                fasi['sql'] * 1000, fasi['bcrypt'] * 1000, fasi['jwt'] * 1000, fasi['json'] * 1000
+            )
+        return risposta
+
+    def _registra(self, route, metodo, codice, durata, stato):
+        indice = bisect.bisect_left(BUCKET_DURATA, durata)
+        with self._lock:
+            statistiche = self._route.get((route, metodo))
+            if statistiche is None:
+                statistiche = self._route[(route, metodo)] = _StatisticheRoute()
+            statistiche.bucket[indice] += 1
+            statistiche.conteggio += 1
+            statistiche.somma += durata
+            statistiche.query += stato['query']
+            for nome, valore in stato['fasi'].items():
+                statistiche.fasi[nome] += valore
+            statistiche.stati[codice] = statistiche.stati.get(codice, 0) + 1
+
+    # --- Esportazione ---
+
+    def formato_prometheus(self):
+        """Metriche aggregate di questo processo nel formato di esposizione testuale di Prometheus."""
+        with self._lock:
+            istantanea = [
+                (route, metodo, list(s.bucket), s.conteggio, s.somma, s.query, dict(s.fasi), dict(s.stati))
+                for (route, metodo), s in sorted(self._route.items())
+            ]
+
+        righe = [
+            '# HELP salute_facile_http_request_duration_seconds Durata delle richieste HTTP per route.',
+            '# TYPE salute_facile_http_request_duration_seconds histogram',
+        ]
+        for route, metodo, bucket, conteggio, somma, _, _, _ in istantanea:
+            etichette = f'route="{route}",method="{metodo}"'
+            cumulato = 0
+            for limite, quante in zip(BUCKET_DURATA, bucket):
+                cumulato += quante
+                righe.append(f'salute_facile_http_request_duration_seconds_bucket{{{etichette},le="{limite}"}} {cumulato}')
+            righe.append(f'salute_facile_http_request_duration_seconds_bucket{{{etichette},le="+Inf"}} {conteggio}')
+            righe.append(f'salute_facile_http_request_duration_seconds_sum{{{etichette}}} {somma:.6f}')
+            righe.append(f'salute_facile_http_request_duration_seconds_count{{{etichette}}} {conteggio}')
+
+        righe += [
+            '# HELP salute_facile_http_responses_total Risposte HTTP per route e codice di stato.',
+            '# TYPE salute_facile_http_responses_total counter',
+        ]
+        for route, metodo, _, _, _, _, _, stati in istantanea:
+            for codice, quante in sorted(stati.items()):
+                righe.append(f'salute_facile_http_responses_total{{route="{route}",method="{metodo}",status="{codice}"}} {quante}')
+
+        righe += [
+            '# HELP salute_facile_sql_queries_total Query SQL eseguite per route.',
+            '# TYPE salute_facile_sql_queries_total counter',
+        ]
+        for route, metodo, _, _, _, query, _, _ in istantanea:
+            righe.append(f'salute_facile_sql_queries_total{{route="{route}",method="{metodo}"}} {query}')
+
+        righe += [
+            '# HELP salute_facile_phase_seconds_total Tempo speso per fase (sql, bcrypt, jwt, json) per route.',
+            '# TYPE salute_facile_phase_seconds_total counter',
+        ]
+        for route, metodo, _, _, _, _, fasi, _ in istantanea:
+            for nome in FASI:
+                righe.append(f'salute_facile_phase_seconds_total{{route="{route}",method="{metodo}",phase="{nome}"}} {fasi[nome]:.6f}')
+
+        return '\n'.join(righe) + '\n'
+
+
+class _JSONMisurato(JSONProvider):
+    """Avvolge il provider JSON dell'app e conteggia la serializzazione nella fase 'json'."""
+
+    def __init__(self, app, provider):
+        super().__init__(app)
+        self._provider = provider
+
+    def _misura(self):
+        metriche = self._app.extensions.get('metriche')
+        return metriche.fase('json') if metriche is not None else nullcontext()
+
+    def dumps(self, obj, **kwargs):
+        with self._misura():
+            return self._provider.dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        return self._provider.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        with self._misura():
+            return self._provider.response(*args, **kwargs)
@@ -1,7 +1,11 @@
 # backend/seed.py
 
+import argparse
 import datetime
-from app import app, db, Medico, Disponibilita, Utente, Appuntamento, bcrypt
+import random
+import time
+from sqlalchemy import func, select
+from app import app, db, Medico, Disponibilita, Utente, Appuntamento, bcrypt, inserisci_slot_in_blocco, prepara_schema
 
 # --- DATI DEI MEDICI ---
 medici_data = [
@@ -74,7 +78,7 @@ def seed_database():
         # Questo risolve gli errori "no such column" quando si modifica il modello.
         print("Ricostruzione del database...")
         db.drop_all()
-        db.create_all()
+        prepara_schema()
         db.session.commit()
 
         # --- Crea Utente di Prova ---
@@ -173,6 +177,212 @@ def seed_database():
         print(f"Creati {count_verdi} slot per {medico_verdi.nome_completo}.")
         print("\nDatabase popolato con successo!")
 
+# --- GENERATORE DI DATI SINTETICI PER I TEST DI CARICO ---
+
+NOMI = ["Mario", "Laura", "Luca", "Anna", "Marco", "Elisa", "Giulia", "Paolo", "Sara", "Andrea",
+        "Chiara", "Davide", "Francesca", "Giorgio", "Martina", "Stefano", "Valentina", "Alessandro"]
+COGNOMI = ["Rossi", "Bianchi", "Verdi", "Neri", "Gialli", "Boni", "Esposito", "Romano", "Colombo",
+           "Ricci", "Marino", "Greco", "Bruno", "Gallo", "Conti", "De Luca", "Costa", "Fontana"]
+SPECIALIZZAZIONI = ["Cardiologia", "Dermatologia", "Ortopedia", "Pediatria", "Fisioterapia", "Ginecologia",
+                    "Neurologia", "Oculistica", "Otorinolaringoiatria", "Endocrinologia", "Urologia", "Psichiatria"]
+PASSWORD_SINTETICA = "Password123"
+FRASI_DESCRIZIONE = [
+    "Riceve su appuntamento presso il proprio studio e in strutture convenzionate.",
+    "Si occupa di prevenzione, diagnosi precoce e follow-up dei pazienti cronici.",
+    "Esegue visite specialistiche, controlli periodici e consulenze di secondo parere.",
+    "Ha collaborato con reparti ospedalieri universitari e centri di ricerca clinica.",
+    "Particolare attenzione all'ascolto del paziente e alla medicina personalizzata.",
+    "Disponibile anche per televisite e refertazione di esami strumentali.",
+    "Autore di pubblicazioni scientifiche e relatore a congressi nazionali.",
+    "Segue pazienti di tutte le età, dall'infanzia alla terza età.",
+    "Utilizza tecniche diagnostiche ecografiche di ultima generazione.",
+    "Lavora in équipe multidisciplinare con fisioterapisti, nutrizionisti e psicologi.",
+]
+
+class Contatore:
+    """ Tiene il conto delle righe inserite per tabella e del tempo impiegato """
+
+    def __init__(self):
+        self.inizio = time.perf_counter()
+        self.righe = {}
+
+    def aggiungi(self, tabella, quante):
+        self.righe[tabella] = self.righe.get(tabella, 0) + quante
+
+    def report(self):
+        durata = time.perf_counter() - self.inizio
+        totale = sum(self.righe.values())
+        for tabella, quante in self.righe.items():
+            print(f"  {tabella}: {quante} righe")
+        print(f"Totale: {totale} righe in {durata:.1f}s ({totale / durata:.0f} righe/s)")
+
+def descrizione_medico(rng, specializzazione):
+    """ Testo di presentazione di qualche frase, come quelli reali del catalogo """
+    frasi = rng.sample(FRASI_DESCRIZIONE, rng.randint(3, 6))
+    return f"Specialista in {specializzazione.lower()} con {rng.randint(2, 35)} anni di esperienza. " + " ".join(frasi)
+
+def genera_medici(rng, num_medici, contatore, dimensione_batch):
+    """ Inserisce i medici sintetici e restituisce i loro id """
+    ultimo_id = db.session.execute(select(func.max(Medico.id))).scalar() or 0
+    tabella = Medico.__table__
+    for primo in range(0, num_medici, dimensione_batch):
+        righe = []
+        for i in range(primo, min(primo + dimensione_batch, num_medici)):
+            specializzazione = rng.choice(SPECIALIZZAZIONI)
+            titolo = rng.choice(["Dott.", "Dott.ssa"])
+            righe.append({
+                "nome_completo": f"{titolo} {rng.choice(NOMI)} {rng.choice(COGNOMI)} {ultimo_id + i + 1}",
+                "specializzazione": specializzazione,
+                "descrizione": descrizione_medico(rng, specializzazione),
+            })
+        db.session.execute(tabella.insert(), righe)
+        db.session.commit()
+        contatore.aggiungi("medici", len(righe))
+    return [riga[0] for riga in db.session.execute(select(Medico.id).where(Medico.id > ultimo_id).order_by(Medico.id))]
+
+def genera_pazienti(num_pazienti, contatore, dimensione_batch):
+    """ Inserisce i pazienti sintetici, tutti con lo stesso hash calcolato una sola volta """
+    password_hash = bcrypt.generate_password_hash(PASSWORD_SINTETICA).decode('utf-8')
+    ultimo_id = db.session.execute(select(func.max(Utente.id))).scalar() or 0
+    tabella = Utente.__table__
+    for primo in range(0, num_pazienti, dimensione_batch):
+        righe = [
+            {
+                "email": f"paziente{ultimo_id + i + 1}@salutefacile.test",
+                "password_hash": password_hash,
+                "nome": NOMI[i % len(NOMI)],
+                "cognome": COGNOMI[(i // len(NOMI)) % len(COGNOMI)],
+                "ruolo": "paziente",
+            }
+            for i in range(primo, min(primo + dimensione_batch, num_pazienti))
+        ]
+        db.session.execute(tabella.insert(), righe)
+        db.session.commit()
+        contatore.aggiungi("utenti", len(righe))
+    return [riga[0] for riga in db.session.execute(select(Utente.id).where(Utente.id > ultimo_id).order_by(Utente.id))]
+
+def orario_medico(rng):
+    """ Giorni lavorativi, fasce orarie e durata delle visite di un medico sintetico """
+    giorni = sorted(rng.sample(range(5), rng.randint(3, 5)))
+    ora_inizio = rng.choice([8, 9, 10])
+    fasce = [(ora_inizio, ora_inizio + 4)]
+    if rng.random() < 0.6:
+        fasce.append((14, 14 + rng.randint(2, 4)))
+    return giorni, fasce, rng.choice([15, 20, 30])
+
+def genera_slot_e_prenotazioni(rng, medici_ids, pazienti_ids, data_inizio, giorni, tasso_prenotazione,
+                               contatore, dimensione_batch):
+    """
+    Genera gli slot di ogni medico per il periodo richiesto e ne prenota una parte.
+    Ogni batch è una transazione: slot liberi, slot prenotati e relativi appuntamenti.
+    """
+    liberi, prenotati = [], []
+
+    def scrivi_batch():
+        inserisci_slot_in_blocco(liberi)
+        ultimo_id = db.session.execute(select(func.max(Disponibilita.id))).scalar() or 0
+        inserisci_slot_in_blocco([slot for slot, _ in prenotati], prenotato=True)
+        # Gli id assegnati nella stessa transazione seguono l'ordine di inserimento
+        nuovi_ids = db.session.execute(
+            select(Disponibilita.id).where(Disponibilita.id > ultimo_id).order_by(Disponibilita.id)
+        ).scalars().all()
+        if prenotati:
+            db.session.execute(Appuntamento.__table__.insert(), [
+                {
+                    "paziente_id": paziente_id,
+                    "disponibilita_id": slot_id,
+                    "data_prenotazione": slot[1] - datetime.timedelta(days=giorni_anticipo),
+                    "stato": "Confermato",
+                }
+                for slot_id, (slot, (paziente_id, giorni_anticipo)) in zip(nuovi_ids, prenotati)
+            ])
+        db.session.commit()
+        contatore.aggiungi("disponibilita", len(liberi) + len(prenotati))
+        contatore.aggiungi("appuntamenti", len(prenotati))
+        liberi.clear()
+        prenotati.clear()
+
+    for medico_id in medici_ids:
+        giorni_lavorativi, fasce, durata_minuti = orario_medico(rng)
+        durata = datetime.timedelta(minutes=durata_minuti)
+        for delta in range(giorni):
+            giorno = data_inizio + datetime.timedelta(days=delta)
+            if giorno.weekday() not in giorni_lavorativi:
+                continue
+            for ora_da, ora_a in fasce:
+                inizio = datetime.datetime(giorno.year, giorno.month, giorno.day, ora_da)
+                limite = datetime.datetime(giorno.year, giorno.month, giorno.day, ora_a)
+                while inizio + durata <= limite:
+                    slot = (medico_id, inizio, inizio + durata)
+                    if pazienti_ids and rng.random() < tasso_prenotazione:
+                        prenotati.append((slot, (rng.choice(pazienti_ids), rng.randint(1, 30))))
+                    else:
+                        liberi.append(slot)
+                    inizio += durata
+        if len(liberi) + len(prenotati) >= dimensione_batch:
+            scrivi_batch()
+    scrivi_batch()
+
+def genera_dati_sintetici(num_medici, giorni, num_pazienti, giorni_passati=0, tasso_prenotazione=0.3,
+                          seme=42, aggiungi=False, dimensione_batch=50000, data_riferimento=None):
+    """
+    Popola il database con volumi realistici per i test di carico.
+    A parità di seme e di data di riferimento il risultato è sempre lo stesso.
+    Con aggiungi=True i dati vengono accodati a quelli esistenti invece di ricreare il database.
+    """
+    rng = random.Random(seme)
+    data_inizio = (data_riferimento or datetime.date.today()) - datetime.timedelta(days=giorni_passati)
+
+    with app.app_context():
+        if not aggiungi:
+            print("Ricostruzione del database...")
+            db.drop_all()
+        # Come all'avvio dell'app: su un database esistente aggiunge anche colonne, indici e trigger nuovi
+        prepara_schema()
+
+        contatore = Contatore()
+        print(f"Generazione di {num_medici} medici e {num_pazienti} pazienti...")
+        medici_ids = genera_medici(rng, num_medici, contatore, dimensione_batch)
+        pazienti_ids = genera_pazienti(num_pazienti, contatore, dimensione_batch)
+        print(f"Generazione di slot e prenotazioni su {giorni_passati + giorni} giorni...")
+        genera_slot_e_prenotazioni(rng, medici_ids, pazienti_ids, data_inizio, giorni_passati + giorni,
+                                   tasso_prenotazione, contatore, dimensione_batch)
+        contatore.report()
+        print(f"Password degli utenti sintetici: {PASSWORD_SINTETICA}")
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Senza opzioni ricrea il database con i dati di esempio; "
+                    "con --doctors genera un dataset sintetico per i test di carico."
+    )
+    parser.add_argument("--doctors", type=int, help="numero di medici da generare")
+    parser.add_argument("--days", type=int, default=30, help="giorni di disponibilità a partire da oggi")
+    parser.add_argument("--past-days", type=int, default=0, help="giorni di storico prima di oggi")
+    parser.add_argument("--patients", type=int, default=1000, help="numero di pazienti da generare")
+    parser.add_argument("--booking-rate", type=float, default=0.3, help="frazione di slot prenotati")
+    parser.add_argument("--seed", type=int, default=42, help="seme del generatore casuale")
+    parser.add_argument("--start-date", type=datetime.date.fromisoformat, default=None,
+                        help="data di riferimento al posto di oggi (AAAA-MM-GG), per output riproducibili")
+    parser.add_argument("--append", action="store_true", help="aggiunge ai dati esistenti senza ricreare il database")
+    parser.add_argument("--batch", type=int, default=50000, help="righe per transazione")
+    args = parser.parse_args()
+
+    if args.doctors is None:
+        seed_database()
+        return
+
+    genera_dati_sintetici(
+        num_medici=args.doctors,
+        giorni=args.days,
+        num_pazienti=args.patients,
+        giorni_passati=args.past_days,
+        tasso_prenotazione=args.booking_rate,
+        seme=args.seed,
+        aggiungi=args.append,
+        dimensione_batch=args.batch,
+        data_riferimento=args.start_date,
+    )
+
 # Esegui la funzione
 if __name__ == '__main__':
-    seed_database()
\ No newline at end of file
+    main()
\ No newline at end of file
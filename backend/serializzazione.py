@@ -0,0 +1,279 @@
+# backend/serializzazione.py
+#
+# Serializzazione JSON e compressione delle risposte. Le righe delle query
+# (tuple di colonne) diventano dizionari senza passaggi intermedi e le date
+# vengono convertite direttamente dall'encoder: orjson se installato, altrimenti
+# il modulo json della libreria standard. Le risposte grandi vengono compresse
+# con brotli (se installato) o gzip in base all'header Accept-Encoding, e le
+# liste molto lunghe possono essere inviate a blocchi senza costruirle in memoria,
+# in JSON, CSV o iCalendar.
+
+import collections
+import csv
+import datetime
+import gzip
+import io
+import itertools
+import json
+import threading
+import zlib
+
+from flask import request
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dipende dall'ambiente
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - dipende dall'ambiente
+    brotli = None
+
+# Tipi di contenuto che vale la pena comprimere
+TIPI_COMPRIMIBILI = {'application/json', 'text/csv', 'text/calendar', 'text/plain'}
+
+
+def _predefinito(valore):
+    # Stesso formato di orjson: ISO 8601 per date e orari
+    if isinstance(valore, (datetime.datetime, datetime.date, datetime.time)):
+        return valore.isoformat()
+    raise TypeError(f"Oggetto di tipo {type(valore).__name__} non serializzabile in JSON")
+
+
+def codifica_json_stdlib(dati):
+    """Serializza in JSON (bytes UTF-8) con il modulo json della libreria standard."""
+    return json.dumps(dati, default=_predefinito, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+if orjson is not None:
+    def codifica_json(dati):
+        """Serializza in JSON (bytes UTF-8) con orjson."""
+        return orjson.dumps(dati, default=_predefinito, option=orjson.OPT_NON_STR_KEYS)
+
+    decodifica_json = orjson.loads
+else:
+    codifica_json = codifica_json_stdlib
+    decodifica_json = json.loads
+
+
+def in_dizionari(righe, campi):
+    """Righe di una query (tuple nell'ordine delle colonne selezionate) come lista di dizionari."""
+    return [dict(zip(campi, riga)) for riga in righe]
+
+
+def json_in_streaming(righe, campi, dimensione_blocco=1000):
+    """
+    Generatore che produce un array JSON a blocchi di dimensione_blocco righe:
+    in memoria c'è sempre un solo blocco, qualunque sia la lunghezza della lista.
+    """
+    righe = iter(righe)
+    yield b'['
+    primo = True
+    while True:
+        blocco = list(itertools.islice(righe, dimensione_blocco))
+        if not blocco:
+            break
+        # Il blocco viene serializzato come array e poi privato delle parentesi
+        corpo = codifica_json(in_dizionari(blocco, campi))[1:-1]
+        yield corpo if primo else b',' + corpo
+        primo = False
+    yield b']'
+
+
+# Un campo che inizia con questi caratteri verrebbe eseguito come formula dai fogli di calcolo
+_INIZIO_FORMULA = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _cella_csv(valore):
+    if isinstance(valore, str) and valore.startswith(_INIZIO_FORMULA):
+        return "'" + valore
+    return valore
+
+
+def csv_in_streaming(righe, intestazione, dimensione_blocco=1000):
+    """
+    Generatore che produce un CSV (UTF-8, righe terminate da CRLF) a blocchi di
+    dimensione_blocco righe, come json_in_streaming. Le date diventano ISO 8601.
+    """
+    righe = iter(righe)
+    buffer = io.StringIO()
+    scrittore = csv.writer(buffer)
+    scrittore.writerow(intestazione)
+    while True:
+        blocco = list(itertools.islice(righe, dimensione_blocco))
+        if not blocco:
+            break
+        scrittore.writerows(
+            [_predefinito(valore) if isinstance(valore, (datetime.datetime, datetime.date)) else _cella_csv(valore)
+             for valore in riga]
+            for riga in blocco
+        )
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def _testo_ics(valore):
+    return (valore.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def _riga_ics(riga):
+    """Righe di contenuto piegate a 75 ottetti come chiede RFC 5545, senza spezzare i caratteri UTF-8."""
+    dati = riga.encode('utf-8')
+    if len(dati) <= 75:
+        return dati + b'\r\n'
+    parti, inizio, massimo = [], 0, 75
+    while inizio < len(dati):
+        fine = min(inizio + massimo, len(dati))
+        # Non si taglia a metà di un carattere multi-byte (byte di continuazione 10xxxxxx)
+        while fine < len(dati) and dati[fine] & 0xC0 == 0x80:
+            fine -= 1
+        parti.append(dati[inizio:fine])
+        inizio, massimo = fine, 74  # le righe di continuazione iniziano con uno spazio
+    return b'\r\n '.join(parti) + b'\r\n'
+
+
+def _data_ics(data):
+    return data.strftime('%Y%m%dT%H%M%S')
+
+
+def ics_in_streaming(eventi, nome_calendario, dimensione_blocco=1000):
+    """
+    Generatore che produce un calendario iCalendar (RFC 5545) a blocchi di dimensione_blocco
+    eventi. Ogni evento è un dizionario con uid, inizio, fine, titolo e facoltativi
+    descrizione e stato. Gli orari sono "floating" (senza fuso), come nel database.
+    """
+    timbro = datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    yield b''.join(_riga_ics(riga) for riga in (
+        'BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//SaluteFacile//Agenda//IT', 'CALSCALE:GREGORIAN',
+        f'X-WR-CALNAME:{_testo_ics(nome_calendario)}',
+    ))
+    eventi = iter(eventi)
+    while True:
+        blocco = list(itertools.islice(eventi, dimensione_blocco))
+        if not blocco:
+            break
+        righe = []
+        for evento in blocco:
+            righe += ['BEGIN:VEVENT', f"UID:{evento['uid']}", f'DTSTAMP:{timbro}',
+                      f"DTSTART:{_data_ics(evento['inizio'])}", f"DTEND:{_data_ics(evento['fine'])}",
+                      f"SUMMARY:{_testo_ics(evento['titolo'])}"]
+            if evento.get('descrizione'):
+                righe.append(f"DESCRIPTION:{_testo_ics(evento['descrizione'])}")
+            if evento.get('stato'):
+                righe.append(f"STATUS:{evento['stato']}")
+            righe.append('END:VEVENT')
+        yield b''.join(_riga_ics(riga) for riga in righe)
+    yield _riga_ics('END:VCALENDAR')
+
+
+class ProviderJSON(JSONProvider):
+    """Provider JSON di Flask basato su codifica_json: risponde con i bytes prodotti dall'encoder."""
+
+    mimetype = 'application/json'
+
+    def dumps(self, obj, **kwargs):
+        return codifica_json(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return decodifica_json(s)
+
+    def response(self, *args, **kwargs):
+        dati = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(codifica_json(dati), mimetype=self.mimetype)
+
+
+class Compressione:
+    """
+    Estensione Flask che comprime le risposte testuali sopra COMPRESSIONE_SOGLIA_BYTE,
+    negoziando brotli o gzip con il client. Le risposte con ETag forte (il catalogo)
+    vengono compresse una volta sola e riusate finché l'ETag non cambia; quelle in
+    streaming vengono compresse blocco per blocco.
+    """
+
+    def __init__(self, voci_memorizzate=64):
+        self._lock = threading.Lock()
+        self._memo = collections.OrderedDict()
+        self._voci_memorizzate = voci_memorizzate
+
+    def init_app(self, app):
+        self.soglia = app.config.get('COMPRESSIONE_SOGLIA_BYTE', 1024)
+        self.livello_gzip = app.config.get('COMPRESSIONE_LIVELLO_GZIP', 5)
+        self.qualita_brotli = app.config.get('COMPRESSIONE_QUALITA_BROTLI', 4)
+        self.codifiche = ['br', 'gzip'] if brotli is not None else ['gzip']
+        if app.config.get('COMPRESSIONE_ABILITATA', True):
+            app.after_request(self._comprimi)
+
+    def _comprimi(self, risposta):
+        if (
+            risposta.status_code != 200
+            or request.method == 'HEAD'
+            or risposta.mimetype not in TIPI_COMPRIMIBILI
+            or 'Content-Encoding' in risposta.headers
+        ):
+            return risposta
+        risposta.vary.add('Accept-Encoding')
+        codifica = request.accept_encodings.best_match(self.codifiche)
+        if codifica is None:
+            return risposta
+
+        if risposta.is_streamed:
+            risposta.response = self._comprimi_flusso(risposta.response, codifica)
+            risposta.headers.pop('Content-Length', None)
+        else:
+            corpo = risposta.get_data()
+            if len(corpo) < self.soglia:
+                return risposta
+            etag, debole = risposta.get_etag()
+            risposta.set_data(self._comprimi_memorizzato(corpo, codifica, etag if etag and not debole else None))
+            if etag and not debole:
+                # La rappresentazione compressa ha byte diversi: l'ETag forte diventa debole
+                risposta.set_etag(etag, weak=True)
+        risposta.headers['Content-Encoding'] = codifica
+        return risposta
+
+    def _comprimi_corpo(self, corpo, codifica):
+        if codifica == 'br':
+            return brotli.compress(corpo, quality=self.qualita_brotli)
+        return gzip.compress(corpo, compresslevel=self.livello_gzip, mtime=0)
+
+    def _comprimi_memorizzato(self, corpo, codifica, etag):
+        if etag is None:
+            return self._comprimi_corpo(corpo, codifica)
+        chiave = (etag, codifica)
+        with self._lock:
+            compresso = self._memo.get(chiave)
+            if compresso is not None:
+                self._memo.move_to_end(chiave)
+                return compresso
+        compresso = self._comprimi_corpo(corpo, codifica)
+        with self._lock:
+            self._memo[chiave] = compresso
+            while len(self._memo) > self._voci_memorizzate:
+                self._memo.popitem(last=False)
+        return compresso
+
+    def _comprimi_flusso(self, blocchi, codifica):
+        if codifica == 'br':
+            compressore = brotli.Compressor(quality=self.qualita_brotli)
+            comprimi, chiudi = compressore.process, compressore.finish
+        else:
+            # wbits=31: formato gzip con header
+            compressore = zlib.compressobj(self.livello_gzip, zlib.DEFLATED, 31)
+            comprimi, chiudi = compressore.compress, compressore.flush
+        try:
+            for blocco in blocchi:
+                if isinstance(blocco, str):
+                    blocco = blocco.encode('utf-8')
+                compresso = comprimi(blocco)
+                if compresso:
+                    yield compresso
+            yield chiudi()
+        finally:
+            if hasattr(blocchi, 'close'):
+                blocchi.close()
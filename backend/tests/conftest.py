@@ -0,0 +1,35 @@
+# backend/tests/conftest.py
+#
+# Fixture comuni dei test: un'app creata con create_app() su un database SQLite
+# temporaneo, con lo schema preparato e i limiti di frequenza spenti.
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as modulo_app  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path):
+    applicazione = modulo_app.create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'test.db'}",
+        'LIMITI_ABILITATI': False,
+        'BCRYPT_WORKERS': 0,
+        # Gli eventi degli slot si inoltrano chiamando inoltro_eventi.esegui() nei test
+        'SSE_INTERVALLO_EVENTI_S': 0,
+        'TESTING': True,
+    })
+    with applicazione.app_context():
+        modulo_app.prepara_schema()
+    yield applicazione
+    with applicazione.app_context():
+        modulo_app.db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,23 @@
+# backend/tests/test_cache_catalogo.py
+#
+# La cache del catalogo medici deve accorgersi delle modifiche fatte fuori dal
+# processo (qui: da un'altra connessione SQLite, senza eventi del mapper).
+
+import sqlite3
+
+import app as modulo_app
+
+
+def test_catalogo_vede_le_modifiche_di_un_altro_processo(app, client):
+    app.config['CATALOGO_CONTROLLO_VERSIONE_S'] = 0
+    assert client.get("/api/medici").get_json() == []
+    etag = client.get("/api/medici").headers['ETag']
+
+    with app.app_context():
+        percorso = modulo_app.db.engine.url.database
+    with sqlite3.connect(percorso) as connessione:
+        connessione.execute("INSERT INTO medici (nome_completo, specializzazione) VALUES ('Dott. Esterno', 'Ortopedia')")
+
+    risposta = client.get("/api/medici", headers={"If-None-Match": etag})
+    assert risposta.status_code == 200
+    assert [medico["nome_completo"] for medico in risposta.get_json()] == ["Dott. Esterno"]
@@ -0,0 +1,70 @@
+# backend/tests/test_cancellazione.py
+#
+# Cancellazione di un appuntamento da parte del paziente: archiviato una volta sola,
+# slot di nuovo libero, una seconda cancellazione non trova più nulla.
+
+import datetime
+
+from sqlalchemy import func, select
+
+import app as modulo_app
+
+
+def prenota_slot(app, client, inizio):
+    with app.app_context():
+        db = modulo_app.db
+        medico = modulo_app.Medico(nome_completo="Dott. Test", specializzazione="Cardiologia")
+        paziente = modulo_app.Utente(email="cancella@test.local", password_hash="non-usato",
+                                     nome="Paziente", cognome="Test")
+        db.session.add_all([medico, paziente])
+        db.session.flush()
+        slot = modulo_app.Disponibilita(medico_id=medico.id, data_inizio=inizio,
+                                        data_fine=inizio + datetime.timedelta(minutes=30))
+        db.session.add(slot)
+        db.session.commit()
+        token = modulo_app.create_access_token(identity=str(paziente.id))
+        slot_id = slot.id
+    headers = {"Authorization": f"Bearer {token}"}
+    risposta = client.post("/api/appuntamenti", json={"disponibilita_id": slot_id}, headers=headers)
+    assert risposta.status_code == 201
+    return slot_id, risposta.get_json()["appuntamento_id"], headers
+
+
+def test_cancellazione_archivia_e_libera_lo_slot_una_volta(app, client):
+    domani = datetime.datetime.now().replace(second=0, microsecond=0) + datetime.timedelta(days=1)
+    slot_id, appuntamento_id, headers = prenota_slot(app, client, domani)
+
+    assert client.delete(f"/api/appuntamenti/{appuntamento_id}", headers=headers).status_code == 200
+    assert client.delete(f"/api/appuntamenti/{appuntamento_id}", headers=headers).status_code == 404
+
+    with app.app_context():
+        db = modulo_app.db
+        archiviati = db.session.execute(
+            select(modulo_app.AppuntamentoArchiviato.stato, modulo_app.AppuntamentoArchiviato.data_inizio)
+            .where(modulo_app.AppuntamentoArchiviato.appuntamento_id == appuntamento_id)
+        ).all()
+        assert [(riga.stato, riga.data_inizio) for riga in archiviati] == [(modulo_app.STATO_CANCELLATO, domani)]
+        assert db.session.get(modulo_app.Disponibilita, slot_id).è_prenotato is False
+        assert db.session.execute(select(func.count()).select_from(modulo_app.Appuntamento)).scalar() == 0
+
+
+def test_appuntamento_iniziato_non_cancellabile(app, client):
+    ieri = datetime.datetime.now().replace(second=0, microsecond=0) - datetime.timedelta(days=1)
+    with app.app_context():
+        db = modulo_app.db
+        medico = modulo_app.Medico(nome_completo="Dott. Test", specializzazione="Cardiologia")
+        paziente = modulo_app.Utente(email="passato@test.local", password_hash="non-usato",
+                                     nome="Paziente", cognome="Test")
+        db.session.add_all([medico, paziente])
+        db.session.flush()
+        slot = modulo_app.Disponibilita(medico_id=medico.id, data_inizio=ieri,
+                                        data_fine=ieri + datetime.timedelta(minutes=30), è_prenotato=True)
+        db.session.add(slot)
+        db.session.flush()
+        appuntamento = modulo_app.Appuntamento(paziente_id=paziente.id, disponibilita_id=slot.id)
+        db.session.add(appuntamento)
+        db.session.commit()
+        token = modulo_app.create_access_token(identity=str(paziente.id))
+        appuntamento_id = appuntamento.id
+    risposta = client.delete(f"/api/appuntamenti/{appuntamento_id}", headers={"Authorization": f"Bearer {token}"})
+    assert risposta.status_code == 409
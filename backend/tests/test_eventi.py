@@ -0,0 +1,44 @@
+# backend/tests/test_eventi.py
+#
+# Stream SSE degli slot: oltre SSE_MAX_ISCRITTI il server rifiuta subito il client;
+# gli eventi passano dal registro eventi_slot condiviso tra i processi.
+
+import app as modulo_app
+
+
+def test_oltre_il_limite_di_iscritti_risponde_503(app, client):
+    modulo_app.bus_eventi.max_iscritti = 0
+    try:
+        risposta = client.get("/api/disponibilita/eventi?medico_ids=1")
+    finally:
+        modulo_app.bus_eventi.init_app(app)
+    assert risposta.status_code == 503
+    assert risposta.headers['Retry-After'] == str(app.config['SSE_HEARTBEAT_S'])
+
+
+
+def test_eventi_arrivano_dal_registro_condiviso(app):
+    iscrizione = modulo_app.bus_eventi.iscrivi([7])
+    try:
+        with app.app_context():
+            modulo_app.inoltro_eventi.prepara()
+            # Come un altro processo: l'evento passa solo dalla tabella eventi_slot
+            modulo_app.registra_evento_slot(7, modulo_app.SLOT_PRENOTATO, {"medico_id": 7, "slot_id": 1})
+            modulo_app.db.session.commit()
+            modulo_app.registra_evento_slot(7, modulo_app.SLOT_PRENOTATO, {"medico_id": 7, "slot_id": 2})
+            modulo_app.db.session.rollback()
+            assert iscrizione.attendi(0) == []
+            modulo_app.inoltro_eventi.esegui()
+            modulo_app.inoltro_eventi.esegui()
+    finally:
+        modulo_app.bus_eventi.annulla(iscrizione)
+    assert iscrizione.attendi(0) == ['event: prenotato\ndata: {"medico_id":7,"slot_id":1}\n\n']
+
+
+def test_eventi_vecchi_vengono_eliminati(app):
+    with app.app_context():
+        modulo_app.registra_evento_slot(7, modulo_app.SLOT_PRENOTATO, {"medico_id": 7, "slot_id": 1})
+        modulo_app.db.session.commit()
+        modulo_app.inoltro_eventi.conservazione = 0
+        modulo_app.inoltro_eventi.esegui()
+        assert modulo_app.db.session.query(modulo_app.EventoSlot).count() == 0
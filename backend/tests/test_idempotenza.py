@@ -0,0 +1,33 @@
+# backend/tests/test_idempotenza.py
+#
+# Chiavi di idempotenza: una chiave rilasciata dalla richiesta che la possedeva tra
+# l'INSERT fallito e la rilettura va riacquisita, non considerata acquisita senza riga.
+
+from sqlalchemy import event, select
+
+import app as modulo_app
+
+
+def test_chiave_rilasciata_durante_acquisizione_viene_reinserita(app):
+    registro = modulo_app.registro_idempotenza
+    with app.app_context():
+        engine = modulo_app.db.engine
+        assert registro.acquisisci("test:1", "chiave", "impronta") is None
+        rilasciata = []
+
+        def rilascia_prima_della_rilettura(conn, cursor, statement, *_):
+            if not rilasciata and statement.lstrip().startswith("SELECT") and "chiavi_idempotenza" in statement:
+                rilasciata.append(True)
+                registro.rilascia("test:1", "chiave")
+
+        event.listen(engine, "before_cursor_execute", rilascia_prima_della_rilettura)
+        try:
+            assert registro.acquisisci("test:1", "chiave", "impronta") is None
+        finally:
+            event.remove(engine, "before_cursor_execute", rilascia_prima_della_rilettura)
+
+        assert rilasciata
+        righe = modulo_app.db.session.execute(
+            select(modulo_app.ChiaveIdempotenza.codice_stato).where(modulo_app.ChiaveIdempotenza.chiave == "chiave")
+        ).all()
+        assert [riga.codice_stato for riga in righe] == [None]
@@ -0,0 +1,60 @@
+# backend/tests/test_query_appuntamenti.py
+#
+# GET /api/appuntamenti deve leggere lo storico di un paziente con una sola SELECT,
+# qualunque sia il numero dei suoi appuntamenti.
+
+import datetime
+
+import pytest
+from sqlalchemy import event, insert
+
+import app as modulo_app
+
+
+def crea_paziente_con_appuntamenti(num_appuntamenti):
+    """ Un paziente con num_appuntamenti visite, metà passate e metà future, su medici diversi """
+    db = modulo_app.db
+    utente = modulo_app.Utente(email=f"storico{num_appuntamenti}@test.local", password_hash="non-usato",
+                               nome="Paziente", cognome=str(num_appuntamenti))
+    medici = [modulo_app.Medico(nome_completo=f"Dott. Test {i}", specializzazione="Cardiologia") for i in range(5)]
+    db.session.add(utente)
+    db.session.add_all(medici)
+    db.session.flush()
+    base = datetime.datetime.now().replace(second=0, microsecond=0) - datetime.timedelta(days=num_appuntamenti // 2)
+    slot_ids = [
+        db.session.execute(insert(modulo_app.Disponibilita).values(
+            medico_id=medici[i % len(medici)].id,
+            data_inizio=base + datetime.timedelta(days=i),
+            data_fine=base + datetime.timedelta(days=i, minutes=30),
+            è_prenotato=True,
+        )).inserted_primary_key[0]
+        for i in range(num_appuntamenti)
+    ]
+    db.session.execute(insert(modulo_app.Appuntamento), [
+        {"paziente_id": utente.id, "disponibilita_id": slot_id} for slot_id in slot_ids
+    ])
+    db.session.commit()
+    return modulo_app.create_access_token(identity=str(utente.id))
+
+
+@pytest.mark.parametrize("num_appuntamenti", [1, 10, 100])
+def test_storico_appuntamenti_con_una_select(app, client, num_appuntamenti):
+    with app.app_context():
+        token = crea_paziente_con_appuntamenti(num_appuntamenti)
+        engine = modulo_app.db.engine
+
+    select_eseguite = []
+
+    def conta_select(conn, cursor, statement, *_):
+        if statement.lstrip().upper().startswith("SELECT"):
+            select_eseguite.append(statement)
+
+    event.listen(engine, "before_cursor_execute", conta_select)
+    try:
+        risposta = client.get("/api/appuntamenti?limit=500", headers={"Authorization": f"Bearer {token}"})
+    finally:
+        event.remove(engine, "before_cursor_execute", conta_select)
+
+    assert risposta.status_code == 200
+    assert len(risposta.get_json()) == num_appuntamenti
+    assert len(select_eseguite) == 1, select_eseguite
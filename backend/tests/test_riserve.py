@@ -0,0 +1,83 @@
+# backend/tests/test_riserve.py
+#
+# Riserve temporanee degli slot: un utente tiene al più una riserva attiva.
+
+import datetime
+import json
+
+from sqlalchemy import insert, select
+
+import app as modulo_app
+
+
+def crea_slot(num_slot):
+    """ Un medico con num_slot slot liberi da domani e un paziente; restituisce gli id degli slot e il JWT """
+    db = modulo_app.db
+    medico = modulo_app.Medico(nome_completo="Dott. Test", specializzazione="Cardiologia")
+    paziente = modulo_app.Utente(email="riserva@test.local", password_hash="non-usato", nome="Paziente", cognome="Test")
+    db.session.add_all([medico, paziente])
+    db.session.flush()
+    inizio = datetime.datetime.now().replace(second=0, microsecond=0) + datetime.timedelta(days=1)
+    db.session.execute(insert(modulo_app.Disponibilita), [
+        {"medico_id": medico.id, "data_inizio": inizio + datetime.timedelta(minutes=30 * i),
+         "data_fine": inizio + datetime.timedelta(minutes=30 * (i + 1)), "è_prenotato": False}
+        for i in range(num_slot)
+    ])
+    db.session.commit()
+    slot_ids = db.session.scalars(select(modulo_app.Disponibilita.id).order_by(modulo_app.Disponibilita.id)).all()
+    return slot_ids, modulo_app.create_access_token(identity=str(paziente.id))
+
+
+def test_nuova_riserva_rilascia_la_precedente(app, client):
+    with app.app_context():
+        slot_ids, token = crea_slot(3)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    assert client.post(f"/api/disponibilita/{slot_ids[0]}/riserva", headers=headers).status_code == 201
+    assert client.post(f"/api/disponibilita/{slot_ids[1]}/riserva", headers=headers).status_code == 201
+
+    with app.app_context():
+        riservati = modulo_app.db.session.scalars(
+            select(modulo_app.Disponibilita.id).where(modulo_app.Disponibilita.riservato_da.is_not(None))
+        ).all()
+    assert riservati == [slot_ids[1]]
+    liberi = [slot["id"] for slot in client.get("/api/medici/1/disponibilita").get_json()]
+    assert liberi == [slot_ids[0], slot_ids[2]]
+
+
+def test_riserve_non_consumano_il_limite_delle_prenotazioni(app, client):
+    with app.app_context():
+        slot_ids, token = crea_slot(3)
+    headers = {"Authorization": f"Bearer {token}"}
+    app.config.update(LIMITI_ABILITATI=True, LIMITE_PRENOTAZIONE_IP='1/60', LIMITE_PRENOTAZIONE_UTENTE='1/60')
+    modulo_app.limitatore.init_app(app)
+
+    for slot_id in slot_ids:
+        assert client.post(f"/api/disponibilita/{slot_id}/riserva", headers=headers).status_code == 201
+    risposta = client.post("/api/appuntamenti", headers=headers, json={"disponibilita_id": slot_ids[-1]})
+    assert risposta.status_code == 201
+
+
+def test_slot_liberato_porta_le_date_come_la_lista(app, client):
+    with app.app_context():
+        slot_ids, token = crea_slot(1)
+    headers = {"Authorization": f"Bearer {token}"}
+    slot = client.get("/api/medici/1/disponibilita").get_json()[0]
+    assert client.post(f"/api/disponibilita/{slot_ids[0]}/riserva", headers=headers).status_code == 201
+
+    iscrizione = modulo_app.bus_eventi.iscrivi([1])
+    try:
+        with app.app_context():
+            modulo_app.inoltro_eventi.prepara()
+        assert client.delete(f"/api/disponibilita/{slot_ids[0]}/riserva", headers=headers).status_code == 200
+        with app.app_context():
+            modulo_app.inoltro_eventi.esegui()
+        eventi = iscrizione.attendi(0)
+    finally:
+        modulo_app.bus_eventi.annulla(iscrizione)
+    assert len(eventi) == 1
+    tipo, dati = eventi[0].split("\n")[:2]
+    assert tipo == "event: liberato"
+    assert json.loads(dati.removeprefix("data: ")) == {
+        "medico_id": 1, "slot_id": slot["id"], "data_inizio": slot["data_inizio"], "data_fine": slot["data_fine"]
+    }
@@ -0,0 +1,46 @@
+# backend/tests/test_staff_medico.py
+#
+# Le route di gestione di un medico (orari, generazione slot, cancellazioni, agenda)
+# sono riservate agli admin e all'account collegato a quel medico.
+
+import pytest
+
+import app as modulo_app
+
+
+@pytest.fixture
+def tokens(app):
+    """ Due medici, il primo collegato a un account 'medico'; JWT del medico, di un admin e di un paziente """
+    db = modulo_app.db
+    with app.app_context():
+        utenti = {
+            ruolo: modulo_app.Utente(email=f"{ruolo}@test.local", password_hash="non-usato",
+                                     nome=ruolo, cognome="Test", ruolo=ruolo)
+            for ruolo in ("medico", "admin", "paziente")
+        }
+        db.session.add_all(utenti.values())
+        db.session.flush()
+        db.session.add_all([
+            modulo_app.Medico(nome_completo="Dott. Collegato", specializzazione="Cardiologia",
+                              utente_id=utenti["medico"].id),
+            modulo_app.Medico(nome_completo="Dott. Altro", specializzazione="Cardiologia"),
+        ])
+        db.session.commit()
+        return {ruolo: modulo_app.create_access_token(identity=str(utente.id)) for ruolo, utente in utenti.items()}
+
+
+@pytest.mark.parametrize("ruolo, medico_id, atteso", [
+    ("medico", 1, 200),
+    ("medico", 2, 403),
+    ("admin", 2, 200),
+    ("paziente", 1, 403),
+])
+def test_agenda_solo_del_proprio_medico(client, tokens, ruolo, medico_id, atteso):
+    risposta = client.get(f"/api/medici/{medico_id}/agenda", headers={"Authorization": f"Bearer {tokens[ruolo]}"})
+    assert risposta.status_code == atteso
+
+
+def test_genera_slot_di_un_altro_medico_rifiutato(client, tokens):
+    risposta = client.post("/api/medici/2/disponibilita/genera", json={},
+                           headers={"Authorization": f"Bearer {tokens['medico']}"})
+    assert risposta.status_code == 403
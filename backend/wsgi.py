@@ -0,0 +1,31 @@
+# backend/wsgi.py
+#
+# Entry point per i server WSGI multi-processo, ad esempio:
+#   gunicorn --preload --workers 4 --threads 4 --bind 0.0.0.0:5000 wsgi:app
+# Con --preload l'app viene creata una sola volta nel processo master e i worker
+# la ereditano con il fork (avvio più rapido e pagine di memoria condivise);
+# ogni worker apre comunque connessioni al database e thread propri
+# (vedi reinizializza_dopo_fork in app.py).
+#
+# Lo schema e i dati di esempio non vengono toccati all'avvio; si preparano prima:
+#   flask --app app crea-schema
+#   flask --app app seed
+# Gli account dei medici si collegano al proprio profilo (orari, slot e agenda) con:
+#   flask --app app collega-medico <email> <medico_id>
+# /api/salute (liveness) e /api/pronto (readiness) servono ai controlli di salute.
+#
+# Stream SSE (/api/disponibilita/eventi): vanno serviti da processi con worker gevent,
+# in cui un client in ascolto occupa un greenlet invece di un thread:
+#   gunicorn -k gevent --workers 2 --worker-connections 2000 --bind 0.0.0.0:5001 wsgi:app
+# (senza --preload: gevent deve sostituire threading prima che l'app venga importata).
+# Il proxy davanti all'app manda /api/disponibilita/eventi a questi processi e tutto il
+# resto ai worker a thread, dove bcrypt e le scritture non bloccano il loop di gevent.
+# SSE_MAX_ISCRITTI (per processo, predefinito 1000) resta sotto --worker-connections;
+# oltre il limite il client riceve 503 con Retry-After. Gli eventi sugli slot vengono
+# scritti nella tabella eventi_slot insieme alla modifica e in ogni processo un solo thread
+# li inoltra ai propri iscritti (InoltroEventi in app.py), quindi gli stream ricevono
+# anche le prenotazioni servite dagli altri processi.
+
+from app import create_app
+
+app = create_app()
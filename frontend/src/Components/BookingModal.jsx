@@ -1,10 +1,11 @@
 // frontend/src/Components/BookingModal.jsx
 
 import React, { useState, useMemo } from 'react';
-import { prenotaAppuntamento } from '../apiService';
+import { prenotaAppuntamento, riservaSlot, annullaRiserva } from '../apiService';
 import { useNavigate } from 'react-router-dom';
 
-function BookingModal({ medico, disponibilita, onClose }) {
+function BookingModal({ medico, disponibilita: disponibilitaIniziale, onClose }) {
+  const [disponibilita, setDisponibilita] = useState(disponibilitaIniziale);
   const [selectedSlot, setSelectedSlot] = useState(null);
   const [error, setError] = useState(null);
   const [success, setSuccess] = useState(null);
@@ -28,6 +29,31 @@ function BookingModal({ medico, disponibilita, onClose }) {
     }, {});
   }, [disponibilita]);
 
+  // Selezionare uno slot lo riserva per qualche minuto: se è già stato preso lo si scopre subito
+  const handleSeleziona = async (slotId) => {
+    if (slotId === selectedSlot) return;
+    const precedente = selectedSlot;
+    setSelectedSlot(slotId);
+    setError(null);
+    if (precedente) annullaRiserva(precedente).catch(() => {});
+    try {
+      await riservaSlot(slotId);
+    } catch (err) {
+      // Solo un 409 dice che lo slot è di qualcun altro; con altri errori (es. 401, 429) resta in lista
+      if (err.status === 409) {
+        setDisponibilita(slots => slots.filter(slot => slot.id !== slotId));
+        setSelectedSlot(selezionato => (selezionato === slotId ? null : selezionato));
+      }
+      setError(err.message);
+    }
+  };
+
+  // Chiudendo senza prenotare la riserva viene rilasciata subito invece di attendere la scadenza
+  const handleClose = () => {
+    if (selectedSlot && !success) annullaRiserva(selectedSlot).catch(() => {});
+    onClose();
+  };
+
   const handlePrenota = async () => {
     if (!selectedSlot) {
       setError("Per favore, seleziona uno slot orario.");
@@ -58,7 +84,7 @@ function BookingModal({ medico, disponibilita, onClose }) {
               <h5 className="modal-title">Prenota con {medico.nome_completo}</h5>
               <h6 className="text-muted fw-normal">{medico.specializzazione}</h6>
             </div>
-            <button type="button" className="btn-close" onClick={onClose}></button>
+            <button type="button" className="btn-close" onClick={handleClose}></button>
           </div>
           <div className="modal-body">
             {error && <div className="alert alert-danger">{error}</div>}
@@ -75,7 +101,7 @@ function BookingModal({ medico, disponibilita, onClose }) {
                           key={slot.id}
                           type="button"
                           className={`btn ${selectedSlot === slot.id ? 'btn-primary' : 'btn-outline-primary'}`}
-                          onClick={() => setSelectedSlot(slot.id)}
+                          onClick={() => handleSeleziona(slot.id)}
                         >
                           {new Date(slot.data_inizio).toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' })}
                         </button>
@@ -89,7 +115,7 @@ function BookingModal({ medico, disponibilita, onClose }) {
             )}
           </div>
           <div className="modal-footer">
-            <button type="button" className="btn btn-secondary" onClick={onClose}>Annulla</button>
+            <button type="button" className="btn btn-secondary" onClick={handleClose}>Annulla</button>
             <button type="button" className="btn btn-primary" onClick={handlePrenota} disabled={success || isBooking || !selectedSlot}>
               {isBooking ? (
                 <>
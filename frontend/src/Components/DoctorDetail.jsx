@@ -1,34 +1,56 @@
 // frontend/src/Components/DoctorDetail.jsx
 
-import React, { useState, useEffect, useMemo } from 'react';
+import React, { useState, useEffect, useMemo, useRef } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import 'bootstrap-icons/font/bootstrap-icons.css'; // Importa le icone di Bootstrap
-import { getMedicoDetail, getDisponibilita, prenotaAppuntamento } from '../apiService';
+import {
+  getMedicoDetail, getDisponibilita, fineFinestra, prenotaAppuntamento, apriEventiDisponibilita, riservaSlot, annullaRiserva
+} from '../apiService';
+import { useAuth } from '../AuthContext';
 
 function DoctorDetail() {
   const { id } = useParams(); // Legge l'ID del medico dall'URL
   const navigate = useNavigate();
+  const { user } = useAuth();
 
   const [medico, setMedico] = useState(null);
   const [disponibilita, setDisponibilita] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
+  // Fine della finestra di slot caricata: le settimane successive arrivano con "Mostra altri orari"
+  const [fine, setFine] = useState(null);
+  const fineRef = useRef(null);
+  useEffect(() => { fineRef.current = fine; }, [fine]);
+  const [caricandoAltri, setCaricandoAltri] = useState(false);
 
   // State per la prenotazione
   const [selectedSlot, setSelectedSlot] = useState(null);
   const [isBooking, setIsBooking] = useState(false);
   const [bookingStatus, setBookingStatus] = useState({ error: null, success: null });
+  // Slot selezionato letto dai gestori degli eventi senza riaprire lo stream
+  const selectedSlotRef = useRef(null);
+  useEffect(() => { selectedSlotRef.current = selectedSlot; }, [selectedSlot]);
+  // Slot su cui l'utente tiene una riserva non ancora trasformata in prenotazione
+  const riservaRef = useRef(null);
+
+  // Uscendo dalla pagina la riserva viene rilasciata subito invece di bloccare lo slot fino alla scadenza
+  useEffect(() => () => {
+    if (riservaRef.current) annullaRiserva(riservaRef.current).catch(() => {});
+  }, [id]);
 
   useEffect(() => {
     const fetchData = async () => {
       try {
-        // Carica in parallelo i dettagli del medico e le sue disponibilità
+        // Carica in parallelo i dettagli del medico e le sue disponibilità delle prossime settimane
+        const inizio = new Date();
+        const fineIniziale = fineFinestra(inizio);
         const [medicoData, disponibilitaData] = await Promise.all([
           getMedicoDetail(id),
-          getDisponibilita(id)
+          getDisponibilita(id, { from: inizio, to: fineIniziale })
         ]);
         setMedico(medicoData);
         setDisponibilita(disponibilitaData);
+        setFine(fineIniziale);
       } catch (err) {
         setError(err.message);
       } finally {
@@ -38,6 +60,41 @@ function DoctorDetail() {
     fetchData();
   }, [id]);
 
+  // Aggiornamenti in tempo reale: toglie gli slot prenotati o riservati da altri,
+  // reinserisce quelli liberati e ricarica quando ne vengono aggiunti
+  useEffect(() => {
+    // Ricarica solo la finestra già mostrata, non tutti gli slot futuri
+    const ricarica = () => getDisponibilita(id, { to: fineRef.current }).then(setDisponibilita).catch(() => {});
+    // L'evento porta lo slot completo: inserito in ordine di data senza interrogare il server
+    const inserisci = ({ slot_id, data_inizio, data_fine }) => {
+      const inizio = new Date(data_inizio);
+      // Gli slot oltre la finestra caricata arriveranno con le settimane successive
+      if (!fineRef.current || inizio >= fineRef.current) return;
+      setDisponibilita(slots => {
+        if (slots.some(slot => slot.id === slot_id)) return slots;
+        const posizione = slots.findIndex(slot => new Date(slot.data_inizio) > inizio);
+        const nuovo = { id: slot_id, data_inizio, data_fine };
+        return posizione === -1 ? [...slots, nuovo] : [...slots.slice(0, posizione), nuovo, ...slots.slice(posizione)];
+      });
+    };
+    const sorgente = apriEventiDisponibilita([id], {
+      prenotato: ({ slot_id }) => {
+        setDisponibilita(slots => slots.filter(slot => slot.id !== slot_id));
+        setSelectedSlot(selezionato => (selezionato === slot_id ? null : selezionato));
+      },
+      // La riserva sullo slot selezionato è la nostra: resta visibile
+      riservato: ({ slot_id }) => {
+        if (selectedSlotRef.current !== slot_id) {
+          setDisponibilita(slots => slots.filter(slot => slot.id !== slot_id));
+        }
+      },
+      liberato: inserisci,
+      aggiunti: ricarica,
+      riallinea: ricarica,
+    });
+    return () => sorgente.close();
+  }, [id]);
+
   // Raggruppa gli slot per giorno
   const slotsByDay = useMemo(() => {
     return disponibilita.reduce((acc, slot) => {
@@ -48,6 +105,43 @@ function DoctorDetail() {
     }, {});
   }, [disponibilita]);
 
+  // Selezionare uno slot lo riserva per qualche minuto: se è già stato preso lo si scopre subito.
+  // Senza login non si riserva nulla: lo slot viene solo selezionato.
+  const handleSeleziona = async (slotId) => {
+    if (slotId === selectedSlot) return;
+    setSelectedSlot(slotId);
+    setBookingStatus({ error: null, success: null });
+    if (!user) return;
+    // Il backend rilascia da solo la riserva precedente dello stesso utente
+    riservaRef.current = null;
+    try {
+      await riservaSlot(slotId);
+      riservaRef.current = slotId;
+    } catch (err) {
+      // Solo un 409 dice che lo slot è di qualcun altro; con altri errori (es. 429) resta in lista
+      if (err.status === 409) {
+        setDisponibilita(slots => slots.filter(slot => slot.id !== slotId));
+        setSelectedSlot(selezionato => (selezionato === slotId ? null : selezionato));
+      }
+      setBookingStatus({ error: err.message, success: null });
+    }
+  };
+
+  // Carica la finestra successiva a quella già mostrata
+  const handleMostraAltri = async () => {
+    setCaricandoAltri(true);
+    try {
+      const fineSuccessiva = fineFinestra(fine);
+      const altri = await getDisponibilita(id, { from: fine, to: fineSuccessiva });
+      setDisponibilita(slots => [...slots, ...altri.filter(slot => !slots.some(s => s.id === slot.id))]);
+      setFine(fineSuccessiva);
+    } catch (err) {
+      setBookingStatus({ error: err.message, success: null });
+    } finally {
+      setCaricandoAltri(false);
+    }
+  };
+
   const handlePrenota = async () => {
     if (!selectedSlot) {
       setBookingStatus({ error: "Per favore, seleziona uno slot orario.", success: null });
@@ -57,6 +151,7 @@ function DoctorDetail() {
     setIsBooking(true);
     try {
       await prenotaAppuntamento({ disponibilita_id: selectedSlot });
+      riservaRef.current = null;
       setBookingStatus({ error: null, success: "Appuntamento prenotato con successo! Sarai reindirizzato..." });
       setTimeout(() => navigate('/i-miei-appuntamenti'), 2000);
     } catch (err) {
@@ -125,7 +220,7 @@ function DoctorDetail() {
                         key={slot.id}
                         type="button"
                         className={`btn ${selectedSlot === slot.id ? 'btn-primary' : 'btn-outline-primary'}`}
-                        onClick={() => setSelectedSlot(slot.id)}
+                        onClick={() => handleSeleziona(slot.id)}
                       >
                         {new Date(slot.data_inizio).toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' })}
                       </button>
@@ -134,10 +229,16 @@ function DoctorDetail() {
                 </div>
               ))
             ) : (
-              <p className="text-muted">Nessuna disponibilità trovata per questo medico al momento.</p>
+              <p className="text-muted">Nessuna disponibilità trovata per questo medico fino al {fine.toLocaleDateString('it-IT')}.</p>
             )
           )}
 
+          {!bookingStatus.success && (
+            <button className="btn btn-link d-block px-0" onClick={handleMostraAltri} disabled={caricandoAltri}>
+              {caricandoAltri ? 'Caricamento...' : `Mostra altri orari dopo il ${fine.toLocaleDateString('it-IT')}`}
+            </button>
+          )}
+
           {disponibilita.length > 0 && !bookingStatus.success && (
             <button className="btn btn-primary btn-lg mt-3" onClick={handlePrenota} disabled={isBooking || !selectedSlot}>
               {isBooking ? 'Prenotazione in corso...' : 'Conferma Prenotazione'}
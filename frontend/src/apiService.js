@@ -14,8 +14,11 @@ const handleResponse = async (response) => {
 
   // Se la risposta HTTP non ha avuto successo (es. status 401, 404, 500),
   // lancia un errore utilizzando il messaggio fornito dal backend.
+  // Lo status resta nell'errore, così chi chiama può distinguere ad esempio 409 da 429.
   if (!response.ok) {
-    throw new Error(data.errore || "Si è verificato un errore sconosciuto");
+    const errore = new Error(data.errore || "Si è verificato un errore sconosciuto");
+    errore.status = response.status;
+    throw errore;
   }
 
   // Altrimenti, restituisce i dati.
@@ -85,17 +88,117 @@ export const getMedicoDetail = (medicoId) => {
   }).then(handleResponse);
 };
 
+// Slot per pagina chiesti a /medici/<id>/disponibilita (il massimo accettato dal backend).
+const SLOT_PER_PAGINA = 500;
+// Ampiezza della finestra di slot caricata per volta: le settimane successive si chiedono su richiesta.
+export const GIORNI_PER_FINESTRA = 28;
+
+/**
+ * Fine della finestra di slot che comincia in inizio.
+ * @param {Date} inizio L'inizio della finestra.
+ * @returns {Date} inizio più GIORNI_PER_FINESTRA giorni.
+ */
+export const fineFinestra = (inizio) => {
+  const fine = new Date(inizio);
+  fine.setDate(fine.getDate() + GIORNI_PER_FINESTRA);
+  return fine;
+};
+
 /**
- * Recupera gli slot di disponibilità per un medico specifico.
+ * Recupera gli slot di disponibilità per un medico specifico in una finestra limitata.
+ * Il backend restituisce gli slot a pagine: segue il cursore dell'header X-Next-Cursor
+ * finché ci sono pagine, così nessuno slot della finestra viene perso. La finestra è
+ * sempre chiusa: senza to finisce GIORNI_PER_FINESTRA giorni dopo from (o dopo adesso).
  * @param {number} medicoId L'ID del medico.
+ * @param {object} [opzioni] from/to (Date o ISO 8601) della finestra.
  * @returns {Promise<Array<object>>} Un array di slot di disponibilità.
  */
-export const getDisponibilita = (medicoId) => {
-  return fetch(`${API_URL}/medici/${medicoId}/disponibilita`, {
+export const getDisponibilita = async (medicoId, opzioni = {}) => {
+  const inizio = opzioni.from ? new Date(opzioni.from) : new Date();
+  const fine = opzioni.to ? new Date(opzioni.to) : fineFinestra(inizio);
+  const slot = [];
+  let cursore = null;
+  do {
+    const parametri = new URLSearchParams({
+      limit: SLOT_PER_PAGINA, from: inizio.toISOString(), to: fine.toISOString()
+    });
+    if (cursore) parametri.append("after", cursore);
+    const response = await fetch(`${API_URL}/medici/${medicoId}/disponibilita?${parametri}`, {
+      method: "GET"
+    });
+    slot.push(...(await handleResponse(response)));
+    cursore = response.headers.get("X-Next-Cursor");
+  } while (cursore);
+  return slot;
+};
+
+/**
+ * Recupera con una sola richiesta gli slot liberi di più medici, raggruppati per medico.
+ * @param {Array<number>} medicoIds Gli ID dei medici (al massimo 100).
+ * @param {object} [opzioni] from/to (ISO 8601), limit (slot per medico) e aggregazione ("giorno" per i soli conteggi giornalieri).
+ * @returns {Promise<object>} Un oggetto con chiave l'ID del medico.
+ */
+export const getDisponibilitaMedici = (medicoIds, opzioni = {}) => {
+  const parametri = new URLSearchParams({ medico_ids: medicoIds.join(",") });
+  Object.entries(opzioni).forEach(([chiave, valore]) => {
+    if (valore !== undefined && valore !== null) parametri.append(chiave, valore);
+  });
+  return fetch(`${API_URL}/disponibilita?${parametri}`, {
     method: "GET"
   }).then(handleResponse);
 };
 
+/**
+ * Recupera l'occupazione giornaliera degli slot di uno o più medici, per le viste a calendario.
+ * @param {Array<number>} medicoIds Gli ID dei medici (al massimo 100).
+ * @param {object} [opzioni] from/to come date ISO 8601 (AAAA-MM-GG).
+ * @returns {Promise<object>} minuti_per_posizione e, per ogni medico e giorno, liberi, occupati,
+ * prima_posizione e posizioni ('L' libero, 'O' occupato, '.' nessuno slot).
+ */
+export const getCalendarioMedici = (medicoIds, opzioni = {}) => {
+  const parametri = new URLSearchParams({ medico_ids: medicoIds.join(",") });
+  Object.entries(opzioni).forEach(([chiave, valore]) => {
+    if (valore !== undefined && valore !== null) parametri.append(chiave, valore);
+  });
+  return fetch(`${API_URL}/calendario?${parametri}`, {
+    method: "GET"
+  }).then(handleResponse);
+};
+
+// Attesa prima di riaprire uno stream rifiutato dal server (es. 503 per troppi client in ascolto).
+const ATTESA_RICONNESSIONE_MS = 15000;
+
+/**
+ * Apre lo stream degli eventi sugli slot dei medici indicati (Server-Sent Events).
+ * Se il server rifiuta lo stream (ad esempio 503 quando ha già troppi client in ascolto)
+ * EventSource non riprova da solo: lo stream viene riaperto dopo ATTESA_RICONNESSIONE_MS.
+ * @param {Array<number>} medicoIds Gli ID dei medici da seguire.
+ * @param {object} gestori Una funzione per tipo di evento (prenotato, riservato, liberato, aggiunti, riallinea) che riceve i dati dell'evento.
+ * @returns {{close: Function}} La connessione, da chiudere con close() quando non serve più.
+ */
+export const apriEventiDisponibilita = (medicoIds, gestori) => {
+  let sorgente = null;
+  let timer = null;
+  const apri = () => {
+    sorgente = new EventSource(`${API_URL}/disponibilita/eventi?medico_ids=${medicoIds.join(",")}`);
+    Object.entries(gestori).forEach(([tipo, gestore]) => {
+      sorgente.addEventListener(tipo, (evento) => gestore(JSON.parse(evento.data)));
+    });
+    sorgente.onerror = () => {
+      if (sorgente.readyState === EventSource.CLOSED) {
+        timer = setTimeout(apri, ATTESA_RICONNESSIONE_MS);
+      }
+    };
+  };
+  apri();
+  return {
+    close: () => {
+      clearTimeout(timer);
+      sorgente.close();
+    },
+  };
+};
+
 /**
  * Recupera la lista degli appuntamenti per l'utente loggato.
  * @returns {Promise<Array<object>>} Un array di appuntamenti.
@@ -120,6 +223,33 @@ export const prenotaAppuntamento = (data) => {
   }).then(handleResponse);
 };
 
+/**
+ * Riserva per qualche minuto uno slot all'utente loggato, mentre completa la prenotazione.
+ * Se un altro utente lo ha già riservato o prenotato la promessa viene rifiutata subito.
+ * @param {number} disponibilitaId L'ID dello slot da riservare.
+ * @returns {Promise<object>} La conferma, con la scadenza della riserva in scade_il.
+ */
+export const riservaSlot = (disponibilitaId) => {
+  return fetch(`${API_URL}/disponibilita/${disponibilitaId}/riserva`, {
+    method: "POST",
+    headers: getAuthHeader(),
+  }).then(handleResponse);
+};
+
+/**
+ * Rilascia la riserva dell'utente loggato su uno slot.
+ * keepalive fa arrivare la richiesta anche se la pagina viene chiusa subito dopo.
+ * @param {number} disponibilitaId L'ID dello slot riservato.
+ * @returns {Promise<object>} La conferma dell'annullamento.
+ */
+export const annullaRiserva = (disponibilitaId) => {
+  return fetch(`${API_URL}/disponibilita/${disponibilitaId}/riserva`, {
+    method: "DELETE",
+    headers: getAuthHeader(),
+    keepalive: true,
+  }).then(handleResponse);
+};
+
 /**
  * Invia una richiesta per cancellare un appuntamento.
  * @param {number} appuntamentoId L'ID dell'appuntamento da cancellare.